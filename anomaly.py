@@ -0,0 +1,205 @@
+"""
+Supplier degradation alerts from streaming EWMA statistics over the daily rollup
+
+For every supplier the state holds exponentially weighted invoice, on-time and
+rejected counts at two speeds: a fast average (half-life 7 days) for recent
+behaviour and a slow one (half-life 90 days) as the supplier's own baseline.
+Weights decay with calendar days, so the state is linear in the daily rollup:
+new days are folded in by decaying the state and adding their weighted counts,
+and a correction to a day already folded in is added as an exact delta. Writers
+keep the supplier_anomaly_state table in step inside their own transaction, as
+they do the rollup, and an alert check reads one row per supplier.
+
+Run with: python anomaly.py [--db data/suppliers.db] [--rebuild]
+"""
+import argparse
+import numpy as np
+import pandas as pd
+from instrumentation import traced
+from schema import connect, insert_rows
+
+FAST_HALF_LIFE_DAYS = 7
+SLOW_HALF_LIFE_DAYS = 90
+
+# A rate is flagged when its recent value is this many standard errors worse than
+# the baseline, over at least this many effective recent invoices
+Z_THRESHOLD = 3.0
+MIN_RECENT_INVOICES = 10
+
+# State column -> (rollup column, half-life, power of the weight)
+_WEIGHTED_SUMS = {
+    'fast_invoices': ('invoice_count', FAST_HALF_LIFE_DAYS, 1),
+    'fast_on_time': ('on_time_count', FAST_HALF_LIFE_DAYS, 1),
+    'fast_rejected': ('rejected_count', FAST_HALF_LIFE_DAYS, 1),
+    'fast_weight_sq': ('invoice_count', FAST_HALF_LIFE_DAYS, 2),
+    'slow_invoices': ('invoice_count', SLOW_HALF_LIFE_DAYS, 1),
+    'slow_on_time': ('on_time_count', SLOW_HALF_LIFE_DAYS, 1),
+    'slow_rejected': ('rejected_count', SLOW_HALF_LIFE_DAYS, 1)
+}
+ANOMALY_STATE_COLUMNS = ['supplier_id', 'as_of'] + list(_WEIGHTED_SUMS)
+
+def _day_numbers(dates):
+    return np.asarray(dates, dtype='datetime64[D]').astype('int64')
+
+def _decay(age_days, half_life, power=1):
+    return np.exp2(-power * np.asarray(age_days, dtype='float64') / half_life)
+
+def empty_state():
+    return pd.DataFrame({col: pd.Series(dtype='str' if col in ('supplier_id', 'as_of') else 'float64') for col in ANOMALY_STATE_COLUMNS})
+
+@traced
+def fold_daily_stats(state, daily_stats_df, as_of):
+    """Move the state to as_of and add daily rollup rows (dated on or before as_of) with their decayed weights
+    
+    Rows may also be differences between a corrected and an already folded rollup
+    row; the result is the same as folding the corrected history from scratch."""
+    as_of_day = _day_numbers([as_of])[0]
+    parts = []
+    if len(state):
+        age = as_of_day - _day_numbers(state['as_of'].tolist())
+        parts.append(pd.DataFrame(
+            {col: state[col].to_numpy() * _decay(age, half_life, power) for col, (_, half_life, power) in _WEIGHTED_SUMS.items()},
+            index=pd.Index(state['supplier_id'].tolist(), name='supplier_id')
+        ))
+    if len(daily_stats_df):
+        age = as_of_day - _day_numbers(daily_stats_df['invoice_date'].tolist())
+        weighted = pd.DataFrame(
+            {col: daily_stats_df[source].to_numpy('float64') * _decay(age, half_life, power) for col, (source, half_life, power) in _WEIGHTED_SUMS.items()},
+            index=pd.Index(daily_stats_df['supplier_id'].tolist(), name='supplier_id')
+        )
+        parts.append(weighted.groupby(level=0).sum())
+    if not parts:
+        return empty_state()
+    folded = pd.concat(parts).groupby(level=0, sort=True).sum().reset_index()
+    folded.insert(1, 'as_of', as_of)
+    return folded[ANOMALY_STATE_COLUMNS]
+
+def build_anomaly_state(daily_stats_df, as_of=None):
+    """State from the full daily history, as of its last day unless given"""
+    if as_of is None:
+        if not len(daily_stats_df):
+            return empty_state()
+        as_of = daily_stats_df['invoice_date'].max()
+    return fold_daily_stats(empty_state(), daily_stats_df[daily_stats_df['invoice_date'] <= as_of], as_of)
+
+@traced
+def detect_anomalies(state, z_threshold=Z_THRESHOLD, min_recent_invoices=MIN_RECENT_INVOICES):
+    """Score each supplier's recent on-time and rejection rates against its baseline; O(suppliers)
+    
+    The z-scores are signed so that positive means worse. Baselines are smoothed
+    towards 50% so a supplier with no rejections yet still has a non-zero spread."""
+    fast = state['fast_invoices'].to_numpy('float64')
+    slow = state['slow_invoices'].to_numpy('float64')
+    weight_sq = state['fast_weight_sq'].to_numpy('float64')
+    with np.errstate(divide='ignore', invalid='ignore'):
+        recent_invoices = np.where(weight_sq > 0, fast ** 2 / weight_sq, 0.0)
+        result = pd.DataFrame({'supplier_id': state['supplier_id'], 'as_of': state['as_of'], 'recent_invoices': np.round(recent_invoices, 1)})
+        for metric, column, sign in [('on_time', 'on_time', -1), ('rejection', 'rejected', 1)]:
+            recent = np.where(fast > 0, state[f'fast_{column}'].to_numpy('float64') / fast, 0.0)
+            baseline = (state[f'slow_{column}'].to_numpy('float64') + 1) / (slow + 2)
+            spread = np.sqrt(baseline * (1 - baseline) / recent_invoices)
+            result[f'{metric}_recent'] = np.round(recent * 100, 2)
+            result[f'{metric}_baseline'] = np.round(baseline * 100, 2)
+            result[f'{metric}_z'] = np.where(recent_invoices > 0, np.round(sign * (recent - baseline) / spread, 2), 0.0)
+    
+    enough = recent_invoices >= min_recent_invoices
+    on_time = enough & (result['on_time_z'] >= z_threshold)
+    rejection = enough & (result['rejection_z'] >= z_threshold)
+    result['flagged'] = on_time | rejection
+    result['reason'] = np.select(
+        [on_time & rejection, on_time, rejection],
+        ['On-time delivery and rejection rate', 'On-time delivery', 'Rejection rate'],
+        ''
+    )
+    order = np.argsort(-np.maximum(result['on_time_z'], result['rejection_z']).to_numpy(), kind='stable')
+    return result.iloc[order].reset_index(drop=True)
+
+def read_anomaly_state(conn):
+    return pd.read_sql_query(f"SELECT {', '.join(ANOMALY_STATE_COLUMNS)} FROM supplier_anomaly_state ORDER BY supplier_id", conn)
+
+def _write_state(conn, state):
+    conn.execute("DELETE FROM supplier_anomaly_state")
+    insert_rows(conn, 'supplier_anomaly_state', state, columns=ANOMALY_STATE_COLUMNS)
+
+def anomaly_watermark(conn):
+    """The last rollup day folded into the state, or None before the first fold"""
+    return conn.execute("SELECT MAX(as_of) FROM supplier_anomaly_state").fetchone()[0]
+
+def settled_daily_stats(conn, keys):
+    """Rollup rows of the given (supplier_id, invoice_date) keys that are already folded into the state"""
+    watermark = anomaly_watermark(conn)
+    keys = sorted(set(keys))
+    if watermark is None or not keys:
+        return pd.DataFrame(columns=['supplier_id', 'invoice_date', 'invoice_count', 'on_time_count', 'rejected_count'])
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS anomaly_keys (supplier_id TEXT, invoice_date TEXT, PRIMARY KEY (supplier_id, invoice_date))")
+    conn.execute("DELETE FROM temp.anomaly_keys")
+    conn.executemany("INSERT INTO temp.anomaly_keys VALUES (?, ?)", [key for key in keys if key[1] <= watermark])
+    return pd.read_sql_query(
+        "SELECT d.supplier_id, d.invoice_date, d.invoice_count, d.on_time_count, d.rejected_count"
+        " FROM daily_supplier_stats d JOIN temp.anomaly_keys k USING (supplier_id, invoice_date)",
+        conn
+    )
+
+def _difference(after, before):
+    """after - before per (supplier_id, invoice_date); rows missing on one side count as zero"""
+    keys = ['supplier_id', 'invoice_date']
+    counts = ['invoice_count', 'on_time_count', 'rejected_count']
+    combined = pd.concat([after[keys + counts], before[keys + counts].assign(**{col: -before[col] for col in counts})])
+    if not len(combined):
+        return combined
+    return combined.groupby(keys, as_index=False)[counts].sum()
+
+def update_anomaly_state(conn, settled_before=None, settled_after=None):
+    """Apply corrections to folded days, then fold in every rollup day after the watermark
+    
+    settled_before and settled_after are settled_daily_stats() of the touched keys
+    around the rollup refresh. Must run inside the caller's transaction; returns the
+    number of new rollup rows folded in."""
+    watermark = anomaly_watermark(conn)
+    state = read_anomaly_state(conn)
+    if watermark is not None and settled_before is not None and settled_after is not None:
+        delta = _difference(settled_after, settled_before)
+        if len(delta):
+            state = fold_daily_stats(state, delta, watermark)
+    
+    latest = conn.execute("SELECT MAX(invoice_date) FROM daily_supplier_stats").fetchone()[0]
+    new_rows = pd.DataFrame()
+    if latest is not None and (watermark is None or latest > watermark):
+        new_rows = pd.read_sql_query(
+            "SELECT supplier_id, invoice_date, invoice_count, on_time_count, rejected_count FROM daily_supplier_stats WHERE invoice_date > ?",
+            conn, params=[watermark or '']
+        )
+        state = fold_daily_stats(state, new_rows, latest)
+    _write_state(conn, state)
+    return len(new_rows)
+
+def rebuild_anomaly_state(conn):
+    """Recompute the state from the whole rollup, after a full reload"""
+    conn.execute("DELETE FROM supplier_anomaly_state")
+    return update_anomaly_state(conn)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="List suppliers whose on-time or rejection rate has degraded")
+    parser.add_argument('--db', default='data/suppliers.db', help="SQLite database to check")
+    parser.add_argument('--rebuild', action='store_true', help="recompute the state from the whole rollup first")
+    parser.add_argument('--z', type=float, default=Z_THRESHOLD, help="standard errors that count as degraded")
+    args = parser.parse_args(argv)
+    
+    conn = connect(args.db)
+    try:
+        if args.rebuild:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                rebuild_anomaly_state(conn)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+        scores = detect_anomalies(read_anomaly_state(conn), args.z)
+    finally:
+        conn.close()
+    flagged = scores[scores['flagged']]
+    print(flagged.to_string(index=False) if len(flagged) else "✓ No supplier degradation detected")
+
+if __name__ == "__main__":
+    main()
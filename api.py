@@ -0,0 +1,181 @@
+"""
+Headless JSON API over the dashboard's storage backend and KPI layer
+
+Endpoints take the sidebar's filters as query parameters: start_date and end_date
+(YYYY-MM-DD), supplier (a supplier name, repeatable), supplier_id (repeatable) and
+category. Results come from the same cached backend the dashboard uses. Every
+response carries an ETag tied to the backend's persistent data generation, so a
+client polling with If-None-Match gets 304 Not Modified, without any query, until
+the data changes; the tag is the same in every worker process and across restarts.
+
+Run with: uvicorn api:app --port 8000   (or python api.py --port 8000)
+"""
+import argparse
+import hashlib
+import json
+import uuid
+from urllib.parse import urlencode
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+from filters import parse_date, resolve_supplier_filter
+from query_cache import CachedSupplierDatabase
+from snapshots import SnapshotDatabase
+from storage import open_backend
+
+MAX_PAGE_SIZE = 500
+
+# Backends without a persistent generation fall back to a version counter, such as
+# SQLite's PRAGMA data_version, that restarts with the process
+API_EPOCH = uuid.uuid4().hex
+
+def _records(df):
+    """DataFrame rows as JSON-ready dicts, with NaN as null"""
+    return json.loads(df.to_json(orient='records', date_format='iso'))
+
+def request_filters(db, params):
+    """Resolve sidebar-style query parameters to (start_date, end_date, supplier_ids, suppliers)"""
+    start_date = parse_date(params.get('start_date'), 'start_date')
+    end_date = parse_date(params.get('end_date'), 'end_date')
+    names, ids, category = params.getlist('supplier'), params.getlist('supplier_id'), params.get('category')
+    suppliers_df = db.get_suppliers()
+    unknown = sorted(set(names) - set(suppliers_df['supplier_name'])) + sorted(set(ids) - set(suppliers_df['supplier_id']))
+    if unknown:
+        raise ValueError(f"Unknown supplier: {', '.join(unknown)}")
+    if category and category not in set(suppliers_df['category']):
+        raise ValueError(f"Unknown category: {category}")
+    supplier_ids, filtered_suppliers_df = resolve_supplier_filter(suppliers_df, names, category, ids)
+    return start_date, end_date, supplier_ids, filtered_suppliers_df
+
+def filter_params(db, request):
+    return request_filters(db, request.query_params)
+
+def no_params(db, request):
+    return None
+
+def _echo(start_date, end_date, supplier_ids):
+    return {'start_date': start_date, 'end_date': end_date, 'supplier_ids': supplier_ids}
+
+def overall_kpis(db, request, filters):
+    start_date, end_date, supplier_ids, _ = filters
+    return {'filters': _echo(start_date, end_date, supplier_ids), 'kpis': db.get_overall_kpis(start_date, end_date, supplier_ids)}
+
+def supplier_kpis(db, request, filters):
+    start_date, end_date, supplier_ids, suppliers_df = filters
+    kpis = db.get_supplier_kpis(start_date, end_date, supplier_ids, suppliers_df)
+    return {'filters': _echo(start_date, end_date, supplier_ids), 'suppliers': _records(kpis)}
+
+def monthly_trends(db, request, filters):
+    start_date, end_date, supplier_ids, _ = filters
+    trends = db.get_monthly_trends(start_date, end_date, supplier_ids)
+    trends = trends.assign(month=trends['month'].dt.strftime('%Y-%m'))
+    return {'filters': _echo(start_date, end_date, supplier_ids), 'months': _records(trends)}
+
+def supplier_list(db, request, params):
+    return {'suppliers': _records(db.get_suppliers())}
+
+def invoice_page_params(db, request):
+    """Validate a page request into (supplier_id, start_date, end_date, after, page_size, descending)"""
+    supplier_id = request.path_params['supplier_id']
+    if supplier_id not in set(db.get_suppliers()['supplier_id']):
+        raise LookupError(f"Unknown supplier: {supplier_id}")
+    params = request.query_params
+    start_date = parse_date(params.get('start_date'), 'start_date')
+    end_date = parse_date(params.get('end_date'), 'end_date')
+    order = params.get('order', 'desc')
+    if order not in ('asc', 'desc'):
+        raise ValueError("order must be 'asc' or 'desc'")
+    try:
+        page_size = int(params.get('page_size', 20))
+    except ValueError:
+        raise ValueError("page_size must be an integer")
+    if not 1 <= page_size <= MAX_PAGE_SIZE:
+        raise ValueError(f"page_size must be between 1 and {MAX_PAGE_SIZE}")
+    if ('after_date' in params) != ('after_id' in params):
+        raise ValueError("after_date and after_id must be given together")
+    after = (parse_date(params['after_date'], 'after_date'), params['after_id']) if 'after_date' in params else None
+    return supplier_id, start_date, end_date, after, page_size, order == 'desc'
+
+def invoice_page(db, request, page_params):
+    """One keyset page of a supplier's invoices; pass the returned next parameters to continue"""
+    supplier_id = page_params[0]
+    page, next_key = db.get_supplier_invoice_page(*page_params)
+    next_params = None
+    if next_key is not None:
+        next_params = {key: value for key, value in request.query_params.items() if key not in ('after_date', 'after_id')}
+        next_params.update(after_date=next_key[0], after_id=next_key[1])
+    return {
+        'supplier_id': supplier_id,
+        'invoices': _records(page),
+        'next': next_params,
+        'next_url': f"{request.url.path}?{urlencode(next_params)}" if next_params else None
+    }
+
+def etag_version(db):
+    """The backend's persistent data generation, or the process-local data version under this process's epoch"""
+    generation = db.data_generation()
+    if generation is not None:
+        return f"generation:{generation}"
+    return f"{API_EPOCH}:{db.data_version()}"
+
+def etag_for(version, request):
+    """Strong ETag for one URL at one etag_version()"""
+    query = sorted(request.query_params.multi_items())
+    digest = hashlib.sha1(f"{version}:{request.url.path}?{urlencode(query)}".encode()).hexdigest()
+    return f'"{digest[:32]}"'
+
+def _matches(if_none_match, etag):
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(',')]
+    return '*' in tags or etag in tags or f"W/{etag}" in tags
+
+def create_app(db=None):
+    """Build the API around a storage backend; by default the configured one with its preset snapshots, behind the query cache
+    
+    Backend calls run in the threadpool, so concurrent requests share the connection
+    pool and the cache's single-flight loading instead of blocking the event loop."""
+    db = db if db is not None else CachedSupplierDatabase(SnapshotDatabase(open_backend()))
+    
+    def endpoint(compute, parse=filter_params):
+        """Wrap compute(db, request, params); only parse(db, request) errors become 404 or 400 responses"""
+        async def handler(request):
+            version = await run_in_threadpool(etag_version, db)
+            etag = etag_for(version, request)
+            headers = {'ETag': etag, 'Cache-Control': 'no-cache'}
+            if _matches(request.headers.get('if-none-match'), etag):
+                return Response(status_code=304, headers=headers)
+            try:
+                params = await run_in_threadpool(parse, db, request)
+            except LookupError as exc:
+                return JSONResponse({'error': str(exc)}, status_code=404)
+            except ValueError as exc:
+                return JSONResponse({'error': str(exc)}, status_code=400)
+            payload = await run_in_threadpool(compute, db, request, params)
+            return JSONResponse(payload, headers=headers)
+        return handler
+    
+    app = Starlette(routes=[
+        Route('/api/kpis', endpoint(overall_kpis)),
+        Route('/api/suppliers', endpoint(supplier_list, no_params)),
+        Route('/api/suppliers/kpis', endpoint(supplier_kpis)),
+        Route('/api/trends', endpoint(monthly_trends)),
+        Route('/api/suppliers/{supplier_id}/invoices', endpoint(invoice_page, invoice_page_params))
+    ])
+    app.state.db = db
+    return app
+
+# Backends connect lazily, so importing this module doesn't touch the data
+app = create_app()
+
+def main(argv=None):
+    import uvicorn
+    parser = argparse.ArgumentParser(description="Serve the supplier KPI JSON API")
+    parser.add_argument('--host', default='127.0.0.1', help="interface to bind")
+    parser.add_argument('--port', type=int, default=8000, help="port to listen on")
+    args = parser.parse_args(argv)
+    uvicorn.run(app, host=args.host, port=args.port)
+
+if __name__ == "__main__":
+    main()
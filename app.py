@@ -1,106 +1,45 @@
 """
 Supplier Performance & SLA Dashboard
+
+Plotly is imported inside the tab renderers, so the first metrics don't wait for it.
 """
 import streamlit as st
 import pandas as pd
-import plotly.express as px
-import plotly.graph_objects as go
-from datetime import datetime
-from database import SupplierDatabase
-from kpi_calculator import calculate_overall_kpis, calculate_supplier_kpis
-
-st.set_page_config(page_title="Supplier Performance Dashboard", page_icon="📊", layout="wide")
-
-db = SupplierDatabase()
-
-st.title("Supplier Performance & SLA Dashboard")
-st.markdown("---")
-
-# Sidebar filters
-st.sidebar.header("Filters")
-
-suppliers_df = db.get_suppliers()
-supplier_options = ['All Suppliers'] + suppliers_df['supplier_name'].tolist()
-selected_suppliers = st.sidebar.multiselect("Select Suppliers", options=supplier_options, default=['All Suppliers'])
-
-min_date_str, max_date_str = db.get_date_range()
-min_date = datetime.strptime(min_date_str, '%Y-%m-%d').date()
-max_date = datetime.strptime(max_date_str, '%Y-%m-%d').date()
-
-date_range = st.sidebar.date_input("Date Range", value=(min_date, max_date), min_value=min_date, max_value=max_date)
-
-categories = ['All Categories'] + suppliers_df['category'].unique().tolist()
-selected_category = st.sidebar.selectbox("Category", categories)
-
-# Apply filters
-start_date = date_range[0].strftime('%Y-%m-%d') if len(date_range) > 0 else None
-end_date = date_range[1].strftime('%Y-%m-%d') if len(date_range) > 1 else None
-
-if 'All Suppliers' not in selected_suppliers and len(selected_suppliers) > 0:
-    supplier_ids = suppliers_df[suppliers_df['supplier_name'].isin(selected_suppliers)]['supplier_id'].tolist()
-else:
-    supplier_ids = None
-
-if selected_category != 'All Categories':
-    filtered_suppliers = suppliers_df[suppliers_df['category'] == selected_category]
-    if supplier_ids:
-        supplier_ids = [sid for sid in supplier_ids if sid in filtered_suppliers['supplier_id'].tolist()]
-    else:
-        supplier_ids = filtered_suppliers['supplier_id'].tolist()
-
-invoices_df = db.get_invoices(start_date, end_date, supplier_ids)
-outstanding_df = db.get_outstanding(supplier_ids)
-
-if supplier_ids:
-    filtered_suppliers_df = suppliers_df[suppliers_df['supplier_id'].isin(supplier_ids)]
-else:
-    filtered_suppliers_df = suppliers_df
-
-overall_kpis = calculate_overall_kpis(invoices_df, outstanding_df)
-
-# Display KPIs
-st.subheader("📈 Overall Performance Metrics")
-col1, col2, col3, col4, col5 = st.columns(5)
-
-with col1:
-    st.metric("On-Time Delivery", f"{overall_kpis['on_time_delivery']}%")
-with col2:
-    st.metric("Invoice Accuracy", f"{overall_kpis['invoice_accuracy']}%")
-with col3:
-    st.metric("Rejection Rate", f"{overall_kpis['rejection_rate']}%")
-with col4:
-    st.metric("Avg Payment Days", f"{overall_kpis['avg_payment_days']} days")
-with col5:
-    st.metric("Avg Outstanding", f"${overall_kpis['avg_outstanding']:,.0f}")
-
-st.markdown("---")
-
-# Supplier KPIs
-st.subheader("Supplier Performance Breakdown")
-supplier_kpis = calculate_supplier_kpis(invoices_df, outstanding_df, filtered_suppliers_df)
-
-st.dataframe(
-    supplier_kpis.style.format({
-        'on_time_delivery': '{:.2f}%',
-        'invoice_accuracy': '{:.2f}%',
-        'rejection_rate': '{:.2f}%',
-        'avg_payment_days': '{:.2f}',
-        'avg_outstanding': '${:,.2f}',
-        'total_amount': '${:,.2f}'
-    }),
-    use_container_width=True,
-    height=300
+from datetime import datetime, timedelta
+from storage import open_backend
+from query_cache import CachedSupplierDatabase
+from snapshots import SnapshotDatabase
+from kpi_calculator import (
+    ROLLING_WINDOWS,
+    histogram_bins,
+    calculate_rolling_rates,
+    calculate_percentiles,
+    calculate_aging_buckets
 )
+from instrumentation import Trace, is_enabled, span
+from filters import ALL_CATEGORIES, ALL_SUPPLIERS, FULL_RANGE, PERIODS, period_start, resolve_supplier_filter
+from anomaly import FAST_HALF_LIFE_DAYS, SLOW_HALF_LIFE_DAYS, detect_anomalies
+from exporter import EXPORT_FORMATS, export_invoices, export_file_name, export_to_bytes, write_chunks
 
-st.markdown("---")
+# Streamlit serves each download from memory, so larger invoice exports go through exporter.py
+EXPORT_MAX_ROWS = 500_000
 
-# Visualizations
-st.subheader("Visual Analytics")
-tab1, tab2, tab3, tab4 = st.tabs(["Performance Comparison", "Trends", "Distribution", "Drill-Down"])
+st.set_page_config(page_title="Supplier Performance Dashboard", page_icon="📊", layout="wide")
+
+@st.cache_resource
+def get_database():
+    """One result-caching storage backend shared by every session and rerun
+    
+    Preset views are answered from the snapshot files written after each data load.
+    SUPPLIER_DASHBOARD_BACKEND=parquet (with SUPPLIER_DASHBOARD_DATA=<store dir>) switches from SQLite"""
+    return CachedSupplierDatabase(SnapshotDatabase(open_backend()))
 
-with tab1:
+@st.fragment
+def render_comparison(supplier_kpis):
+    """Top suppliers by on-time delivery and invoice accuracy"""
+    import plotly.express as px
     col1, col2 = st.columns(2)
-    with col1:
+    with col1, span('chart.top_on_time_delivery'):
         fig_delivery = px.bar(
             supplier_kpis.sort_values('on_time_delivery', ascending=False).head(10),
             x='supplier_name', y='on_time_delivery',
@@ -110,7 +49,7 @@ with tab1:
         fig_delivery.update_layout(xaxis_tickangle=-45)
         st.plotly_chart(fig_delivery, use_container_width=True)
     
-    with col2:
+    with col2, span('chart.top_invoice_accuracy'):
         fig_accuracy = px.bar(
             supplier_kpis.sort_values('invoice_accuracy', ascending=False).head(10),
             x='supplier_name', y='invoice_accuracy',
@@ -120,26 +59,29 @@ with tab1:
         fig_accuracy.update_layout(xaxis_tickangle=-45)
         st.plotly_chart(fig_accuracy, use_container_width=True)
 
-with tab2:
-    if len(invoices_df) > 0:
-        invoices_df['invoice_date'] = pd.to_datetime(invoices_df['invoice_date'])
-        monthly_stats = invoices_df.groupby(invoices_df['invoice_date'].dt.to_period('M')).agg({
-            'delivery_delay_days': lambda x: ((x <= 0).sum() / len(x) * 100),
-            'is_accurate': lambda x: (x.sum() / len(x) * 100),
-            'is_rejected': lambda x: (x.sum() / len(x) * 100)
-        }).reset_index()
-        monthly_stats['invoice_date'] = monthly_stats['invoice_date'].dt.to_timestamp()
-        
-        fig_trend = go.Figure()
-        fig_trend.add_trace(go.Scatter(x=monthly_stats['invoice_date'], y=monthly_stats['delivery_delay_days'], name='On-Time Delivery %', line=dict(color='green', width=2)))
-        fig_trend.add_trace(go.Scatter(x=monthly_stats['invoice_date'], y=monthly_stats['is_accurate'], name='Invoice Accuracy %', line=dict(color='blue', width=2)))
-        fig_trend.add_trace(go.Scatter(x=monthly_stats['invoice_date'], y=monthly_stats['is_rejected'], name='Rejection Rate %', line=dict(color='red', width=2)))
-        fig_trend.update_layout(title='Performance Trends Over Time', xaxis_title='Month', yaxis_title='Percentage (%)', hovermode='x unified')
-        st.plotly_chart(fig_trend, use_container_width=True)
-
-with tab3:
+
+@st.fragment
+def render_trends(start_date, end_date, supplier_ids):
+    """Monthly on-time, accuracy and rejection trends"""
+    import plotly.graph_objects as go
+    monthly_stats = db.get_monthly_trends(start_date, end_date, supplier_ids)
+    if len(monthly_stats) > 0:
+        with span('chart.monthly_trends'):
+            fig_trend = go.Figure()
+            fig_trend.add_trace(go.Scatter(x=monthly_stats['month'], y=monthly_stats['on_time_delivery'], name='On-Time Delivery %', line=dict(color='green', width=2)))
+            fig_trend.add_trace(go.Scatter(x=monthly_stats['month'], y=monthly_stats['invoice_accuracy'], name='Invoice Accuracy %', line=dict(color='blue', width=2)))
+            fig_trend.add_trace(go.Scatter(x=monthly_stats['month'], y=monthly_stats['rejection_rate'], name='Rejection Rate %', line=dict(color='red', width=2)))
+            fig_trend.update_layout(title='Performance Trends Over Time', xaxis_title='Month', yaxis_title='Percentage (%)', hovermode='x unified')
+            st.plotly_chart(fig_trend, use_container_width=True)
+
+
+@st.fragment
+def render_distribution(supplier_kpis, start_date, end_date, supplier_ids):
+    """Category averages and the payment days histogram"""
+    import plotly.express as px
+    import plotly.graph_objects as go
     col1, col2 = st.columns(2)
-    with col1:
+    with col1, span('chart.category_performance'):
         category_kpis = supplier_kpis.groupby('category').agg({
             'on_time_delivery': 'mean',
             'invoice_accuracy': 'mean',
@@ -150,11 +92,26 @@ with tab3:
         st.plotly_chart(fig_category, use_container_width=True)
     
     with col2:
-        if len(invoices_df) > 0:
-            fig_payment = px.histogram(invoices_df, x='payment_days', nbins=30, title='Payment Days Distribution')
-            st.plotly_chart(fig_payment, use_container_width=True)
+        payment_counts = db.get_payment_days_counts(start_date, end_date, supplier_ids)
+        if len(payment_counts) > 0:
+            # Binned here so the browser gets 30 bars, not one value per invoice
+            with span('chart.payment_days') as record:
+                payment_bins = histogram_bins(payment_counts['payment_days'], payment_counts['invoice_count'], nbins=30)
+                record.rows = len(payment_bins)
+                fig_payment = go.Figure(go.Bar(
+                    x=(payment_bins['bin_start'] + payment_bins['bin_end']) / 2,
+                    y=payment_bins['count'],
+                    width=payment_bins['bin_end'] - payment_bins['bin_start'],
+                    customdata=payment_bins[['bin_start', 'bin_end']].to_numpy(),
+                    hovertemplate='%{customdata[0]:.0f} to under %{customdata[1]:.0f} days: %{y:,} invoices<extra></extra>'
+                ))
+                fig_payment.update_layout(title='Payment Days Distribution', xaxis_title='payment_days', yaxis_title='invoice_count', bargap=0)
+                st.plotly_chart(fig_payment, use_container_width=True)
 
-with tab4:
+
+@st.fragment
+def render_drill_down(supplier_kpis, start_date, end_date):
+    """One supplier's totals and a keyset-paged invoice table"""
     st.subheader("🔍 Supplier Drill-Down")
     selected_supplier_name = st.selectbox("Select Supplier for Details", supplier_kpis['supplier_name'].tolist())
     
@@ -170,23 +127,273 @@ with tab4:
         with col3:
             st.metric("Category", supplier_detail['category'])
         
-        supplier_invoices = invoices_df[invoices_df['supplier_id'] == supplier_id_detail]
-        if len(supplier_invoices) > 0:
-            st.subheader("Recent Invoices")
-            st.dataframe(supplier_invoices[['invoice_id', 'invoice_date', 'invoice_amount', 'payment_days', 'delivery_delay_days', 'is_accurate', 'is_rejected']].head(20), use_container_width=True)
+        # Keyset paging: session_state keeps the key each visited page starts after, so only
+        # one page of this supplier's invoices is read per rerun
+        sort_order = st.radio("Sort", ["Newest first", "Oldest first"], horizontal=True, key='drill_sort')
+        page_size = st.selectbox("Rows per page", [20, 50, 100], key='drill_page_size')
+        drill_view = (supplier_id_detail, start_date, end_date, sort_order, page_size)
+        if st.session_state.get('drill_view') != drill_view:
+            st.session_state.drill_view = drill_view
+            st.session_state.drill_pages = [None]
+        drill_pages = st.session_state.drill_pages
+        
+        invoice_page, next_key = db.get_supplier_invoice_page(
+            supplier_id_detail, start_date, end_date, after=drill_pages[-1],
+            page_size=page_size, descending=sort_order == "Newest first", typed=True
+        )
+        if len(invoice_page) > 0:
+            st.subheader("Invoices")
+            with span('chart.drill_down_invoices') as record:
+                record.rows = len(invoice_page)
+                st.dataframe(invoice_page[['invoice_id', 'invoice_date', 'invoice_amount', 'payment_days', 'delivery_delay_days', 'is_accurate', 'is_rejected']], use_container_width=True, hide_index=True)
+            
+            page_count = max(1, -(-int(supplier_detail['total_invoices']) // page_size))
+            col1, col2, col3 = st.columns([1, 2, 1])
+            with col1:
+                st.button("← Previous", disabled=len(drill_pages) == 1, on_click=drill_pages.pop, key='drill_previous')
+            with col2:
+                st.caption(f"Page {len(drill_pages)} of {page_count}")
+            with col3:
+                st.button("Next →", disabled=next_key is None, on_click=drill_pages.append, args=(next_key,), key='drill_next')
+
+
+@st.fragment
+def render_sla(filtered_suppliers_df, start_date, end_date, supplier_ids):
+    """Rolling rates, days percentiles and outstanding aging"""
+    import plotly.express as px
+    import plotly.graph_objects as go
+    st.subheader("⏱️ SLA Review")
+    # Windows end on the selected end date and reach back up to a year before the start date
+    window_end = end_date or max_date_str
+    lookback = timedelta(days=max(ROLLING_WINDOWS) - 1)
+    history_start = (datetime.strptime(start_date or window_end, '%Y-%m-%d') - lookback).strftime('%Y-%m-%d')
+    daily_stats = db.get_daily_stats(history_start, window_end, supplier_ids)
+    
+    st.markdown(f"**Rolling on-time and accuracy rates as of {window_end}**")
+    rolling = calculate_rolling_rates(daily_stats, as_of=window_end)
+    rolling_table = filtered_suppliers_df[['supplier_id', 'supplier_name']].merge(rolling, on='supplier_id', how='left').fillna(0)
+    rate_columns = [f"{name}_{window}d" for name in ('on_time', 'accuracy') for window in ROLLING_WINDOWS]
+    st.dataframe(rolling_table[['supplier_name'] + rate_columns], use_container_width=True, hide_index=True)
+    
+    trend_names = ['All selected suppliers'] + filtered_suppliers_df['supplier_name'].tolist()
+    trend_name = st.selectbox("Rolling trend for", trend_names, key='sla_trend_supplier')
+    if trend_name == trend_names[0]:
+        trend_stats = daily_stats.assign(supplier_id='all')
+    else:
+        trend_id = filtered_suppliers_df.loc[filtered_suppliers_df['supplier_name'] == trend_name, 'supplier_id'].iloc[0]
+        trend_stats = daily_stats[daily_stats['supplier_id'] == trend_id]
+    trend = calculate_rolling_rates(trend_stats)
+    trend = trend[trend['invoice_date'] >= (start_date or min_date_str)]
+    if len(trend) > 0:
+        with span('chart.rolling_on_time') as record:
+            record.rows = len(trend)
+            fig_rolling = go.Figure([
+                go.Scatter(x=trend['invoice_date'], y=trend[f"on_time_{window}d"], name=f"{window}-day", mode='lines')
+                for window in ROLLING_WINDOWS
+            ])
+            fig_rolling.update_layout(title='Rolling On-Time Delivery', xaxis_title='Date', yaxis_title='On-time (%)', hovermode='x unified')
+            st.plotly_chart(fig_rolling, use_container_width=True)
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        st.markdown("**Days percentiles**")
+        # Per-supplier value counts are a mergeable sketch: pooled, they give the overall percentiles
+        overall_percentiles = {}
+        supplier_percentiles = []
+        for column, label in {'delivery_delay_days': 'Delivery delay', 'payment_days': 'Payment'}.items():
+            counts = db.get_day_counts(column, start_date, end_date, supplier_ids, by_supplier=True)
+            overall_percentiles[label] = calculate_percentiles(counts[column], counts['invoice_count'])
+            supplier_percentiles.append(calculate_percentiles(counts[column], counts['invoice_count'], counts['supplier_id']).add_prefix(f"{label} "))
+        st.dataframe(pd.DataFrame(overall_percentiles).T.round(1), use_container_width=True)
+        with st.expander("Per supplier"):
+            names = filtered_suppliers_df.set_index('supplier_id')['supplier_name']
+            st.dataframe(pd.concat(supplier_percentiles, axis=1).round(1).rename(index=names), use_container_width=True)
+    
+    with col2, span('chart.outstanding_aging'):
+        aging = calculate_aging_buckets(db.get_outstanding(supplier_ids))
+        fig_aging = px.bar(aging, x='aging_bucket', y='outstanding_amount', text='outstanding_count',
+            title='Outstanding Amount by Age', labels={'aging_bucket': 'Age', 'outstanding_amount': 'Outstanding ($)'})
+        st.plotly_chart(fig_aging, use_container_width=True)
+
+
+db = get_database()
+
+# Debug panel: with SUPPLIER_DASHBOARD_TRACE=1 or ?debug=1, time every query, KPI function and chart of this rerun
+debug = is_enabled() or st.query_params.get('debug') == '1'
+if debug:
+    trace = Trace(profile=st.session_state.get('profile_reruns', False)).start()
+
+st.title("Supplier Performance & SLA Dashboard")
+st.markdown("---")
+
+# Sidebar filters
+st.sidebar.header("Filters")
+
+# Suppliers, date range and categories are loaded once per session and data version
+data_version = db.data_version()
+if st.session_state.get('filter_metadata_version') != data_version:
+    suppliers_df = db.get_suppliers()
+    st.session_state.filter_metadata = {
+        'suppliers': suppliers_df,
+        'supplier_options': [ALL_SUPPLIERS] + suppliers_df['supplier_name'].tolist(),
+        'date_range': db.get_date_range(),
+        'categories': [ALL_CATEGORIES] + suppliers_df['category'].unique().tolist()
+    }
+    st.session_state.filter_metadata_version = data_version
+filter_metadata = st.session_state.filter_metadata
+suppliers_df = filter_metadata['suppliers']
+
+selected_suppliers = st.sidebar.multiselect("Select Suppliers", options=filter_metadata['supplier_options'], default=[ALL_SUPPLIERS])
+
+min_date_str, max_date_str = filter_metadata['date_range']
+min_date = datetime.strptime(min_date_str, '%Y-%m-%d').date()
+max_date = datetime.strptime(max_date_str, '%Y-%m-%d').date()
+
+# The periods match the precomputed snapshots; picking one resets the date range below
+period = st.sidebar.selectbox("Period", [FULL_RANGE] + list(PERIODS))
+period_start_date = min_date
+if period in PERIODS:
+    period_start_date = datetime.strptime(period_start(min_date_str, max_date_str, PERIODS[period]), '%Y-%m-%d').date()
+
+date_range = st.sidebar.date_input("Date Range", value=(period_start_date, max_date), min_value=min_date, max_value=max_date)
+
+selected_category = st.sidebar.selectbox("Category", filter_metadata['categories'])
+
+# Apply filters
+start_date = date_range[0].strftime('%Y-%m-%d') if len(date_range) > 0 else None
+end_date = date_range[1].strftime('%Y-%m-%d') if len(date_range) > 1 else None
+
+supplier_ids, filtered_suppliers_df = resolve_supplier_filter(suppliers_df, selected_suppliers, selected_category)
+
+overall_kpis = db.get_overall_kpis(start_date, end_date, supplier_ids)
+
+# Display KPIs
+st.subheader("📈 Overall Performance Metrics")
+col1, col2, col3, col4, col5 = st.columns(5)
+
+with col1:
+    st.metric("On-Time Delivery", f"{overall_kpis['on_time_delivery']}%")
+with col2:
+    st.metric("Invoice Accuracy", f"{overall_kpis['invoice_accuracy']}%")
+with col3:
+    st.metric("Rejection Rate", f"{overall_kpis['rejection_rate']}%")
+with col4:
+    st.metric("Avg Payment Days", f"{overall_kpis['avg_payment_days']} days")
+with col5:
+    st.metric("Avg Outstanding", f"${overall_kpis['avg_outstanding']:,.0f}")
+
+# Alerts: the latest recent-vs-baseline scores, one row per supplier however long the history
+scores = detect_anomalies(db.get_anomaly_state())
+alerts = scores[scores['flagged']].merge(suppliers_df[['supplier_id', 'supplier_name']], on='supplier_id')
+if supplier_ids is not None:
+    alerts = alerts[alerts['supplier_id'].isin(supplier_ids)]
+with st.container(border=True):
+    as_of = scores['as_of'].iloc[0] if len(scores) else max_date_str
+    if len(alerts):
+        st.warning(f"🚨 {len(alerts)} supplier(s) degraded as of {as_of}")
+        st.dataframe(
+            alerts[['supplier_name', 'reason', 'on_time_recent', 'on_time_baseline', 'rejection_recent', 'rejection_baseline', 'recent_invoices']],
+            column_config={
+                'supplier_name': 'Supplier',
+                'reason': 'Degraded',
+                'on_time_recent': st.column_config.NumberColumn('On-time (recent)', format='%.2f%%'),
+                'on_time_baseline': st.column_config.NumberColumn('On-time (baseline)', format='%.2f%%'),
+                'rejection_recent': st.column_config.NumberColumn('Rejection (recent)', format='%.2f%%'),
+                'rejection_baseline': st.column_config.NumberColumn('Rejection (baseline)', format='%.2f%%'),
+                'recent_invoices': st.column_config.NumberColumn('Recent invoices', format='%.0f')
+            },
+            hide_index=True,
+            use_container_width=True
+        )
+    else:
+        st.success(f"✅ No supplier degradation detected as of {as_of}")
+    st.caption(f"Recent rates are {FAST_HALF_LIFE_DAYS}-day half-life averages, compared with each supplier's {SLOW_HALF_LIFE_DAYS}-day baseline.")
+
+st.markdown("---")
+
+# Supplier KPIs
+st.subheader("Supplier Performance Breakdown")
+supplier_kpis = db.get_supplier_kpis(start_date, end_date, supplier_ids, filtered_suppliers_df)
+
+with span('chart.supplier_table') as record:
+    record.rows = len(supplier_kpis)
+    # column_config formats in the browser; a pandas Styler would render every cell server-side
+    st.dataframe(
+        supplier_kpis,
+        column_config={
+            'on_time_delivery': st.column_config.NumberColumn(format='%.2f%%'),
+            'invoice_accuracy': st.column_config.NumberColumn(format='%.2f%%'),
+            'rejection_rate': st.column_config.NumberColumn(format='%.2f%%'),
+            'avg_payment_days': st.column_config.NumberColumn(format='%.2f'),
+            'avg_outstanding': st.column_config.NumberColumn(format='dollar'),
+            'total_amount': st.column_config.NumberColumn(format='dollar')
+        },
+        use_container_width=True,
+        height=300
+    )
+
+st.markdown("---")
+
+# Visualizations
+st.subheader("Visual Analytics")
+# Only the selected tab runs; each tab is a fragment, so its own widgets rerun just that tab
+tab1, tab2, tab3, tab4, tab5 = st.tabs(["Performance Comparison", "Trends", "Distribution", "Drill-Down", "SLA"], key='analytics_tab', on_change='rerun')
+if tab1.open:
+    with tab1:
+        render_comparison(supplier_kpis)
+if tab2.open:
+    with tab2:
+        render_trends(start_date, end_date, supplier_ids)
+if tab3.open:
+    with tab3:
+        render_distribution(supplier_kpis, start_date, end_date, supplier_ids)
+if tab4.open:
+    with tab4:
+        render_drill_down(supplier_kpis, start_date, end_date)
+if tab5.open:
+    with tab5:
+        render_sla(filtered_suppliers_df, start_date, end_date, supplier_ids)
 
 # Export
 st.markdown("---")
 st.subheader("Export Data")
+export_format = st.selectbox("Export Format", list(EXPORT_FORMATS), format_func=lambda fmt: EXPORT_FORMATS[fmt]['label'])
+export_stamp = datetime.now().strftime('%Y%m%d')
 col1, col2 = st.columns(2)
 
+# Files are only built when a download button is clicked; invoices stream from the backend in chunks
+export_rows = int(db.get_invoice_stats(start_date, end_date, supplier_ids)['invoice_count'])
 with col1:
-    csv_suppliers = supplier_kpis.to_csv(index=False)
-    st.download_button("Download Supplier KPIs (CSV)", csv_suppliers, file_name=f"supplier_kpis_{datetime.now().strftime('%Y%m%d')}.csv", mime="text/csv")
+    st.download_button(
+        f"Download Supplier KPIs ({EXPORT_FORMATS[export_format]['label']})",
+        lambda: export_to_bytes(lambda fileobj: write_chunks([supplier_kpis], export_format, fileobj)),
+        file_name=export_file_name('supplier_kpis', export_format, export_stamp),
+        mime=EXPORT_FORMATS[export_format]['mime'],
+        on_click='ignore'
+    )
 
 with col2:
-    csv_invoices = invoices_df.to_csv(index=False)
-    st.download_button("Download Invoice Details (CSV)", csv_invoices, file_name=f"invoice_details_{datetime.now().strftime('%Y%m%d')}.csv", mime="text/csv")
+    st.download_button(
+        f"Download Invoice Details ({EXPORT_FORMATS[export_format]['label']})",
+        lambda: export_to_bytes(lambda fileobj: export_invoices(db, export_format, fileobj, start_date, end_date, supplier_ids)),
+        file_name=export_file_name('invoice_details', export_format, export_stamp),
+        mime=EXPORT_FORMATS[export_format]['mime'],
+        on_click='ignore',
+        disabled=export_rows > EXPORT_MAX_ROWS
+    )
+    if export_rows > EXPORT_MAX_ROWS:
+        st.caption(
+            f"{export_rows:,} invoices match the filters; downloads are limited to {EXPORT_MAX_ROWS:,}. "
+            f"Narrow the filters or run `python exporter.py --format {export_format} --output <file>`."
+        )
 
 st.markdown("---")
 st.caption("Dashboard built with Streamlit | Data refreshed in real-time")
+
+if debug:
+    trace.stop()
+    with st.expander(f"Debug: rerun took {trace.seconds * 1000:,.0f} ms"):
+        st.checkbox("Profile reruns with cProfile", key='profile_reruns')
+        st.dataframe(trace.to_frame(), use_container_width=True, hide_index=True)
+        if trace.profile:
+            st.code(trace.profile_report())
@@ -0,0 +1,3 @@
+"""
+Headless performance benchmarks for the supplier dashboard
+"""
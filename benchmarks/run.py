@@ -0,0 +1,243 @@
+"""
+Benchmark the database, KPI and export paths at several dataset sizes
+
+Run with: python -m benchmarks.run --sizes 1000 100000 10000000 --output results.json
+Compare storage backends with --backends sqlite parquet. Compare against a stored
+run with --baseline baseline.json; the exit code is 1 when any case is slower
+than the baseline by more than --threshold.
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from data_generator import generate_dataset
+from database import SupplierDatabase, coerce_invoice_dtypes
+from exporter import export_invoices
+from kpi_calculator import calculate_overall_kpis, calculate_supplier_kpis, calculate_monthly_trends, histogram_bins
+from parallel_kpis import calculate_supplier_kpis_parallel
+
+DEFAULT_SIZES = [1_000, 100_000, 10_000_000]
+DATA_DIR = os.path.join(os.path.dirname(__file__), 'data')
+START_DATE = '2023-01-01'
+DAYS = 730
+
+def _current_rss():
+    """Resident set size in bytes, from /proc where available"""
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+class PeakRSS:
+    """Sample RSS on a background thread to find the peak reached inside a block"""
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.start = 0
+        self.peak = 0
+        self._stop = threading.Event()
+
+    def _sample(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, _current_rss())
+            time.sleep(self.interval)
+
+    def __enter__(self):
+        gc.collect()
+        self.start = self.peak = _current_rss()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, _current_rss())
+
+def ensure_dataset(size, suppliers, data_dir=DATA_DIR, seed=42):
+    """Generate the benchmark database for a size once and reuse it afterwards"""
+    path = os.path.join(data_dir, f'invoices_{size}_{suppliers}.db')
+    if not os.path.exists(path):
+        print(f"Generating {size:,} invoices into {path}...")
+        generate_dataset(suppliers, size, suppliers * 5, db_path=path, seed=seed, start_date=START_DATE, days=DAYS)
+    return path
+
+def build_cases(db, suppliers_df, size):
+    """Benchmark cases as (name, needs in-memory frames, callable returning rows processed)
+
+    In-memory cases receive (invoices, outstanding, typed invoices), loaded once untimed."""
+    _, max_date = db.get_date_range()
+    last_quarter = (datetime.strptime(max_date, '%Y-%m-%d') - timedelta(days=90)).strftime('%Y-%m-%d')
+    all_ids = suppliers_df['supplier_id'].tolist()
+    few_ids = all_ids[:max(1, len(all_ids) // 10)]
+
+    def processed(result):
+        return size
+
+    def stream_export(fmt):
+        with open(os.devnull, 'wb') as sink:
+            return export_invoices(db, fmt, sink)
+
+    return [
+        ('get_invoices[all]', False, lambda frames: len(db.get_invoices())),
+        ('get_invoices[last_90_days]', False, lambda frames: len(db.get_invoices(last_quarter, max_date))),
+        ('get_invoices[one_supplier]', False, lambda frames: len(db.get_invoices(supplier_ids=all_ids[:1]))),
+        ('get_invoices[10pct_suppliers+dates]', False, lambda frames: len(db.get_invoices(last_quarter, max_date, few_ids))),
+        ('get_invoices[all,typed]', False, lambda frames: len(db.get_invoices(typed=True))),
+        ('get_supplier_invoice_page[one_supplier]', False, lambda frames: len(db.get_supplier_invoice_page(all_ids[0], page_size=50)[0])),
+        ('get_outstanding[all]', False, lambda frames: len(db.get_outstanding())),
+        ('get_outstanding[10pct_suppliers]', False, lambda frames: len(db.get_outstanding(few_ids))),
+        ('calculate_overall_kpis', True, lambda frames: processed(calculate_overall_kpis(frames[0], frames[1]))),
+        ('calculate_supplier_kpis', True, lambda frames: processed(calculate_supplier_kpis(frames[0], frames[1], suppliers_df))),
+        ('monthly_trends[pandas]', True, lambda frames: processed(calculate_monthly_trends(frames[0]))),
+        ('calculate_supplier_kpis[typed]', True, lambda frames: processed(calculate_supplier_kpis(frames[2], frames[1], suppliers_df))),
+        ('monthly_trends[pandas,typed]', True, lambda frames: processed(calculate_monthly_trends(frames[2]))),
+        ('calculate_supplier_kpis[parallel]', False, lambda frames: processed(calculate_supplier_kpis_parallel(db))),
+        ('db.get_overall_kpis', False, lambda frames: processed(db.get_overall_kpis())),
+        ('db.get_supplier_kpis', False, lambda frames: processed(db.get_supplier_kpis(suppliers_df=suppliers_df))),
+        ('db.get_monthly_trends', False, lambda frames: processed(db.get_monthly_trends())),
+        ('payment_days_histogram[sql+numpy]', False, lambda frames: processed(histogram_bins(*db.get_payment_days_counts().to_numpy().T))),
+        ('export_csv[to_csv]', True, lambda frames: processed(frames[0].to_csv(index=False))),
+        ('export_csv[streaming]', False, lambda frames: stream_export('csv')),
+        ('export_parquet[streaming]', False, lambda frames: stream_export('parquet'))
+    ]
+
+def run_case(func, frames, repeat):
+    """Time a case, keeping the fastest wall time and the highest peak RSS"""
+    best = None
+    peak = 0
+    rows = 0
+    for _ in range(repeat):
+        with PeakRSS() as rss:
+            started = time.perf_counter()
+            rows = func(frames)
+            elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+        peak = max(peak, rss.peak - rss.start)
+    return best, peak, rows
+
+def ensure_parquet_store(db_path):
+    """Build the Parquet store for a benchmark database once, next to it"""
+    from parquet_backend import build_parquet_store
+    path = os.path.splitext(db_path)[0] + '.parquet'
+    if not os.path.exists(path):
+        print(f"Building Parquet store {path}...")
+        build_parquet_store(db_path, path)
+    return path
+
+def open_benchmark_backend(backend, db_path):
+    if backend == 'parquet':
+        from parquet_backend import ParquetDatabase
+        return ParquetDatabase(ensure_parquet_store(db_path))
+    return SupplierDatabase(db_path)
+
+def run_benchmarks(sizes, suppliers=200, repeat=3, cases=None, data_dir=DATA_DIR, backends=('sqlite',)):
+    """Run every case at every size against each backend and return the result records
+
+    In-memory cases don't depend on the backend and only run with the first one."""
+    results = []
+    for size in sizes:
+        db_path = ensure_dataset(size, suppliers, data_dir)
+        for position, backend in enumerate(backends):
+            db = open_benchmark_backend(backend, db_path)
+            suppliers_df = db.get_suppliers()
+            selected = [case for case in build_cases(db, suppliers_df, size)
+                        if (not cases or any(pattern in case[0] for pattern in cases)) and (position == 0 or not case[1])]
+            frames = None
+            if any(needs_frames for _, needs_frames, _ in selected):
+                invoices = db.get_invoices()
+                frames = (invoices, db.get_outstanding(), coerce_invoice_dtypes(invoices))
+            for name, _, func in selected:
+                wall, rss_delta, rows = run_case(func, frames, repeat)
+                results.append({
+                    'case': name,
+                    'backend': backend,
+                    'size': size,
+                    'wall_s': round(wall, 6),
+                    'peak_rss_delta_mb': round(rss_delta / 2 ** 20, 2),
+                    'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 2),
+                    'rows': int(rows),
+                    'rows_per_sec': round(rows / wall, 1) if wall > 0 else None
+                })
+                print(f"{name:<40} {backend:<8} {size:>12,} {wall * 1000:>11.2f} ms {rss_delta / 2 ** 20:>9.1f} MB {results[-1]['rows_per_sec'] or 0:>15,.0f} rows/s")
+            frames = None
+            db.close()
+    return results
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(__file__)).stdout.strip() or None
+    except OSError:
+        return None
+
+def compare(results, baseline, threshold=0.25, min_seconds=0.001):
+    """Return (case, size, baseline_s, current_s, ratio) for every case slower than the baseline allows"""
+    previous = {(r['case'], r.get('backend', 'sqlite'), r['size']): r['wall_s'] for r in baseline['results']}
+    regressions = []
+    for record in results:
+        before = previous.get((record['case'], record.get('backend', 'sqlite'), record['size']))
+        if before is None or max(before, record['wall_s']) < min_seconds:
+            continue
+        ratio = record['wall_s'] / before if before > 0 else float('inf')
+        if ratio > 1 + threshold:
+            backend = record.get('backend', 'sqlite')
+            label = record['case'] if backend == 'sqlite' else f"{record['case']} [{backend}]"
+            regressions.append((label, record['size'], before, record['wall_s'], ratio))
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark supplier dashboard data paths")
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help="invoice counts to benchmark")
+    parser.add_argument('--suppliers', type=int, default=200, help="suppliers in each generated dataset")
+    parser.add_argument('--repeat', type=int, default=3, help="runs per case; the fastest is kept")
+    parser.add_argument('--cases', nargs='*', help="only run cases whose name contains one of these strings")
+    parser.add_argument('--data-dir', default=DATA_DIR, help="where generated benchmark databases are kept")
+    parser.add_argument('--backends', nargs='+', choices=['sqlite', 'parquet'], default=['sqlite'], help="storage backends to compare")
+    parser.add_argument('--output', default=None, help="write JSON results to this file")
+    parser.add_argument('--baseline', default=None, help="JSON results to compare against")
+    parser.add_argument('--threshold', type=float, default=0.25, help="allowed slowdown before flagging (0.25 = 25%%)")
+    args = parser.parse_args(argv)
+
+    print(f"{'case':<40} {'backend':<8} {'invoices':>12} {'wall':>14} {'peak RSS +':>12} {'throughput':>22}")
+    results = run_benchmarks(args.sizes, args.suppliers, args.repeat, args.cases, args.data_dir, args.backends)
+    report = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'git_revision': git_revision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'suppliers': args.suppliers,
+            'repeat': args.repeat,
+            'backends': args.backends
+        },
+        'results': results
+    }
+    if args.output:
+        with open(args.output, 'w') as handle:
+            json.dump(report, handle, indent=2)
+        print(f"✓ Results saved to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as handle:
+            regressions = compare(results, json.load(handle), args.threshold)
+        for case, size, before, after, ratio in regressions:
+            print(f"REGRESSION {case} @ {size:,}: {before * 1000:.2f} ms -> {after * 1000:.2f} ms ({ratio:.2f}x)")
+        if regressions:
+            return 1
+        print(f"✓ No regressions beyond {args.threshold:.0%} against {args.baseline}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -4,9 +4,15 @@ Generates synthetic supplier performance data
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
+import argparse
+import os
 import random
+import time
 from faker import Faker
-import sqlite3
+from schema import connect, migrate, insert_rows, create_indexes, drop_indexes, bump_generation
+from rollup import rebuild_daily_stats
+from anomaly import rebuild_anomaly_state
+from snapshots import refresh_store_snapshots
 
 fake = Faker()
 random.seed(42)
@@ -71,31 +77,213 @@ def generate_outstanding(suppliers_df, n=50):
     return pd.DataFrame(outstanding)
 
 def save_to_sqlite(suppliers_df, invoices_df, outstanding_df, db_path='data/suppliers.db'):
-    """Save all data to SQLite database"""
-    import os
-    os.makedirs('data', exist_ok=True)
+    """Save all data to SQLite database, replacing existing rows in one transaction"""
+    os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
     
-    conn = sqlite3.connect(db_path)
+    conn = connect(db_path)
+    migrate(conn)
     
-    suppliers_df.to_sql('suppliers', conn, if_exists='replace', index=False)
-    invoices_df.to_sql('invoices', conn, if_exists='replace', index=False)
-    outstanding_df.to_sql('outstanding', conn, if_exists='replace', index=False)
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        for table, df in [('suppliers', suppliers_df), ('invoices', invoices_df), ('outstanding', outstanding_df)]:
+            conn.execute(f"DELETE FROM {table}")
+            insert_rows(conn, table, df)
+        rebuild_daily_stats(conn)
+        rebuild_anomaly_state(conn)
+        bump_generation(conn)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
     
+    conn.execute("PRAGMA optimize")
     conn.close()
     print(f"✓ Data saved to {db_path}")
 
-if __name__ == "__main__":
-    print("Generating synthetic data...")
-    suppliers_df = generate_suppliers(20)
-    invoices_df = generate_invoices(suppliers_df, 500)
-    outstanding_df = generate_outstanding(suppliers_df, 50)
+def _date_strings(start, offsets):
+    """Format day offsets from start as 'YYYY-MM-DD' via a lookup table of the distinct days"""
+    low = int(offsets.min())
+    table = np.datetime_as_string(start + np.arange(low, int(offsets.max()) + 1), unit='D')
+    return table[offsets - low]
+
+def generate_invoice_chunks(supplier_ids, n=500, chunk_size=250_000, seed=42, start_date=None, days=365):
+    """Yield invoice DataFrames of at most chunk_size rows, generated with NumPy
     
-    save_to_sqlite(suppliers_df, invoices_df, outstanding_df)
+    Same columns and distributions as generate_invoices. Output is reproducible for a
+    given seed, chunk_size and start_date (default: 365 days before today)."""
+    rng = np.random.default_rng(seed)
+    supplier_ids = np.asarray(supplier_ids)
+    if start_date is None:
+        start_date = (datetime.now() - timedelta(days=365)).strftime('%Y-%m-%d')
+    start = np.datetime64(start_date, 'D')
+    width = max(5, len(str(n)))
     
-    invoices_df.to_csv('data/sample_export.csv', index=False)
-    print("✓ Sample CSV exported to data/sample_export.csv")
+    for offset in range(0, n, chunk_size):
+        size = min(chunk_size, n - offset)
+        invoice_day = rng.integers(0, days + 1, size)
+        payment_day = invoice_day + 30 + rng.integers(-5, 16, size)
+        expected_day = invoice_day + rng.integers(5, 16, size)
+        actual_day = expected_day + rng.integers(-3, 11, size)
+        numbers = np.arange(offset + 1, offset + size + 1).astype(f'U{width}')
+        
+        yield pd.DataFrame({
+            'invoice_id': np.char.add('INV', np.char.zfill(numbers, width)),
+            'supplier_id': supplier_ids[rng.integers(0, len(supplier_ids), size)],
+            'invoice_date': _date_strings(start, invoice_day),
+            'due_date': _date_strings(start, invoice_day + 30),
+            'payment_date': _date_strings(start, payment_day),
+            'expected_delivery_date': _date_strings(start, expected_day),
+            'actual_delivery_date': _date_strings(start, actual_day),
+            'invoice_amount': np.round(rng.uniform(1000, 50000, size), 2),
+            'is_accurate': (rng.random(size) > 0.15).astype('int64'),
+            'is_rejected': (rng.random(size) < 0.08).astype('int64'),
+            'payment_days': payment_day - invoice_day,
+            'delivery_delay_days': actual_day - expected_day
+        })
+
+def generate_outstanding_vectorized(supplier_ids, n=50, seed=42):
+    """Generate outstanding payment data with NumPy"""
+    rng = np.random.default_rng(seed)
+    supplier_ids = np.asarray(supplier_ids)
+    return pd.DataFrame({
+        'supplier_id': supplier_ids[rng.integers(0, len(supplier_ids), n)],
+        'outstanding_amount': np.round(rng.uniform(5000, 100000, n), 2),
+        'aging_days': rng.integers(0, 121, n)
+    })
+
+class ParquetChunkWriter:
+    """Append invoice chunks to a single Parquet file (requires pyarrow)"""
+    
+    def __init__(self, path):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as exc:
+            raise RuntimeError("Parquet output needs pyarrow: pip install pyarrow") from exc
+        self._pa = pa
+        self._pq = pq
+        self.path = path
+        self._writer = None
+    
+    def write(self, chunk):
+        table = self._pa.Table.from_pandas(chunk, preserve_index=False)
+        if self._writer is None:
+            self._writer = self._pq.ParquetWriter(self.path, table.schema, compression='zstd')
+        self._writer.write_table(table)
+    
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+
+def generate_dataset(n_suppliers=20, n_invoices=500, n_outstanding=50, db_path='data/suppliers.db',
+                     csv_path=None, parquet_path=None, chunk_size=250_000, seed=42, start_date=None, days=365, progress=None):
+    """Generate a dataset chunk by chunk, streaming invoices into SQLite, CSV and/or Parquet
+    
+    Only one chunk of invoices is held in memory at a time. The SQLite load runs as
+    one transaction: it drops the secondary indexes, appends every chunk and rebuilds
+    the indexes, the daily rollup and the anomaly state before committing. Readers
+    keep seeing the previous data until then, and a failed load rolls back to it.
+    progress(report) is called after every chunk with the invoices written so far,
+    the total, seconds and rows_per_second."""
+    random.seed(seed)
+    Faker.seed(seed)
+    suppliers_df = generate_suppliers(n_suppliers)
+    outstanding_df = generate_outstanding_vectorized(suppliers_df['supplier_id'], n_outstanding, seed)
+    chunks = generate_invoice_chunks(suppliers_df['supplier_id'], n_invoices, chunk_size, seed, start_date, days)
+    
+    for path in [db_path, csv_path, parquet_path]:
+        if path:
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    parquet = ParquetChunkWriter(parquet_path) if parquet_path else None
+    conn = None
+    started = time.perf_counter()
+    report = {'written': 0, 'total': n_invoices, 'seconds': 0.0, 'rows_per_second': 0.0}
+    try:
+        if db_path:
+            conn = connect(db_path)
+            migrate(conn)
+            # Let index builds spill their sorts to disk and keep file pages out of RSS
+            conn.execute("PRAGMA temp_store = FILE")
+            conn.execute("PRAGMA mmap_size = 0")
+            conn.execute("BEGIN IMMEDIATE")
+            for table in ['invoices', 'outstanding', 'suppliers', 'daily_supplier_stats', 'supplier_anomaly_state']:
+                conn.execute(f"DELETE FROM {table}")
+            drop_indexes(conn)
+            insert_rows(conn, 'suppliers', suppliers_df)
+            insert_rows(conn, 'outstanding', outstanding_df)
+        
+        for number, chunk in enumerate(chunks):
+            if conn is not None:
+                insert_rows(conn, 'invoices', chunk)
+            if csv_path:
+                chunk.to_csv(csv_path, mode='w' if number == 0 else 'a', header=number == 0, index=False)
+            if parquet is not None:
+                parquet.write(chunk)
+            report['written'] += len(chunk)
+            report['seconds'] = time.perf_counter() - started
+            report['rows_per_second'] = report['written'] / report['seconds'] if report['seconds'] else 0.0
+            if progress is not None:
+                progress(report)
+        
+        if conn is not None:
+            create_indexes(conn)
+            rebuild_daily_stats(conn)
+            rebuild_anomaly_state(conn)
+            bump_generation(conn)
+            conn.commit()
+            conn.execute("PRAGMA optimize")
+    except Exception:
+        if conn is not None and conn.in_transaction:
+            conn.rollback()
+        raise
+    finally:
+        if parquet is not None:
+            parquet.close()
+        if conn is not None:
+            conn.close()
+    return suppliers_df, report['written'], outstanding_df
+
+def main(argv=None):
+    """Command-line entry point; the defaults reproduce the original 20/500/50 sample dataset"""
+    parser = argparse.ArgumentParser(description="Generate synthetic supplier performance data")
+    parser.add_argument('--suppliers', type=int, default=20, help="number of suppliers")
+    parser.add_argument('--invoices', type=int, default=500, help="number of invoices")
+    parser.add_argument('--outstanding', type=int, default=50, help="number of outstanding records")
+    parser.add_argument('--db', default='data/suppliers.db', help="SQLite database to create")
+    parser.add_argument('--replace', action='store_true', help="replace the data in an existing --db")
+    parser.add_argument('--csv', default='data/sample_export.csv', help="CSV file for the invoices")
+    parser.add_argument('--no-csv', action='store_true', help="skip the CSV export")
+    parser.add_argument('--parquet', default=None, help="optional Parquet file for the invoices")
+    parser.add_argument('--chunk-size', type=int, default=250_000, help="invoices generated and written per chunk")
+    parser.add_argument('--seed', type=int, default=42, help="random seed")
+    parser.add_argument('--start-date', default=None, help="first invoice date (default: 365 days ago)")
+    parser.add_argument('--days', type=int, default=365, help="number of days the invoices span")
+    args = parser.parse_args(argv)
+    if args.db and os.path.exists(args.db) and not args.replace:
+        parser.error(f"{args.db} already exists; pass --replace to overwrite its data, or choose another --db")
+    
+    def show(report):
+        print(f"  {report['written']:,}/{report['total']:,} invoices ({report['rows_per_second']:,.0f} rows/sec)", end='\r')
+    
+    print("Generating synthetic data...")
+    csv_path = None if args.no_csv else args.csv
+    suppliers_df, invoice_count, outstanding_df = generate_dataset(
+        args.suppliers, args.invoices, args.outstanding, args.db, csv_path, args.parquet,
+        args.chunk_size, args.seed, args.start_date, args.days, show
+    )
+    print()
+    print(f"✓ Data saved to {args.db}")
+    if args.db and refresh_store_snapshots('sqlite', args.db):
+        print("✓ Preset KPI snapshots refreshed")
+    if csv_path:
+        print(f"✓ Sample CSV exported to {csv_path}")
+    if args.parquet:
+        print(f"✓ Parquet exported to {args.parquet}")
     
     print("\nData Summary:")
     print(f"Suppliers: {len(suppliers_df)}")
-    print(f"Invoices: {len(invoices_df)}")
-    print(f"Outstanding records: {len(outstanding_df)}")
\ No newline at end of file
+    print(f"Invoices: {invoice_count}")
+    print(f"Outstanding records: {len(outstanding_df)}")
+
+if __name__ == "__main__":
+    main()
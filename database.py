@@ -1,66 +1,330 @@
 """
 Database operations for supplier dashboard
 """
-import sqlite3
+import os
+import queue
+import threading
+from contextlib import contextmanager
+from urllib.request import pathname2url
 import pandas as pd
+from schema import connect, migrate, read_generation, INVOICE_STATS_SELECT
+from instrumentation import span, traced
+from kpi_calculator import INVOICE_STAT_COLUMNS
+from anomaly import ANOMALY_STATE_COLUMNS
+from storage import StorageBackend
 
-class SupplierDatabase:
-    def __init__(self, db_path='data/suppliers.db'):
+DAILY_STATS_SELECT = """
+    COALESCE(SUM(invoice_count), 0) AS invoice_count,
+    COALESCE(SUM(on_time_count), 0) AS on_time_count,
+    COALESCE(SUM(accurate_count), 0) AS accurate_count,
+    COALESCE(SUM(rejected_count), 0) AS rejected_count,
+    COALESCE(SUM(payment_days_sum), 0.0) AS payment_days_sum,
+    COALESCE(SUM(amount_sum), 0.0) AS amount_sum
+"""
+
+# Schema contract for typed invoice frames (typed=True):
+#   invoice_id                  str
+#   supplier_id                 category
+#   *_date (INVOICE_DATE_COLUMNS) datetime64[ns], NaT when missing
+#   invoice_amount              float64
+#   is_accurate, is_rejected    uint8 (0/1, so sums and exports are unchanged)
+#   payment_days, delivery_delay_days  int16 (nullable Int16 when a value is missing)
+INVOICE_DATE_COLUMNS = ['invoice_date', 'due_date', 'payment_date', 'expected_delivery_date', 'actual_delivery_date']
+INVOICE_FLAG_COLUMNS = ['is_accurate', 'is_rejected']
+INVOICE_DAY_COLUMNS = ['payment_days', 'delivery_delay_days']
+
+def coerce_invoice_dtypes(df):
+    """Convert an invoice frame read from SQLite to the compact typed schema"""
+    df = df.copy(deep=False)
+    for col in INVOICE_DATE_COLUMNS:
+        if col in df:
+            df[col] = pd.to_datetime(df[col], format='%Y-%m-%d')
+    if 'supplier_id' in df:
+        df['supplier_id'] = df['supplier_id'].astype('category')
+    for col in INVOICE_FLAG_COLUMNS:
+        if col in df:
+            df[col] = df[col].astype('uint8')
+    for col in INVOICE_DAY_COLUMNS:
+        if col in df:
+            df[col] = df[col].astype('Int16' if df[col].isna().any() else 'int16')
+    if 'invoice_amount' in df:
+        df['invoice_amount'] = df['invoice_amount'].astype('float64')
+    return df
+
+STATS_GROUPINGS = {
+    'supplier_id': 'supplier_id',
+    'month': 'substr(invoice_date, 1, 7)'
+}
+
+class ConnectionPool:
+    """Thread-safe pool of reusable read-only SQLite connections"""
+    
+    def __init__(self, db_path, size=4, cached_statements=128, timeout=30):
         self.db_path = db_path
+        self.size = size
+        self.cached_statements = cached_statements
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self._closed = False
+    
+    def _open(self):
+        """Open a read-only connection that may be handed between threads"""
+        uri = f"file:{pathname2url(os.path.abspath(self.db_path))}?mode=ro"
+        return connect(uri, uri=True, check_same_thread=False, cached_statements=self.cached_statements)
+    
+    @contextmanager
+    def connection(self):
+        """Borrow a connection, waiting for a free slot when all are in use"""
+        if self._closed:
+            raise RuntimeError("Connection pool is closed")
+        if not self._slots.acquire(timeout=self.timeout):
+            raise TimeoutError(f"No database connection free after {self.timeout}s")
+        try:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                conn = self._open()
+            try:
+                yield conn
+            finally:
+                if conn.in_transaction:
+                    conn.rollback()
+                self._idle.put(conn)
+        finally:
+            self._slots.release()
+    
+    def close(self):
+        """Close every idle connection"""
+        self._closed = True
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+class SupplierDatabase(StorageBackend):
+    kind = 'sqlite'
+    
+    def __init__(self, db_path='data/suppliers.db', pool_size=4, cached_statements=128, use_rollup=True):
+        """pool_size=0 disables pooling and opens a fresh connection per query;
+        use_rollup answers KPI queries from daily_supplier_stats when the table exists"""
+        self.db_path = db_path
+        self.use_rollup = use_rollup
+        self._rollup_ready = False
+        self.pool = ConnectionPool(db_path, pool_size, cached_statements) if pool_size > 0 else None
+        self._version_conn = None
+        self._version_lock = threading.Lock()
+    
+    @property
+    def location(self):
+        return self.db_path
     
     def get_connection(self):
         """Create database connection"""
-        return sqlite3.connect(self.db_path)
+        return connect(self.db_path)
     
-    def get_suppliers(self):
-        """Get all suppliers"""
+    @contextmanager
+    def read_connection(self):
+        """Borrow a pooled read-only connection, or open a temporary one without a pool"""
+        if self.pool is None:
+            conn = self.get_connection()
+            try:
+                yield conn
+            finally:
+                conn.close()
+        else:
+            with self.pool.connection() as conn:
+                yield conn
+    
+    def close(self):
+        """Release pooled connections"""
+        with self._version_lock:
+            if self._version_conn is not None:
+                self._version_conn.close()
+                self._version_conn = None
+        if self.pool is not None:
+            self.pool.close()
+    
+    def data_version(self):
+        """PRAGMA data_version from a long-lived connection; it changes whenever another connection commits"""
+        with self._version_lock:
+            if self._version_conn is None:
+                self._version_conn = connect(self.db_path, check_same_thread=False)
+            return self._version_conn.execute("PRAGMA data_version").fetchone()[0]
+    
+    def data_generation(self):
+        """The generation counter the writers bump in each data-changing transaction"""
+        with self.read_connection() as conn:
+            return read_generation(conn)
+    
+    def _read_sql(self, query, params=None):
+        """Run a read query and return the result as a DataFrame"""
+        with span('sqlite', ' '.join(query.split())[:200]) as record:
+            with self.read_connection() as conn:
+                df = pd.read_sql_query(query, conn, params=params)
+            record.rows = len(df)
+            return df
+    
+    def migrate(self):
+        """Create or upgrade tables and indexes to the current schema"""
         conn = self.get_connection()
-        df = pd.read_sql_query("SELECT * FROM suppliers", conn)
+        version = migrate(conn)
         conn.close()
-        return df
+        return version
     
-    def get_invoices(self, start_date=None, end_date=None, supplier_ids=None):
-        """Get invoices with optional filters"""
-        conn = self.get_connection()
-        query = "SELECT * FROM invoices WHERE 1=1"
+    def _supplier_filter(self, supplier_ids):
+        """Build the supplier_id IN (...) clause and its params"""
+        if supplier_ids is not None:
+            placeholders = ','.join('?' * len(supplier_ids))
+            return f" AND supplier_id IN ({placeholders})", list(supplier_ids)
+        return "", []
+    
+    def _invoice_filter(self, start_date=None, end_date=None, supplier_ids=None):
+        """Build the WHERE clause shared by every invoice query"""
+        where = " WHERE 1=1"
         params = []
         
         if start_date:
-            query += " AND invoice_date >= ?"
+            where += " AND invoice_date >= ?"
             params.append(start_date)
         
         if end_date:
-            query += " AND invoice_date <= ?"
+            where += " AND invoice_date <= ?"
             params.append(end_date)
         
-        if supplier_ids and len(supplier_ids) > 0:
-            placeholders = ','.join('?' * len(supplier_ids))
-            query += f" AND supplier_id IN ({placeholders})"
-            params.extend(supplier_ids)
+        supplier_clause, supplier_params = self._supplier_filter(supplier_ids)
+        return where + supplier_clause, params + supplier_params
+    
+    @traced
+    def get_suppliers(self):
+        """Get all suppliers"""
+        return self._read_sql("SELECT * FROM suppliers")
+    
+    @traced
+    def get_invoices(self, start_date=None, end_date=None, supplier_ids=None, typed=False):
+        """Get invoices with optional filters in load (rowid) order; typed=True applies coerce_invoice_dtypes
         
-        df = pd.read_sql_query(query, conn, params=params)
-        conn.close()
-        return df
+        The order doesn't depend on the query plan, so float sums over any filtered
+        subset add a supplier's rows in the same order as over the whole table."""
+        where, params = self._invoice_filter(start_date, end_date, supplier_ids)
+        df = self._read_sql("SELECT * FROM invoices" + where + " ORDER BY rowid", params)
+        return coerce_invoice_dtypes(df) if typed else df
     
-    def get_outstanding(self, supplier_ids=None):
-        """Get outstanding amounts"""
-        conn = self.get_connection()
-        query = "SELECT * FROM outstanding WHERE 1=1"
-        params = []
+    def iter_invoices(self, start_date=None, end_date=None, supplier_ids=None, chunk_size=50_000, typed=False):
+        """Yield filtered invoices as DataFrames of at most chunk_size rows, in the same order as get_invoices"""
+        where, params = self._invoice_filter(start_date, end_date, supplier_ids)
+        with self.read_connection() as conn:
+            for chunk in pd.read_sql_query("SELECT * FROM invoices" + where + " ORDER BY rowid", conn, params=params, chunksize=chunk_size):
+                yield coerce_invoice_dtypes(chunk) if typed else chunk
+    
+    @traced
+    def get_supplier_invoice_page(self, supplier_id, start_date=None, end_date=None, after=None, page_size=20, descending=True, typed=False):
+        """Get one page of a supplier's invoices ordered by (invoice_date, invoice_id)
         
-        if supplier_ids and len(supplier_ids) > 0:
-            placeholders = ','.join('?' * len(supplier_ids))
-            query += f" AND supplier_id IN ({placeholders})"
-            params.extend(supplier_ids)
+        after is the (invoice_date, invoice_id) key of the previous page's last row, or None
+        for the first page. Returns (page, key of its last row, or None if no rows follow)."""
+        where, params = self._invoice_filter(start_date, end_date, [supplier_id])
+        direction = 'DESC' if descending else 'ASC'
+        if after is not None:
+            where += f" AND (invoice_date, invoice_id) {'<' if descending else '>'} (?, ?)"
+            params += list(after)
+        query = f"SELECT * FROM invoices{where} ORDER BY invoice_date {direction}, invoice_id {direction} LIMIT ?"
+        df = self._read_sql(query, params + [page_size + 1])
         
-        df = pd.read_sql_query(query, conn, params=params)
-        conn.close()
-        return df
+        next_key = None
+        if len(df) > page_size:
+            df = df.iloc[:page_size]
+            next_key = (df['invoice_date'].iloc[-1], df['invoice_id'].iloc[-1])
+        return (coerce_invoice_dtypes(df) if typed else df), next_key
     
+    @traced
+    def get_outstanding(self, supplier_ids=None):
+        """Get outstanding amounts"""
+        where, params = self._supplier_filter(supplier_ids)
+        return self._read_sql("SELECT supplier_id, outstanding_amount, aging_days FROM outstanding WHERE 1=1" + where, params)
+    
+    @traced
     def get_date_range(self):
         """Get min and max invoice dates"""
-        conn = self.get_connection()
         query = "SELECT MIN(invoice_date) as min_date, MAX(invoice_date) as max_date FROM invoices"
-        df = pd.read_sql_query(query, conn)
-        conn.close()
-        return df.iloc[0]['min_date'], df.iloc[0]['max_date']
\ No newline at end of file
+        df = self._read_sql(query)
+        return df.iloc[0]['min_date'], df.iloc[0]['max_date']
+    
+    def has_rollup(self):
+        """Whether KPI queries can be answered from the daily_supplier_stats rollup"""
+        if self.use_rollup and not self._rollup_ready:
+            tables = self._read_sql("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'daily_supplier_stats'")
+            self._rollup_ready = len(tables) > 0
+        return self.use_rollup and self._rollup_ready
+    
+    @traced
+    def get_daily_stats(self, start_date=None, end_date=None, supplier_ids=None):
+        """Get supplier x day rollup rows with optional filters"""
+        where, params = self._invoice_filter(start_date, end_date, supplier_ids)
+        if self.has_rollup():
+            return self._read_sql("SELECT * FROM daily_supplier_stats" + where, params)
+        query = f"SELECT supplier_id, invoice_date, {INVOICE_STATS_SELECT} FROM invoices{where} GROUP BY supplier_id, invoice_date"
+        return self._read_sql(query, params)
+    
+    @traced
+    def get_anomaly_state(self):
+        """Read the anomaly state that the writers keep up to date, one row per supplier"""
+        if not len(self._read_sql("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'supplier_anomaly_state'")):
+            return super().get_anomaly_state()
+        return self._read_sql(f"SELECT {', '.join(ANOMALY_STATE_COLUMNS)} FROM supplier_anomaly_state ORDER BY supplier_id")
+    
+    @traced
+    def get_invoice_stats(self, start_date=None, end_date=None, supplier_ids=None, group_by=None):
+        """Get additive invoice counts and sums, optionally grouped by 'supplier_id' or 'month'"""
+        where, params = self._invoice_filter(start_date, end_date, supplier_ids)
+        if self.has_rollup():
+            table, select = 'daily_supplier_stats', DAILY_STATS_SELECT
+        else:
+            table, select = 'invoices', INVOICE_STATS_SELECT
+        if group_by is None:
+            query = f"SELECT {select} FROM {table}{where}"
+        elif group_by in STATS_GROUPINGS:
+            key = STATS_GROUPINGS[group_by]
+            query = f"SELECT {key} AS {group_by}, {select} FROM {table}{where} GROUP BY {key}"
+        else:
+            raise ValueError(f"Unsupported group_by: {group_by}")
+        
+        df = self._read_sql(query, params)
+        if group_by is None:
+            return df.iloc[0][INVOICE_STAT_COLUMNS]
+        return df.set_index(group_by)[INVOICE_STAT_COLUMNS]
+    
+    @traced
+    def get_outstanding_stats(self, supplier_ids=None, group_by=None):
+        """Get outstanding counts and sums, optionally grouped by supplier_id"""
+        where, params = self._supplier_filter(supplier_ids)
+        select = "COUNT(*) AS outstanding_count, COALESCE(SUM(outstanding_amount), 0.0) AS outstanding_sum"
+        if group_by is None:
+            query = f"SELECT {select} FROM outstanding WHERE 1=1{where}"
+        elif group_by == 'supplier_id':
+            query = f"SELECT supplier_id, {select} FROM outstanding WHERE 1=1{where} GROUP BY supplier_id"
+        else:
+            raise ValueError(f"Unsupported group_by: {group_by}")
+        
+        df = self._read_sql(query, params)
+        if group_by is None:
+            return df.iloc[0]
+        return df.set_index('supplier_id')
+    
+    @traced
+    def get_payment_days_counts(self, start_date=None, end_date=None, supplier_ids=None):
+        """Get the number of invoices for each payment_days value"""
+        where, params = self._invoice_filter(start_date, end_date, supplier_ids)
+        query = f"SELECT payment_days, COUNT(*) AS invoice_count FROM invoices{where} GROUP BY payment_days"
+        return self._read_sql(query, params)
+    
+    @traced
+    def get_day_counts(self, column, start_date=None, end_date=None, supplier_ids=None, by_supplier=False):
+        """Get the number of invoices for each non-missing value of a day column, optionally per supplier"""
+        if column not in INVOICE_DAY_COLUMNS:
+            raise ValueError(f"Unsupported day column: {column}")
+        where, params = self._invoice_filter(start_date, end_date, supplier_ids)
+        keys = f"supplier_id, {column}" if by_supplier else column
+        query = f"SELECT {keys}, COUNT(*) AS invoice_count FROM invoices{where} AND {column} IS NOT NULL GROUP BY {keys}"
+        return self._read_sql(query, params)
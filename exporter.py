@@ -0,0 +1,141 @@
+"""
+Streaming export of invoices and KPI tables to CSV, gzip CSV, Parquet and Excel
+
+Invoices are read from SQLite in chunks and appended to the output as they
+arrive, so memory stays bounded by the chunk size, not the number of rows. That
+holds for files and the command line; dashboard downloads end up in memory.
+Run with: python exporter.py --format parquet --output invoices.parquet
+"""
+import argparse
+import gzip
+import io
+import os
+import sys
+import tempfile
+
+EXPORT_FORMATS = {
+    'csv': {'label': 'CSV', 'extension': 'csv', 'mime': 'text/csv'},
+    'csv.gz': {'label': 'CSV (gzip)', 'extension': 'csv.gz', 'mime': 'application/gzip'},
+    'parquet': {'label': 'Parquet', 'extension': 'parquet', 'mime': 'application/vnd.apache.parquet'},
+    'xlsx': {'label': 'Excel', 'extension': 'xlsx', 'mime': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'}
+}
+
+EXCEL_MAX_ROWS = 1_048_576
+
+# Exports up to this size stay in memory; larger ones spill to a temporary file
+SPOOL_MAX_BYTES = 16 * 1024 * 1024
+
+def _write_csv(chunks, fileobj):
+    text = io.TextIOWrapper(fileobj, encoding='utf-8', newline='', write_through=True)
+    rows = 0
+    for chunk in chunks:
+        chunk.to_csv(text, header=rows == 0, index=False)
+        rows += len(chunk)
+    text.flush()
+    text.detach()
+    return rows
+
+def _write_csv_gzip(chunks, fileobj):
+    with gzip.GzipFile(fileobj=fileobj, mode='wb', compresslevel=6) as compressed:
+        return _write_csv(chunks, compressed)
+
+def _write_parquet(chunks, fileobj):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as exc:
+        raise RuntimeError("Parquet export needs pyarrow: pip install pyarrow") from exc
+    from parquet_backend import invoice_schema
+    declared = {field.name: field for field in invoice_schema()}
+    writer = None
+    rows = 0
+    try:
+        for chunk in chunks:
+            table = pa.Table.from_pandas(chunk, preserve_index=False)
+            if writer is None:
+                # An all-NULL column in the first chunk infers as type null, which later chunks can't be cast to
+                schema = pa.schema([declared.get(field.name, field) if pa.types.is_null(field.type) else field for field in table.schema])
+                writer = pq.ParquetWriter(fileobj, schema, compression='zstd')
+            writer.write_table(table.cast(writer.schema))
+            rows += len(chunk)
+    finally:
+        if writer is not None:
+            writer.close()
+    return rows
+
+def _write_excel(chunks, fileobj):
+    from openpyxl import Workbook
+    workbook = Workbook(write_only=True)
+    sheet = None
+    sheet_rows = 0
+    rows = 0
+    for chunk in chunks:
+        for record in chunk.itertuples(index=False, name=None):
+            if sheet is None or sheet_rows >= EXCEL_MAX_ROWS:
+                sheet = workbook.create_sheet(f"Data {len(workbook.worksheets) + 1}" if sheet else "Data")
+                sheet.append(list(chunk.columns))
+                sheet_rows = 1
+            sheet.append(list(record))
+            sheet_rows += 1
+            rows += 1
+    if sheet is None:
+        workbook.create_sheet("Data")
+    workbook.save(fileobj)
+    return rows
+
+WRITERS = {
+    'csv': _write_csv,
+    'csv.gz': _write_csv_gzip,
+    'parquet': _write_parquet,
+    'xlsx': _write_excel
+}
+
+def write_chunks(chunks, fmt, fileobj):
+    """Write an iterable of DataFrames to a binary file object; returns the row count"""
+    if fmt not in WRITERS:
+        raise ValueError(f"Unsupported export format: {fmt}")
+    return WRITERS[fmt](iter(chunks), fileobj)
+
+def export_invoices(db, fmt, fileobj, start_date=None, end_date=None, supplier_ids=None, chunk_size=50_000):
+    """Stream filtered invoices from the database into fileobj"""
+    return write_chunks(db.iter_invoices(start_date, end_date, supplier_ids, chunk_size), fmt, fileobj)
+
+def export_to_bytes(write, spool_max_bytes=SPOOL_MAX_BYTES):
+    """Run write(fileobj) against a spooled temp file and return its contents
+    
+    For st.download_button callables, which must return bytes (or a BytesIO/BufferedReader).
+    Streamlit keeps the whole payload in memory to serve it, so only the writing is
+    bounded here; large invoice exports belong on the command line."""
+    with tempfile.SpooledTemporaryFile(max_size=spool_max_bytes) as fileobj:
+        write(fileobj)
+        fileobj.seek(0)
+        return fileobj.read()
+
+def export_file_name(prefix, fmt, stamp):
+    """File name such as invoice_details_20240101.csv.gz"""
+    return f"{prefix}_{stamp}.{EXPORT_FORMATS[fmt]['extension']}"
+
+def main(argv=None):
+    from database import SupplierDatabase
+    parser = argparse.ArgumentParser(description="Export invoices without loading them all into memory")
+    parser.add_argument('--db', default='data/suppliers.db', help="SQLite database to read")
+    parser.add_argument('--format', choices=list(EXPORT_FORMATS), default='csv', help="output format")
+    parser.add_argument('--output', required=True, help="file to write, or - for stdout")
+    parser.add_argument('--start-date', default=None, help="first invoice date (YYYY-MM-DD)")
+    parser.add_argument('--end-date', default=None, help="last invoice date (YYYY-MM-DD)")
+    parser.add_argument('--supplier', action='append', dest='supplier_ids', help="supplier_id to include; repeatable")
+    parser.add_argument('--chunk-size', type=int, default=50_000, help="rows read from SQLite per chunk")
+    args = parser.parse_args(argv)
+    
+    db = SupplierDatabase(args.db, pool_size=1)
+    if args.output == '-':
+        rows = export_invoices(db, args.format, sys.stdout.buffer, args.start_date, args.end_date, args.supplier_ids, args.chunk_size)
+    else:
+        os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+        with open(args.output, 'wb') as fileobj:
+            rows = export_invoices(db, args.format, fileobj, args.start_date, args.end_date, args.supplier_ids, args.chunk_size)
+    db.close()
+    print(f"✓ Exported {rows:,} invoices to {args.output}", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+"""
+Filter resolution shared by the dashboard sidebar and the JSON API
+"""
+from datetime import datetime, timedelta
+
+ALL_SUPPLIERS = 'All Suppliers'
+ALL_CATEGORIES = 'All Categories'
+
+# Sidebar periods ending at the latest invoice date; the preset snapshots cover the same windows
+FULL_RANGE = 'Full range'
+PERIODS = {'Last 30 days': 30, 'Last 90 days': 90, 'Last 365 days': 365}
+
+def parse_date(value, name='date'):
+    """Validate an optional 'YYYY-MM-DD' filter value"""
+    if value in (None, ''):
+        return None
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').strftime('%Y-%m-%d')
+    except (TypeError, ValueError):
+        raise ValueError(f"{name} must be a YYYY-MM-DD date, got {value!r}")
+
+def period_start(min_date, max_date, days):
+    """First day of the `days`-day window ending at max_date, not before min_date ('YYYY-MM-DD')"""
+    start = datetime.strptime(max_date, '%Y-%m-%d') - timedelta(days=days - 1)
+    return max(min_date, start.strftime('%Y-%m-%d'))
+
+def resolve_supplier_filter(suppliers_df, supplier_names=None, category=None, supplier_ids=None):
+    """Turn supplier name, id and category selections into (supplier_ids, filtered suppliers)
+    
+    supplier_ids is None when every supplier is selected. Names and ids are combined;
+    'All Suppliers' among the names, or no selection, means no supplier restriction.
+    A selection that matches no supplier, e.g. suppliers outside the chosen category,
+    gives an empty list, which the backends treat as no rows."""
+    selected = None
+    if supplier_names and ALL_SUPPLIERS not in supplier_names:
+        selected = suppliers_df[suppliers_df['supplier_name'].isin(supplier_names)]['supplier_id'].tolist()
+    if supplier_ids:
+        selected = (selected or []) + [sid for sid in supplier_ids if sid not in (selected or [])]
+    
+    if category and category != ALL_CATEGORIES:
+        in_category = suppliers_df[suppliers_df['category'] == category]['supplier_id'].tolist()
+        if selected is None:
+            selected = in_category
+        else:
+            selected = [sid for sid in selected if sid in in_category]
+    
+    if selected is None:
+        return None, suppliers_df
+    return selected, suppliers_df[suppliers_df['supplier_id'].isin(selected)]
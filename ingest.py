@@ -0,0 +1,222 @@
+"""
+Incremental invoice ingestion from CSV and Parquet files
+
+Files in the layout of data/sample_export.csv are read in chunks, validated and
+upserted by invoice_id. Each chunk commits in its own short transaction together
+with the rollup rows it touched, so dashboard readers (WAL snapshots) keep being
+served and never see invoices and daily_supplier_stats out of step.
+Run with: python ingest.py data/erp_drop.csv
+"""
+import argparse
+import os
+import sys
+import time
+import numpy as np
+import pandas as pd
+from schema import TABLE_COLUMNS, connect, migrate, insert_rows, bump_generation
+from rollup import refresh_supplier_days
+from anomaly import settled_daily_stats, update_anomaly_state
+from snapshots import refresh_store_snapshots
+from database import INVOICE_DATE_COLUMNS, INVOICE_FLAG_COLUMNS, INVOICE_DAY_COLUMNS
+
+INVOICE_COLUMNS = TABLE_COLUMNS['invoices']
+REQUIRED_COLUMNS = ['invoice_id', 'supplier_id', 'invoice_date', 'invoice_amount', 'is_accurate', 'is_rejected']
+
+# A staged row equal to the stored invoice; IS compares NULLs as equal
+_STAGED_COLUMNS = ', '.join(INVOICE_COLUMNS)
+_UNCHANGED = f"({', '.join('i.' + col for col in INVOICE_COLUMNS)}) IS ({', '.join('s.' + col for col in INVOICE_COLUMNS)})"
+_UPSERT = f"""
+    INSERT INTO invoices ({_STAGED_COLUMNS})
+    SELECT {_STAGED_COLUMNS} FROM temp.ingest_invoices WHERE true
+    ON CONFLICT (invoice_id) DO UPDATE SET
+    {', '.join(f'{col} = excluded.{col}' for col in INVOICE_COLUMNS[1:])}
+"""
+
+def read_chunks(path, chunk_size=50_000):
+    """Yield DataFrames of at most chunk_size rows from a CSV (optionally compressed) or Parquet file"""
+    if path.endswith(('.parquet', '.pq')):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError as exc:
+            raise RuntimeError("Parquet ingestion needs pyarrow: pip install pyarrow") from exc
+        parquet = pq.ParquetFile(path)
+        columns = [col for col in INVOICE_COLUMNS if col in parquet.schema_arrow.names]
+        for batch in parquet.iter_batches(batch_size=chunk_size, columns=columns):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(
+            path, chunksize=chunk_size, usecols=lambda col: col in INVOICE_COLUMNS,
+            dtype={'invoice_id': 'str', 'supplier_id': 'str'}
+        )
+
+def _nullable(values):
+    """Object column with None for missing values, which sqlite3 binds as NULL"""
+    return values.astype(object).where(values.notna(), None)
+
+def validate_chunk(df, known_suppliers=None):
+    """Normalize a raw chunk to the invoices schema
+    
+    Returns (valid, rejected): valid has the invoices columns with one row per
+    invoice_id (the last one wins); rejected keeps the raw rows plus a reject_reason.
+    Invoice dates after today are rejected."""
+    missing = [col for col in REQUIRED_COLUMNS if col not in df.columns]
+    if missing:
+        raise ValueError(f"Missing required invoice columns: {', '.join(missing)}")
+    
+    out = pd.DataFrame(index=df.index)
+    reason = pd.Series(None, index=df.index, dtype=object)
+    
+    def reject(mask, text):
+        reason[mask & reason.isna()] = text
+    
+    for col in ['invoice_id', 'supplier_id']:
+        # Check for missing ids before the conversion, which turns them into 'nan' or 'None'
+        out[col] = df[col].astype('str').str.strip()
+        reject(df[col].isna() | (out[col] == ''), f"missing {col}")
+    if known_suppliers is not None:
+        reject(~out['supplier_id'].isin(known_suppliers), "unknown supplier_id")
+    
+    for col in INVOICE_DATE_COLUMNS:
+        if col not in df:
+            out[col] = None
+            continue
+        parsed = pd.to_datetime(df[col], format='%Y-%m-%d', errors='coerce')
+        required = col == 'invoice_date'
+        reject(parsed.isna() & (df[col].notna() | required), f"invalid {col}")
+        if required:
+            # A mistyped future date would move the anomaly state's as_of past every real day
+            reject(parsed > pd.Timestamp.today().normalize(), "future invoice_date")
+        out[col] = _nullable(parsed.dt.strftime('%Y-%m-%d'))
+    
+    amount = pd.to_numeric(df['invoice_amount'], errors='coerce').astype('float64')
+    reject(~np.isfinite(amount), "invalid invoice_amount")
+    out['invoice_amount'] = amount
+    
+    for col in INVOICE_FLAG_COLUMNS:
+        flag = pd.to_numeric(df[col], errors='coerce')
+        reject(~flag.isin([0, 1]), f"invalid {col}")
+        out[col] = flag
+    
+    for col in INVOICE_DAY_COLUMNS:
+        if col not in df:
+            out[col] = None
+            continue
+        days = pd.to_numeric(df[col], errors='coerce')
+        reject((days.isna() & df[col].notna()) | (days.notna() & (days % 1 != 0)), f"invalid {col}")
+        out[col] = days
+    
+    valid = reason.isna()
+    rejected = df[~valid].assign(reject_reason=reason[~valid])
+    out = out[valid].drop_duplicates('invoice_id', keep='last')
+    for col in INVOICE_FLAG_COLUMNS:
+        out[col] = out[col].astype('int64')
+    for col in INVOICE_DAY_COLUMNS:
+        if out[col].dtype != object:
+            out[col] = _nullable(out[col].astype('Int64'))
+    return out[INVOICE_COLUMNS], rejected
+
+def upsert_invoices(conn, invoices):
+    """Upsert validated invoices by invoice_id and refresh the supplier days they moved out of or into
+    
+    The anomaly state is corrected for the same days and advanced over new ones.
+    Must run inside the caller's transaction. Returns (inserted, updated, unchanged, supplier days refreshed)."""
+    conn.execute(f"CREATE TEMP TABLE IF NOT EXISTS ingest_invoices AS SELECT {_STAGED_COLUMNS} FROM main.invoices WHERE 0")
+    conn.execute("DELETE FROM temp.ingest_invoices")
+    insert_rows(conn, 'temp.ingest_invoices', invoices, columns=INVOICE_COLUMNS)
+    
+    unchanged = conn.execute(
+        f"""DELETE FROM temp.ingest_invoices WHERE invoice_id IN (
+            SELECT s.invoice_id FROM temp.ingest_invoices s JOIN main.invoices i USING (invoice_id)
+            WHERE {_UNCHANGED})"""
+    ).rowcount
+    old_keys = conn.execute(
+        "SELECT i.supplier_id, i.invoice_date, COUNT(*) FROM temp.ingest_invoices s JOIN main.invoices i USING (invoice_id)"
+        " GROUP BY i.supplier_id, i.invoice_date"
+    ).fetchall()
+    new_keys = conn.execute("SELECT DISTINCT supplier_id, invoice_date FROM temp.ingest_invoices").fetchall()
+    staged = conn.execute("SELECT COUNT(*) FROM temp.ingest_invoices").fetchone()[0]
+    
+    conn.execute(_UPSERT)
+    updated = sum(count for _, _, count in old_keys)
+    keys = [key[:2] for key in old_keys] + new_keys
+    settled = settled_daily_stats(conn, keys)
+    refreshed = refresh_supplier_days(conn, keys)
+    update_anomaly_state(conn, settled, settled_daily_stats(conn, keys))
+    if staged:
+        bump_generation(conn)
+    return staged - updated, updated, unchanged, refreshed
+
+def _append_rejects(rejected, rejects_path):
+    header = not os.path.exists(rejects_path) or os.path.getsize(rejects_path) == 0
+    rejected.to_csv(rejects_path, mode='a', header=header, index=False)
+
+def _update_throughput(report, started):
+    report['seconds'] = time.perf_counter() - started
+    report['rows_per_second'] = report['rows_read'] / report['seconds'] if report['seconds'] else 0.0
+    return report
+
+def ingest_invoices(path, db_path='data/suppliers.db', chunk_size=50_000, rejects_path=None, progress=None):
+    """Stream an invoice file into the database, one transaction per chunk
+    
+    Rows for unknown suppliers or with malformed values are skipped (and appended to
+    rejects_path as CSV when given). progress(report) is called after every chunk.
+    Returns the report: row counts, supplier days refreshed, seconds and rows_per_second."""
+    conn = connect(db_path)
+    report = {'rows_read': 0, 'inserted': 0, 'updated': 0, 'unchanged': 0, 'rejected': 0, 'supplier_days_refreshed': 0, 'chunks': 0}
+    started = time.perf_counter()
+    try:
+        migrate(conn)
+        known_suppliers = {row[0] for row in conn.execute("SELECT supplier_id FROM suppliers")}
+        for chunk in read_chunks(path, chunk_size):
+            valid, rejected = validate_chunk(chunk, known_suppliers)
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                inserted, updated, unchanged, refreshed = upsert_invoices(conn, valid)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            
+            if rejects_path and len(rejected):
+                _append_rejects(rejected, rejects_path)
+            report['rows_read'] += len(chunk)
+            report['inserted'] += inserted
+            report['updated'] += updated
+            report['unchanged'] += unchanged
+            report['rejected'] += len(rejected)
+            report['supplier_days_refreshed'] += refreshed
+            report['chunks'] += 1
+            _update_throughput(report, started)
+            if progress is not None:
+                progress(report)
+        conn.execute("PRAGMA optimize")
+    finally:
+        conn.close()
+    
+    return _update_throughput(report, started)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Upsert invoices from CSV or Parquet files into the supplier database")
+    parser.add_argument('paths', nargs='+', help="CSV (.csv, .csv.gz) or Parquet files in the sample_export.csv layout")
+    parser.add_argument('--db', default='data/suppliers.db', help="SQLite database to update")
+    parser.add_argument('--chunk-size', type=int, default=50_000, help="rows validated and committed per transaction")
+    parser.add_argument('--rejects', default=None, help="CSV file to append rejected rows to, with a reject_reason column")
+    parser.add_argument('--quiet', action='store_true', help="only print the final summary")
+    args = parser.parse_args(argv)
+    
+    def show(report):
+        print(f"  {report['rows_read']:>12,} rows  {report['rows_per_second']:>12,.0f} rows/s", file=sys.stderr)
+    
+    for path in args.paths:
+        report = ingest_invoices(path, args.db, args.chunk_size, args.rejects, None if args.quiet else show)
+        print(
+            f"✓ {path}: {report['rows_read']:,} rows in {report['seconds']:.1f}s ({report['rows_per_second']:,.0f} rows/s) - "
+            f"{report['inserted']:,} inserted, {report['updated']:,} updated, {report['unchanged']:,} unchanged, "
+            f"{report['rejected']:,} rejected, {report['supplier_days_refreshed']:,} supplier days refreshed"
+        )
+    path = refresh_store_snapshots('sqlite', args.db)
+    if path:
+        print(f"✓ Preset KPI snapshots refreshed in {path}")
+
+if __name__ == "__main__":
+    main()
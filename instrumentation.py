@@ -0,0 +1,163 @@
+"""
+Opt-in timing spans and profiling for database queries, KPI math and charts
+
+Off by default: set SUPPLIER_DASHBOARD_TRACE=1 or call enable(), or start a Trace
+for one rerun. Each finished span is logged as one JSON line on the
+'supplier_dashboard.trace' logger and appended to the Trace active in its thread.
+"""
+import cProfile
+import functools
+import io
+import json
+import logging
+import os
+import pstats
+import threading
+import time
+from contextlib import contextmanager
+import pandas as pd
+
+ENV_VAR = 'SUPPLIER_DASHBOARD_TRACE'
+
+logger = logging.getLogger('supplier_dashboard.trace')
+_enabled = os.environ.get(ENV_VAR, '').lower() in ('1', 'true', 'yes', 'on')
+_local = threading.local()
+
+def enable(flag=True):
+    """Switch span recording and logging on or off for every thread"""
+    global _enabled
+    _enabled = flag
+
+def is_enabled():
+    return _enabled
+
+def _active_trace():
+    return getattr(_local, 'trace', None)
+
+def row_count(value):
+    """Rows in a DataFrame, Series or array result; None for scalars and dicts"""
+    shape = getattr(value, 'shape', None)
+    return shape[0] if shape else None
+
+def _describe(value):
+    if isinstance(value, pd.DataFrame):
+        return f"DataFrame[{value.shape[0]}x{value.shape[1]}]"
+    if isinstance(value, pd.Series):
+        return f"Series[{len(value)}]"
+    if isinstance(value, (list, tuple, set)):
+        return f"{type(value).__name__}[{len(value)}]"
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return repr(value)
+    return type(value).__name__
+
+class Span:
+    """One timed block: name, nesting depth, offset and duration in seconds, rows produced"""
+    
+    __slots__ = ('name', 'detail', 'depth', 'offset', 'seconds', 'rows')
+    
+    def __init__(self, name, detail='', depth=0, offset=0.0):
+        self.name = name
+        self.detail = detail
+        self.depth = depth
+        self.offset = offset
+        self.seconds = 0.0
+        self.rows = None
+    
+    def as_dict(self):
+        return {
+            'span': self.name, 'depth': self.depth, 'ms': round(self.seconds * 1000, 3),
+            'rows': self.rows, 'detail': self.detail
+        }
+
+# Handed out by span() while instrumentation is off, so callers can set .rows unconditionally
+_NULL_SPAN = Span('disabled')
+
+@contextmanager
+def span(name, detail=''):
+    """Time a block; set .rows on the yielded Span to record how many rows it produced"""
+    trace = _active_trace()
+    if not _enabled and trace is None:
+        yield _NULL_SPAN
+        return
+    
+    depth = getattr(_local, 'depth', 0)
+    started = time.perf_counter()
+    record = Span(name, detail, depth, started - trace.started if trace is not None else 0.0)
+    _local.depth = depth + 1
+    try:
+        yield record
+    finally:
+        record.seconds = time.perf_counter() - started
+        _local.depth = depth
+        if trace is not None:
+            trace.spans.append(record)
+        logger.info(json.dumps(record.as_dict(), default=str))
+
+def traced(func):
+    """Decorator wrapping every call in a span named after the function, with its arguments and result rows"""
+    name = func.__qualname__
+    is_method = '.' in name and name.split('.')[-2] != '<locals>'
+    
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not _enabled and _active_trace() is None:
+            return func(*args, **kwargs)
+        shown = args[1:] if is_method else args
+        detail = ', '.join([_describe(arg) for arg in shown] + [f"{key}={_describe(arg)}" for key, arg in kwargs.items()])
+        with span(name, detail) as record:
+            result = func(*args, **kwargs)
+            record.rows = row_count(result)
+            return result
+    
+    return wrapper
+
+class Trace:
+    """Collects the spans of one rerun in the current thread, optionally under cProfile"""
+    
+    def __init__(self, profile=False):
+        self.profile = profile
+        self.spans = []
+        self.started = None
+        self.seconds = None
+        self._profiler = None
+    
+    def start(self):
+        self.started = time.perf_counter()
+        _local.trace = self
+        if self.profile:
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        return self
+    
+    def stop(self):
+        if self._profiler is not None:
+            self._profiler.disable()
+        self.seconds = time.perf_counter() - self.started
+        if _active_trace() is self:
+            _local.trace = None
+        return self
+    
+    def __enter__(self):
+        return self.start()
+    
+    def __exit__(self, *exc):
+        self.stop()
+    
+    def to_frame(self):
+        """Spans in start order, names indented by nesting depth"""
+        spans = sorted(self.spans, key=lambda record: record.offset)
+        return pd.DataFrame({
+            'span': ['  ' * record.depth + record.name for record in spans],
+            'start_ms': [round(record.offset * 1000, 1) for record in spans],
+            'ms': [round(record.seconds * 1000, 1) for record in spans],
+            'rows': pd.array([record.rows for record in spans], dtype='Int64'),
+            'detail': [record.detail for record in spans]
+        })
+    
+    def profile_report(self, limit=30, sort='cumulative'):
+        """Top functions from the cProfile run as text, or '' when not profiled"""
+        if self._profiler is None:
+            return ''
+        out = io.StringIO()
+        pstats.Stats(self._profiler, stream=out).sort_stats(sort).print_stats(limit)
+        return out.getvalue()
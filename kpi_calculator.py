@@ -1,8 +1,11 @@
 """
 KPI calculation functions for supplier performance
 """
+import numpy as np
 import pandas as pd
+from instrumentation import traced
 
+@traced
 def calculate_on_time_delivery(invoices_df):
     """Calculate on-time delivery percentage"""
     if len(invoices_df) == 0:
@@ -11,6 +14,7 @@ def calculate_on_time_delivery(invoices_df):
     total_count = len(invoices_df)
     return round((on_time_count / total_count) * 100, 2)
 
+@traced
 def calculate_invoice_accuracy(invoices_df):
     """Calculate invoice accuracy percentage"""
     if len(invoices_df) == 0:
@@ -19,6 +23,7 @@ def calculate_invoice_accuracy(invoices_df):
     total_count = len(invoices_df)
     return round((accurate_count / total_count) * 100, 2)
 
+@traced
 def calculate_rejection_rate(invoices_df):
     """Calculate invoice rejection rate"""
     if len(invoices_df) == 0:
@@ -27,50 +32,155 @@ def calculate_rejection_rate(invoices_df):
     total_count = len(invoices_df)
     return round((rejected_count / total_count) * 100, 2)
 
+@traced
 def calculate_avg_payment_days(invoices_df):
     """Calculate average payment days"""
     if len(invoices_df) == 0:
         return 0.0
     return round(invoices_df['payment_days'].mean(), 2)
 
+@traced
 def calculate_avg_outstanding(outstanding_df):
     """Calculate average outstanding amount"""
     if len(outstanding_df) == 0:
         return 0.0
     return round(outstanding_df['outstanding_amount'].mean(), 2)
 
+@traced
 def calculate_total_outstanding(outstanding_df):
     """Calculate total outstanding amount"""
     if len(outstanding_df) == 0:
         return 0.0
     return round(outstanding_df['outstanding_amount'].sum(), 2)
 
-def calculate_supplier_kpis(invoices_df, outstanding_df, suppliers_df):
-    """Calculate KPIs per supplier"""
-    supplier_kpis = []
+INVOICE_STAT_COLUMNS = [
+    'invoice_count',
+    'on_time_count',
+    'accurate_count',
+    'rejected_count',
+    'payment_days_sum',
+    'amount_sum'
+]
+
+OUTSTANDING_STAT_COLUMNS = ['outstanding_count', 'outstanding_sum']
+
+SUPPLIER_KPI_COLUMNS = [
+    'supplier_id',
+    'supplier_name',
+    'country',
+    'category',
+    'on_time_delivery',
+    'invoice_accuracy',
+    'rejection_rate',
+    'avg_payment_days',
+    'avg_outstanding',
+    'total_invoices',
+    'total_amount'
+]
+
+def _group_codes(keys):
+    """Factorize group keys into dense integer codes, dropping missing keys"""
+    codes, uniques = pd.factorize(pd.Series(keys), sort=True)
+    valid = codes >= 0
+    return codes[valid], valid, np.asarray(uniques)
+
+def _weighted_counts(codes, values, size):
+    """Sum values per group code in a single pass"""
+    return np.bincount(codes, weights=np.asarray(values, dtype='float64'), minlength=size)
+
+def _segment_sums(codes, values, size):
+    """Sum float values per group code with NumPy's pairwise summation, matching Series.sum"""
+    order = np.argsort(codes, kind='stable')
+    sorted_values = np.asarray(values, dtype='float64')[order]
+    bounds = np.concatenate([[0], np.cumsum(np.bincount(codes, minlength=size))])
+    return np.array([sorted_values[start:stop].sum() for start, stop in zip(bounds[:-1], bounds[1:])], dtype='float64')
+
+@traced
+def aggregate_invoice_stats(invoices_df, keys=None):
+    """Reduce invoices to additive counts and sums per key (supplier_id by default)"""
+    if len(invoices_df) == 0:
+        return pd.DataFrame({
+            col: pd.Series(dtype='float64' if col.endswith('_sum') else 'int64')
+            for col in INVOICE_STAT_COLUMNS
+        })
+    if keys is None:
+        keys = invoices_df['supplier_id']
     
-    for _, supplier in suppliers_df.iterrows():
-        supplier_id = supplier['supplier_id']
-        supplier_invoices = invoices_df[invoices_df['supplier_id'] == supplier_id]
-        supplier_outstanding = outstanding_df[outstanding_df['supplier_id'] == supplier_id]
-        
-        kpis = {
-            'supplier_id': supplier_id,
-            'supplier_name': supplier['supplier_name'],
-            'country': supplier['country'],
-            'category': supplier['category'],
-            'on_time_delivery': calculate_on_time_delivery(supplier_invoices),
-            'invoice_accuracy': calculate_invoice_accuracy(supplier_invoices),
-            'rejection_rate': calculate_rejection_rate(supplier_invoices),
-            'avg_payment_days': calculate_avg_payment_days(supplier_invoices),
-            'avg_outstanding': calculate_avg_outstanding(supplier_outstanding),
-            'total_invoices': len(supplier_invoices),
-            'total_amount': round(supplier_invoices['invoice_amount'].sum(), 2) if len(supplier_invoices) > 0 else 0
-        }
-        supplier_kpis.append(kpis)
+    codes, valid, uniques = _group_codes(keys)
+    size = len(uniques)
+    on_time = (invoices_df['delivery_delay_days'].to_numpy() <= 0)[valid]
+    accurate = invoices_df['is_accurate'].to_numpy()[valid]
+    rejected = invoices_df['is_rejected'].to_numpy()[valid]
     
-    return pd.DataFrame(supplier_kpis)
+    return pd.DataFrame({
+        'invoice_count': np.bincount(codes, minlength=size),
+        'on_time_count': _weighted_counts(codes, on_time, size).astype('int64'),
+        'accurate_count': _weighted_counts(codes, accurate, size).astype('int64'),
+        'rejected_count': _weighted_counts(codes, rejected, size).astype('int64'),
+        'payment_days_sum': _weighted_counts(codes, invoices_df['payment_days'].to_numpy()[valid], size),
+        'amount_sum': _segment_sums(codes, invoices_df['invoice_amount'].to_numpy()[valid], size)
+    }, index=pd.Index(uniques))
+
+@traced
+def aggregate_outstanding_stats(outstanding_df):
+    """Reduce outstanding records to additive counts and sums per supplier"""
+    if len(outstanding_df) == 0:
+        return pd.DataFrame({
+            'outstanding_count': pd.Series(dtype='int64'),
+            'outstanding_sum': pd.Series(dtype='float64')
+        })
+    codes, valid, uniques = _group_codes(outstanding_df['supplier_id'])
+    size = len(uniques)
+    return pd.DataFrame({
+        'outstanding_count': np.bincount(codes, minlength=size),
+        'outstanding_sum': _segment_sums(codes, outstanding_df['outstanding_amount'].to_numpy()[valid], size)
+    }, index=pd.Index(uniques))
 
+def _rate(count, total):
+    """Vectorized percentage with the same rounding as the scalar KPI functions"""
+    count = np.asarray(count, dtype='float64')
+    total = np.asarray(total, dtype='float64')
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(total > 0, np.round((count / total) * 100, 2), 0.0)
+
+def _mean(total_sum, count):
+    """Vectorized mean with the same rounding as the scalar KPI functions"""
+    total_sum = np.asarray(total_sum, dtype='float64')
+    count = np.asarray(count, dtype='float64')
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(count > 0, np.round(total_sum / count, 2), 0.0)
+
+@traced
+def calculate_supplier_kpis_from_stats(invoice_stats, outstanding_stats, suppliers_df):
+    """Build the per-supplier KPI table from additive invoice and outstanding stats"""
+    supplier_ids = suppliers_df['supplier_id']
+    invoices = invoice_stats.reindex(supplier_ids.tolist(), fill_value=0)
+    outstanding = outstanding_stats.reindex(supplier_ids.tolist(), fill_value=0)
+    
+    return pd.DataFrame({
+        'supplier_id': supplier_ids.to_numpy(),
+        'supplier_name': suppliers_df['supplier_name'].to_numpy(),
+        'country': suppliers_df['country'].to_numpy(),
+        'category': suppliers_df['category'].to_numpy(),
+        'on_time_delivery': _rate(invoices['on_time_count'], invoices['invoice_count']),
+        'invoice_accuracy': _rate(invoices['accurate_count'], invoices['invoice_count']),
+        'rejection_rate': _rate(invoices['rejected_count'], invoices['invoice_count']),
+        'avg_payment_days': _mean(invoices['payment_days_sum'], invoices['invoice_count']),
+        'avg_outstanding': _mean(outstanding['outstanding_sum'], outstanding['outstanding_count']),
+        'total_invoices': invoices['invoice_count'].to_numpy().astype('int64'),
+        'total_amount': np.round(invoices['amount_sum'].to_numpy().astype('float64'), 2)
+    }, columns=SUPPLIER_KPI_COLUMNS)
+
+@traced
+def calculate_supplier_kpis(invoices_df, outstanding_df, suppliers_df):
+    """Calculate KPIs per supplier in a single grouped pass over invoices and outstanding"""
+    return calculate_supplier_kpis_from_stats(
+        aggregate_invoice_stats(invoices_df),
+        aggregate_outstanding_stats(outstanding_df),
+        suppliers_df
+    )
+
+@traced
 def calculate_overall_kpis(invoices_df, outstanding_df):
     """Calculate overall KPIs across all suppliers"""
     return {
@@ -80,4 +190,180 @@ def calculate_overall_kpis(invoices_df, outstanding_df):
         'avg_payment_days': calculate_avg_payment_days(invoices_df),
         'avg_outstanding': calculate_avg_outstanding(outstanding_df),
         'total_outstanding': calculate_total_outstanding(outstanding_df)
-    }
\ No newline at end of file
+    }
+
+@traced
+def aggregate_daily_stats(daily_stats_df, by=None):
+    """Re-aggregate supplier x day rollup rows to totals, or per 'supplier_id' or 'month'"""
+    stats = daily_stats_df[INVOICE_STAT_COLUMNS]
+    if by is None:
+        return stats.sum()
+    keys = daily_stats_df['invoice_date'].str[:7] if by == 'month' else daily_stats_df[by]
+    return stats.groupby(keys.to_numpy(), sort=True).sum()
+
+@traced
+def calculate_overall_kpis_from_stats(invoice_totals, outstanding_totals):
+    """Calculate overall KPIs from additive invoice and outstanding totals"""
+    invoice_count = invoice_totals['invoice_count']
+    outstanding_count = outstanding_totals['outstanding_count']
+    return {
+        'on_time_delivery': float(_rate(invoice_totals['on_time_count'], invoice_count)),
+        'invoice_accuracy': float(_rate(invoice_totals['accurate_count'], invoice_count)),
+        'rejection_rate': float(_rate(invoice_totals['rejected_count'], invoice_count)),
+        'avg_payment_days': float(_mean(invoice_totals['payment_days_sum'], invoice_count)),
+        'avg_outstanding': float(_mean(outstanding_totals['outstanding_sum'], outstanding_count)),
+        'total_outstanding': round(float(outstanding_totals['outstanding_sum']), 2) if outstanding_count else 0.0
+    }
+
+@traced
+def calculate_monthly_trends_from_stats(monthly_stats):
+    """Build monthly trend percentages from invoice stats indexed by 'YYYY-MM' month"""
+    return pd.DataFrame({
+        'month': pd.to_datetime(pd.Index(monthly_stats.index).astype(str), format='%Y-%m'),
+        'on_time_delivery': _rate(monthly_stats['on_time_count'], monthly_stats['invoice_count']),
+        'invoice_accuracy': _rate(monthly_stats['accurate_count'], monthly_stats['invoice_count']),
+        'rejection_rate': _rate(monthly_stats['rejected_count'], monthly_stats['invoice_count']),
+        'invoice_count': monthly_stats['invoice_count'].to_numpy().astype('int64')
+    })
+
+def _month_keys(dates):
+    """'YYYY-MM' keys for ISO date strings or datetime64 values"""
+    if pd.api.types.is_datetime64_any_dtype(dates):
+        return np.datetime_as_string(dates.to_numpy(dtype='datetime64[M]'), unit='M')
+    return dates.astype(str).str[:7]
+
+@traced
+def calculate_monthly_trends(invoices_df):
+    """Calculate monthly on-time, accuracy and rejection percentages"""
+    if len(invoices_df) == 0:
+        return calculate_monthly_trends_from_stats(aggregate_invoice_stats(invoices_df))
+    return calculate_monthly_trends_from_stats(aggregate_invoice_stats(invoices_df, _month_keys(invoices_df['invoice_date'])))
+
+@traced
+def histogram_bins(values, counts=None, nbins=30):
+    """Bin distinct values with their occurrence counts into at most nbins equal-width bins
+    
+    Gives the same counts as a histogram of the raw rows without touching them, so a
+    chart only ever receives nbins bars. Whole-number values get whole-number bin
+    widths. Returns bin_start, bin_end (exclusive) and count; missing values are dropped."""
+    values = np.asarray(values, dtype='float64')
+    counts = np.ones(len(values), dtype='int64') if counts is None else np.asarray(counts, dtype='int64')
+    keep = ~np.isnan(values)
+    values, counts = values[keep], counts[keep]
+    if len(values) == 0:
+        return pd.DataFrame({'bin_start': np.empty(0), 'bin_end': np.empty(0), 'count': np.empty(0, dtype='int64')})
+    
+    low, high = values.min(), values.max()
+    if np.all(values == np.floor(values)):
+        width = max(1.0, np.ceil((high - low + 1) / nbins))
+        edges = low + width * np.arange(int(np.ceil((high - low + 1) / width)) + 1)
+    else:
+        edges = np.histogram_bin_edges(values, bins=nbins)
+    hist, edges = np.histogram(values, bins=edges, weights=counts)
+    return pd.DataFrame({'bin_start': edges[:-1], 'bin_end': edges[1:], 'count': hist.astype('int64')})
+
+ROLLING_WINDOWS = (30, 90, 365)
+PERCENTILES = (50, 90, 99)
+AGING_EDGES = [30, 60, 90]
+AGING_BUCKETS = ['0-30 days', '31-60 days', '61-90 days', 'Over 90 days']
+
+def _rolling_columns(windows):
+    return [f"{name}_{window}d" for window in windows for name in ('invoices', 'on_time', 'accuracy')]
+
+@traced
+def calculate_rolling_rates(daily_stats_df, windows=ROLLING_WINDOWS, as_of=None):
+    """Trailing-window on-time and accuracy rates per supplier from supplier x day stats
+    
+    Without as_of, one row per supplier-day with each window ending that day; with as_of,
+    one row per supplier with each window ending on that date. Rows are sorted once by
+    (supplier, day) and every window is two searchsorted lookups into cumulative sums,
+    so the cost is O(n log n) whatever the window lengths."""
+    codes, valid, suppliers = _group_codes(daily_stats_df['supplier_id'])
+    if len(codes) == 0:
+        return pd.DataFrame(columns=['supplier_id'] + ([] if as_of else ['invoice_date']) + _rolling_columns(windows))
+    days = np.asarray(daily_stats_df['invoice_date'].to_numpy()[valid], dtype='datetime64[D]').astype('int64')
+    first, span = days.min(), days.max() - days.min()
+    
+    # One sortable int64 per supplier-day; the stride keeps every window inside its own supplier
+    stride = span + max(windows) + 2
+    keys, inverse = np.unique(codes * stride + (days - first), return_inverse=True)
+    columns = ['invoice_count', 'on_time_count', 'accurate_count']
+    totals = np.column_stack([
+        np.bincount(inverse, weights=daily_stats_df[col].to_numpy(dtype='float64')[valid], minlength=len(keys))
+        for col in columns
+    ])
+    cumulative = np.vstack([np.zeros((1, len(columns))), np.cumsum(totals, axis=0)]).astype('int64')
+    
+    if as_of is None:
+        ends = keys
+        result = {
+            'supplier_id': suppliers[keys // stride],
+            'invoice_date': (keys % stride + first).astype('datetime64[D]').astype('datetime64[ns]')
+        }
+    else:
+        offset = np.clip(np.datetime64(as_of, 'D').astype('int64') - first, -1, span + max(windows))
+        ends = np.arange(len(suppliers)) * stride + offset
+        result = {'supplier_id': suppliers}
+    
+    end_rows = np.searchsorted(keys, ends, side='right')
+    for window in windows:
+        start_rows = np.searchsorted(keys, ends - window, side='right')
+        invoices, on_time, accurate = (cumulative[end_rows] - cumulative[start_rows]).T
+        result[f"invoices_{window}d"] = invoices
+        result[f"on_time_{window}d"] = _rate(on_time, invoices)
+        result[f"accuracy_{window}d"] = _rate(accurate, invoices)
+    return pd.DataFrame(result)
+
+@traced
+def calculate_percentiles(values, counts=None, groups=None, percentiles=PERCENTILES):
+    """Percentiles of a value histogram, overall or per group, in one sort
+    
+    values/counts is a mergeable sketch of a day column: partial counts from chunks or
+    shards just add up, and there are few distinct values. Results are exact and match
+    np.percentile's linear method on the raw rows; missing values are dropped. Returns a
+    Series (p50, p90, ...) or, with groups, a DataFrame indexed by group."""
+    values = np.asarray(values, dtype='float64')
+    counts = np.ones(len(values), dtype='int64') if counts is None else np.asarray(counts, dtype='int64')
+    keys = np.zeros(len(values), dtype='int64') if groups is None else np.asarray(groups)
+    keep = ~np.isnan(values) & (counts > 0)
+    codes, valid, uniques = _group_codes(keys[keep])
+    values, counts = values[keep][valid], counts[keep][valid]
+    
+    order = np.lexsort((values, codes))
+    values, cumulative = values[order], np.cumsum(counts[order])
+    group_sizes = np.bincount(codes, weights=counts, minlength=len(uniques)).astype('int64')
+    group_starts = np.cumsum(group_sizes) - group_sizes
+    
+    result = {}
+    for percentile in percentiles:
+        position = (group_sizes - 1) * (percentile / 100)
+        lower = np.floor(position).astype('int64')
+        below = values[np.searchsorted(cumulative, group_starts + lower, side='right')]
+        above = values[np.searchsorted(cumulative, group_starts + np.minimum(lower + 1, group_sizes - 1), side='right')]
+        result[f"p{percentile}"] = below + (above - below) * (position - lower)
+    table = pd.DataFrame(result, index=pd.Index(uniques), columns=[f"p{percentile}" for percentile in percentiles], dtype='float64')
+    if groups is None:
+        return table.iloc[0] if len(table) else pd.Series(np.nan, index=table.columns)
+    return table
+
+@traced
+def calculate_aging_buckets(outstanding_df, by_supplier=False):
+    """Outstanding count and amount per aging_days bucket (AGING_BUCKETS)
+    
+    With by_supplier, a table of amounts indexed by supplier_id with one column per bucket.
+    Records without aging_days are left out."""
+    aging = outstanding_df['aging_days'].to_numpy(dtype='float64', na_value=np.nan)
+    keep = ~np.isnan(aging)
+    buckets = np.searchsorted(AGING_EDGES, aging[keep], side='left')
+    amounts = outstanding_df['outstanding_amount'].to_numpy(dtype='float64')[keep]
+    size = len(AGING_BUCKETS)
+    if not by_supplier:
+        return pd.DataFrame({
+            'aging_bucket': AGING_BUCKETS,
+            'outstanding_count': np.bincount(buckets, minlength=size),
+            'outstanding_amount': _segment_sums(buckets, amounts, size) if len(buckets) else np.zeros(size)
+        })
+    codes, valid, suppliers = _group_codes(outstanding_df['supplier_id'].to_numpy()[keep])
+    cells = codes * size + buckets[valid]
+    sums = _segment_sums(cells, amounts[valid], len(suppliers) * size) if len(cells) else np.zeros(0)
+    return pd.DataFrame(sums.reshape(len(suppliers), size), index=pd.Index(suppliers, name='supplier_id'), columns=AGING_BUCKETS)
@@ -0,0 +1,104 @@
+"""
+Per-supplier KPIs computed across a process pool, for full-history recomputation
+
+Suppliers are split into shards balanced by invoice count. Each worker process
+reopens the storage backend, reads only its shard's invoices and outstanding
+records, and reduces them to additive per-supplier stats. A supplier never spans
+two shards and the backends return invoices in a plan-independent order, so each
+supplier's float sums add the same rows in the same order and the merged table is
+identical to calculate_supplier_kpis over the whole history.
+
+Run with: python parallel_kpis.py --workers 8 --output supplier_kpis.csv
+"""
+import argparse
+import heapq
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+from instrumentation import traced
+from kpi_calculator import (
+    aggregate_invoice_stats,
+    aggregate_outstanding_stats,
+    calculate_supplier_kpis_from_stats
+)
+from storage import open_backend
+
+def shard_suppliers(invoice_counts, shards):
+    """Split supplier ids into at most `shards` groups with near-equal invoice totals
+    
+    invoice_counts is a Series of invoice counts indexed by supplier_id. Largest
+    suppliers are placed first, each into the currently lightest shard."""
+    heap = [(0, position, []) for position in range(max(1, min(shards, len(invoice_counts))))]
+    for supplier_id, count in invoice_counts.sort_values(ascending=False, kind='stable').items():
+        total, position, members = heapq.heappop(heap)
+        members.append(supplier_id)
+        heapq.heappush(heap, (total + int(count), position, members))
+    return [sorted(members) for _, _, members in sorted(heap, key=lambda shard: shard[1]) if members]
+
+def shard_stats(kind, location, supplier_ids, start_date=None, end_date=None):
+    """Additive invoice and outstanding stats for one shard of suppliers, read by a worker"""
+    db = open_backend(kind, location)
+    try:
+        invoices = db.get_invoices(start_date, end_date, supplier_ids)
+        return aggregate_invoice_stats(invoices), aggregate_outstanding_stats(db.get_outstanding(supplier_ids))
+    finally:
+        db.close()
+
+def _merge(parts, empty):
+    """Sum per-supplier partial stats; shards are disjoint, so each sum has one term"""
+    parts = [part for part in parts if len(part)]
+    if not parts:
+        return empty
+    return pd.concat(parts).groupby(level=0, sort=True).sum()
+
+@traced
+def calculate_supplier_kpis_parallel(db, start_date=None, end_date=None, supplier_ids=None, workers=None, shards=None):
+    """Calculate per-supplier KPIs with one process pool task per supplier shard
+    
+    Matches calculate_supplier_kpis(db.get_invoices(...), db.get_outstanding(...), suppliers)
+    exactly. More shards than workers keeps each worker's partition smaller."""
+    workers = workers or os.cpu_count() or 1
+    shards = shards or workers
+    suppliers_df = db.get_suppliers()
+    if supplier_ids is not None:
+        suppliers_df = suppliers_df[suppliers_df['supplier_id'].isin(supplier_ids)]
+    counts = db.get_invoice_stats(start_date, end_date, supplier_ids, group_by='supplier_id')['invoice_count']
+    counts = counts.reindex(suppliers_df['supplier_id'].tolist(), fill_value=0)
+    groups = shard_suppliers(counts, shards)
+    
+    tasks = [(db.kind, db.location, group, start_date, end_date) for group in groups]
+    if workers == 1 or len(tasks) <= 1:
+        results = [shard_stats(*task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as pool:
+            results = list(pool.map(shard_stats, *zip(*tasks)))
+    
+    return calculate_supplier_kpis_from_stats(
+        _merge([invoices for invoices, _ in results], aggregate_invoice_stats(pd.DataFrame())),
+        _merge([outstanding for _, outstanding in results], aggregate_outstanding_stats(pd.DataFrame())),
+        suppliers_df
+    )
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Recompute per-supplier KPIs over the full history in parallel")
+    parser.add_argument('--backend', default=None, help="storage backend (sqlite or parquet; default from the environment)")
+    parser.add_argument('--data', default=None, help="database file or Parquet store directory")
+    parser.add_argument('--start-date', default=None, help="first invoice date, YYYY-MM-DD")
+    parser.add_argument('--end-date', default=None, help="last invoice date, YYYY-MM-DD")
+    parser.add_argument('--workers', type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument('--shards', type=int, default=None, help="supplier shards (default: one per worker)")
+    parser.add_argument('--output', default='supplier_kpis.csv', help="CSV file for the KPI table")
+    args = parser.parse_args(argv)
+    
+    db = open_backend(args.backend, args.data)
+    started = time.perf_counter()
+    try:
+        kpis = calculate_supplier_kpis_parallel(db, args.start_date, args.end_date, workers=args.workers, shards=args.shards)
+    finally:
+        db.close()
+    kpis.to_csv(args.output, index=False)
+    print(f"✓ KPIs for {len(kpis):,} suppliers written to {args.output} in {time.perf_counter() - started:.1f}s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,359 @@
+"""
+Columnar Parquet storage backend, built from the SQLite database
+
+Layout of a store directory:
+    CURRENT                                         (names the live version; replaced atomically)
+    versions/<version>/
+        suppliers.parquet, outstanding.parquet, anomaly_state.parquet
+        invoices/invoice_month=YYYY-MM/part-0.parquet   (rows sorted by supplier_id, invoice_date)
+        store.json                                      (build summary)
+
+A rebuild writes a new version and then swaps CURRENT, so readers always find a
+complete store; the previous version is kept for queries still reading it.
+
+Date filters prune whole month partitions and supplier filters skip row groups by
+their min/max statistics; every query reads only the columns it needs.
+Build with: python parquet_backend.py --db data/suppliers.db --output data/parquet
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import time
+import numpy as np
+import pandas as pd
+from database import INVOICE_DAY_COLUMNS, SupplierDatabase, coerce_invoice_dtypes
+from instrumentation import traced
+from kpi_calculator import INVOICE_STAT_COLUMNS
+from schema import TABLE_COLUMNS
+from storage import StorageBackend
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+ROW_GROUP_SIZE = 64 * 1024
+MANIFEST = 'store.json'
+CURRENT = 'CURRENT'
+VERSIONS = 'versions'
+
+def _require_pyarrow():
+    if pa is None:
+        raise RuntimeError("The Parquet backend needs pyarrow: pip install pyarrow")
+
+def invoice_schema():
+    """Arrow types of the invoices table columns"""
+    return pa.schema([
+        ('invoice_id', pa.string()),
+        ('supplier_id', pa.string()),
+        ('invoice_date', pa.string()),
+        ('due_date', pa.string()),
+        ('payment_date', pa.string()),
+        ('expected_delivery_date', pa.string()),
+        ('actual_delivery_date', pa.string()),
+        ('invoice_amount', pa.float64()),
+        ('is_accurate', pa.int64()),
+        ('is_rejected', pa.int64()),
+        ('payment_days', pa.int64()),
+        ('delivery_delay_days', pa.int64())
+    ])
+
+def current_version(path):
+    """The live version named by a store's CURRENT file, or None for a store built before versioning"""
+    try:
+        with open(os.path.join(path, CURRENT)) as current:
+            return current.read().strip()
+    except FileNotFoundError:
+        return None
+
+def _version_dir(path, version):
+    return path if version is None else os.path.join(path, VERSIONS, version)
+
+def build_parquet_store(db_path, output_dir, chunk_size=100_000, row_group_size=ROW_GROUP_SIZE):
+    """Write a new version of a Parquet store from a SQLite database, month by month, then make it current
+    
+    Returns the number of invoices written."""
+    _require_pyarrow()
+    db = SupplierDatabase(db_path, pool_size=1)
+    version = f"{time.time_ns()}-{os.getpid()}"
+    staging = _version_dir(output_dir, version)
+    os.makedirs(os.path.join(staging, 'invoices'))
+    schema = invoice_schema()
+    rows = 0
+    try:
+        pq.write_table(pa.Table.from_pandas(db.get_suppliers(), preserve_index=False), os.path.join(staging, 'suppliers.parquet'))
+        pq.write_table(pa.Table.from_pandas(db.get_outstanding(), preserve_index=False), os.path.join(staging, 'outstanding.parquet'))
+        pq.write_table(pa.Table.from_pandas(db.get_anomaly_state(), preserve_index=False), os.path.join(staging, 'anomaly_state.parquet'))
+        
+        for month in db.get_invoice_stats(group_by='month').index:
+            partition = os.path.join(staging, 'invoices', f'invoice_month={month}')
+            os.makedirs(partition)
+            query = "SELECT * FROM invoices WHERE invoice_date >= ? AND invoice_date <= ? ORDER BY supplier_id, invoice_date, invoice_id"
+            with db.read_connection() as conn, pq.ParquetWriter(os.path.join(partition, 'part-0.parquet'), schema, compression='zstd') as writer:
+                for chunk in pd.read_sql_query(query, conn, params=[f'{month}-01', f'{month}-31'], chunksize=chunk_size):
+                    writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False), row_group_size=row_group_size)
+                    rows += len(chunk)
+        
+        with open(os.path.join(staging, MANIFEST), 'w') as manifest:
+            json.dump({'source': os.path.abspath(db_path), 'invoices': rows, 'built_at': time.time()}, manifest)
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    finally:
+        db.close()
+    
+    previous = current_version(output_dir)
+    with open(os.path.join(output_dir, CURRENT + '.tmp'), 'w') as current:
+        current.write(version)
+    os.replace(os.path.join(output_dir, CURRENT + '.tmp'), os.path.join(output_dir, CURRENT))
+    
+    # Keep the previous version for readers that resolved it before the swap
+    for name in os.listdir(os.path.join(output_dir, VERSIONS)):
+        if name not in (version, previous):
+            shutil.rmtree(os.path.join(output_dir, VERSIONS, name), ignore_errors=True)
+    if previous is None:
+        for name in ['suppliers.parquet', 'outstanding.parquet', 'anomaly_state.parquet', MANIFEST]:
+            if os.path.exists(os.path.join(output_dir, name)):
+                os.remove(os.path.join(output_dir, name))
+        shutil.rmtree(os.path.join(output_dir, 'invoices'), ignore_errors=True)
+    return rows
+
+class ParquetDatabase(StorageBackend):
+    """Read-only StorageBackend over a Parquet store written by build_parquet_store"""
+    
+    kind = 'parquet'
+    
+    def __init__(self, path='data/parquet'):
+        _require_pyarrow()
+        self.path = path
+        self._invoices_root = None
+        self._invoices = None
+    
+    @property
+    def location(self):
+        return self.path
+    
+    def data_version(self):
+        """The current version name, which is also stable across processes
+        
+        A store built before versioning falls back to its manifest's modification time."""
+        version = current_version(self.path)
+        if version is None:
+            return str(os.stat(os.path.join(self.path, MANIFEST)).st_mtime_ns)
+        return version
+    
+    def data_generation(self):
+        return self.data_version()
+    
+    def _root(self):
+        """Directory of the current version"""
+        return _version_dir(self.path, current_version(self.path))
+    
+    def _dataset(self):
+        """The invoices dataset of the current version, rediscovered after the store is rebuilt"""
+        root = self._root()
+        if self._invoices is None or root != self._invoices_root:
+            partitioning = ds.partitioning(pa.schema([('invoice_month', pa.string())]), flavor='hive')
+            self._invoices = ds.dataset(os.path.join(root, 'invoices'), format='parquet', partitioning=partitioning)
+            self._invoices_root = root
+        return self._invoices
+    
+    def _invoice_filter(self, start_date=None, end_date=None, supplier_ids=None):
+        """Build the dataset filter; month bounds let whole partitions be skipped"""
+        conditions = []
+        if start_date:
+            conditions += [ds.field('invoice_month') >= start_date[:7], ds.field('invoice_date') >= start_date]
+        if end_date:
+            conditions += [ds.field('invoice_month') <= end_date[:7], ds.field('invoice_date') <= end_date]
+        if supplier_ids is not None:
+            conditions.append(ds.field('supplier_id').isin(pa.array(list(supplier_ids), pa.string())))
+        expression = None
+        for condition in conditions:
+            expression = condition if expression is None else expression & condition
+        return expression
+    
+    def _batches(self, columns, start_date=None, end_date=None, supplier_ids=None, chunk_size=ROW_GROUP_SIZE):
+        return self._dataset().to_batches(
+            columns=columns, filter=self._invoice_filter(start_date, end_date, supplier_ids), batch_size=chunk_size
+        )
+    
+    def _read_table(self, name, supplier_ids=None):
+        table = pq.read_table(os.path.join(self._root(), name))
+        if supplier_ids is not None:
+            table = table.filter(pc.is_in(table['supplier_id'], pa.array(list(supplier_ids), pa.string())))
+        return table
+    
+    @traced
+    def get_suppliers(self):
+        """Get all suppliers"""
+        return self._read_table('suppliers.parquet').to_pandas()
+    
+    @traced
+    def get_invoices(self, start_date=None, end_date=None, supplier_ids=None, typed=False):
+        """Get invoices with optional filters; typed=True applies coerce_invoice_dtypes"""
+        table = self._dataset().to_table(
+            columns=TABLE_COLUMNS['invoices'], filter=self._invoice_filter(start_date, end_date, supplier_ids)
+        )
+        df = table.to_pandas()
+        return coerce_invoice_dtypes(df) if typed else df
+    
+    def iter_invoices(self, start_date=None, end_date=None, supplier_ids=None, chunk_size=50_000, typed=False):
+        """Yield filtered invoices as DataFrames of at most chunk_size rows"""
+        for batch in self._batches(TABLE_COLUMNS['invoices'], start_date, end_date, supplier_ids, chunk_size):
+            if batch.num_rows:
+                chunk = batch.to_pandas()
+                yield coerce_invoice_dtypes(chunk) if typed else chunk
+    
+    @traced
+    def get_supplier_invoice_page(self, supplier_id, start_date=None, end_date=None, after=None, page_size=20, descending=True, typed=False):
+        """Get one page of a supplier's invoices ordered by (invoice_date, invoice_id)"""
+        expression = self._invoice_filter(start_date, end_date, [supplier_id])
+        if after is not None:
+            date, invoice_id = after
+            before = ds.field('invoice_date') < date if descending else ds.field('invoice_date') > date
+            tie = ds.field('invoice_id') < invoice_id if descending else ds.field('invoice_id') > invoice_id
+            expression = expression & (before | ((ds.field('invoice_date') == date) & tie))
+        table = self._dataset().to_table(columns=TABLE_COLUMNS['invoices'], filter=expression)
+        order = 'descending' if descending else 'ascending'
+        table = table.sort_by([('invoice_date', order), ('invoice_id', order)]).slice(0, page_size + 1)
+        df = table.to_pandas()
+        
+        next_key = None
+        if len(df) > page_size:
+            df = df.iloc[:page_size]
+            next_key = (df['invoice_date'].iloc[-1], df['invoice_id'].iloc[-1])
+        return (coerce_invoice_dtypes(df) if typed else df), next_key
+    
+    @traced
+    def get_outstanding(self, supplier_ids=None):
+        """Get outstanding amounts"""
+        return self._read_table('outstanding.parquet', supplier_ids).to_pandas()
+    
+    @traced
+    def get_anomaly_state(self):
+        """The anomaly state copied from SQLite when the store was built"""
+        if not os.path.exists(os.path.join(self._root(), 'anomaly_state.parquet')):
+            return super().get_anomaly_state()
+        return self._read_table('anomaly_state.parquet').to_pandas()
+    
+    @traced
+    def get_date_range(self):
+        """Get min and max invoice dates from row group statistics, without reading data pages"""
+        low = high = None
+        for fragment in self._dataset().get_fragments():
+            for row_group in fragment.row_groups:
+                stats = row_group.statistics.get('invoice_date')
+                if not stats:
+                    continue
+                low = stats['min'] if low is None else min(low, stats['min'])
+                high = stats['max'] if high is None else max(high, stats['max'])
+        return low, high
+    
+    def _aggregate_stats(self, keys, start_date=None, end_date=None, supplier_ids=None):
+        """Per-batch partial INVOICE_STAT_COLUMNS grouped by keys, concatenated but not yet combined
+        
+        Aggregates batch by batch, so memory is bounded by the row group size."""
+        columns = ['delivery_delay_days', 'is_accurate', 'is_rejected', 'payment_days', 'invoice_amount']
+        partials = []
+        for batch in self._batches(columns + keys, start_date, end_date, supplier_ids):
+            table = pa.table({
+                **{key: batch.column(key) for key in keys},
+                'on_time': pc.cast(pc.less_equal(batch.column('delivery_delay_days'), 0), pa.int64()),
+                **{col: batch.column(col) for col in columns[1:]}
+            })
+            partials.append(table.group_by(keys).aggregate([
+                ('is_accurate', 'count'), ('on_time', 'sum'), ('is_accurate', 'sum'),
+                ('is_rejected', 'sum'), ('payment_days', 'sum'), ('invoice_amount', 'sum')
+            ]))
+        
+        stats = pd.concat([partial.to_pandas() for partial in partials]) if partials else pd.DataFrame(
+            columns=keys + ['is_accurate_count', 'on_time_sum', 'is_accurate_sum', 'is_rejected_sum', 'payment_days_sum', 'invoice_amount_sum']
+        )
+        stats = stats.rename(columns={
+            'is_accurate_count': 'invoice_count', 'on_time_sum': 'on_time_count', 'is_accurate_sum': 'accurate_count',
+            'is_rejected_sum': 'rejected_count', 'invoice_amount_sum': 'amount_sum'
+        })
+        return stats.fillna({col: 0 for col in INVOICE_STAT_COLUMNS}).astype(
+            {col: 'int64' if col.endswith('_count') else 'float64' for col in INVOICE_STAT_COLUMNS}
+        )
+    
+    @traced
+    def get_invoice_stats(self, start_date=None, end_date=None, supplier_ids=None, group_by=None):
+        """Get additive invoice counts and sums, optionally grouped by 'supplier_id' or 'month'"""
+        keys = {None: [], 'supplier_id': ['supplier_id'], 'month': ['invoice_month']}
+        if group_by not in keys:
+            raise ValueError(f"Unsupported group_by: {group_by}")
+        stats = self._aggregate_stats(keys[group_by], start_date, end_date, supplier_ids).rename(columns={'invoice_month': 'month'})
+        if group_by is None:
+            return stats[INVOICE_STAT_COLUMNS].sum()
+        return stats.groupby(group_by, sort=True)[INVOICE_STAT_COLUMNS].sum()
+    
+    @traced
+    def get_daily_stats(self, start_date=None, end_date=None, supplier_ids=None):
+        """Get additive invoice stats per supplier and invoice_date"""
+        stats = self._aggregate_stats(['supplier_id', 'invoice_date'], start_date, end_date, supplier_ids)
+        return stats.groupby(['supplier_id', 'invoice_date'], sort=True)[INVOICE_STAT_COLUMNS].sum().reset_index()
+    
+    @traced
+    def get_outstanding_stats(self, supplier_ids=None, group_by=None):
+        """Get outstanding counts and sums, optionally grouped by supplier_id"""
+        outstanding = self.get_outstanding(supplier_ids)
+        if group_by is None:
+            return pd.Series({
+                'outstanding_count': len(outstanding),
+                'outstanding_sum': float(outstanding['outstanding_amount'].sum())
+            })
+        if group_by != 'supplier_id':
+            raise ValueError(f"Unsupported group_by: {group_by}")
+        return outstanding.groupby('supplier_id', sort=True)['outstanding_amount'].agg(
+            outstanding_count='count', outstanding_sum='sum'
+        )
+    
+    @traced
+    def get_payment_days_counts(self, start_date=None, end_date=None, supplier_ids=None):
+        """Get the number of invoices for each payment_days value"""
+        counts = {}
+        for batch in self._batches(['payment_days'], start_date, end_date, supplier_ids):
+            for entry in pc.value_counts(batch.column('payment_days')).to_pylist():
+                counts[entry['values']] = counts.get(entry['values'], 0) + entry['counts']
+        values = sorted(counts, key=lambda value: (value is not None, value or 0))
+        return pd.DataFrame({
+            'payment_days': np.array([np.nan if value is None else value for value in values], dtype='float64' if None in counts else 'int64'),
+            'invoice_count': np.array([counts[value] for value in values], dtype='int64')
+        })
+    
+    @traced
+    def get_day_counts(self, column, start_date=None, end_date=None, supplier_ids=None, by_supplier=False):
+        """Get the number of invoices for each non-missing value of a day column, optionally per supplier"""
+        if column not in INVOICE_DAY_COLUMNS:
+            raise ValueError(f"Unsupported day column: {column}")
+        keys = ['supplier_id', column] if by_supplier else [column]
+        partials = [
+            batch_table.group_by(keys).aggregate([(column, 'count')]).to_pandas()
+            for batch_table in (pa.Table.from_batches([batch]) for batch in self._batches(keys, start_date, end_date, supplier_ids))
+        ]
+        counts = pd.concat(partials) if partials else pd.DataFrame(columns=keys + [f"{column}_count"])
+        counts = counts[counts[column].notna()].rename(columns={f"{column}_count": 'invoice_count'})
+        return counts.groupby(keys, sort=True)['invoice_count'].sum().astype('int64').reset_index()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build a Parquet store for the columnar backend from the SQLite database")
+    parser.add_argument('--db', default='data/suppliers.db', help="SQLite database to read")
+    parser.add_argument('--output', default='data/parquet', help="store directory to (re)build")
+    parser.add_argument('--chunk-size', type=int, default=100_000, help="rows read from SQLite per chunk")
+    args = parser.parse_args(argv)
+    
+    started = time.perf_counter()
+    rows = build_parquet_store(args.db, args.output, args.chunk_size)
+    print(f"✓ Wrote {rows:,} invoices to {args.output} in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+    from snapshots import refresh_store_snapshots
+    if refresh_store_snapshots('parquet', args.output):
+        print("✓ Preset KPI snapshots refreshed", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
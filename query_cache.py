@@ -0,0 +1,190 @@
+"""
+Shared query result cache for the storage backends
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+import pandas as pd
+from instrumentation import span, row_count
+
+def normalize_filters(start_date=None, end_date=None, supplier_ids=None):
+    """Turn sidebar filters into a hashable key: ISO dates and a sorted supplier tuple (None for every supplier)"""
+    def iso(value):
+        if value is None or value == '':
+            return None
+        return value if isinstance(value, str) else value.strftime('%Y-%m-%d')
+    
+    ids = tuple(sorted(set(supplier_ids))) if supplier_ids is not None else None
+    return iso(start_date), iso(end_date), ids
+
+def frame_key(df):
+    """Digest of a DataFrame's columns and ordered values, for cache keys"""
+    digest = hashlib.sha1(repr(list(df.columns)).encode())
+    digest.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+def _result_size(value):
+    """Approximate memory held by a cached result"""
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(deep=True).sum())
+    if isinstance(value, pd.Series):
+        return int(value.memory_usage(deep=True))
+    return 1024
+
+def _copy_result(value):
+    """Hand out copies so callers can't mutate a result shared with other sessions"""
+    if isinstance(value, (pd.DataFrame, pd.Series, dict)):
+        return value.copy()
+    return value
+
+class _Flight:
+    """A computation in progress that other threads can wait on"""
+    
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+class QueryCache:
+    """Thread-safe LRU cache bounded by entry count and bytes, with single-flight loading"""
+    
+    def __init__(self, max_entries=256, max_bytes=256 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._version = None
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+    
+    def __len__(self):
+        return len(self._entries)
+    
+    def clear(self):
+        """Drop every cached result"""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+    
+    def _evict(self):
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            _, (_, size) = self._entries.popitem(last=False)
+            self._bytes -= size
+    
+    def get_or_compute(self, key, version, compute):
+        """Return the cached result for key, computing it once if missing or stale"""
+        with self._lock:
+            if version != self._version:
+                self._entries.clear()
+                self._bytes = 0
+                self._version = version
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key][0]
+            self.misses += 1
+            flight = self._inflight.get((version, key))
+            owner = flight is None
+            if owner:
+                flight = self._inflight[(version, key)] = _Flight()
+        
+        if not owner:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+        
+        try:
+            flight.value = compute()
+        except Exception as exc:
+            flight.error = exc
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[(version, key)]
+                if flight.error is None and version == self._version:
+                    size = _result_size(flight.value)
+                    if size <= self.max_bytes:
+                        self._entries[key] = (flight.value, size)
+                        self._bytes += size
+                        self._evict()
+            flight.done.set()
+        return flight.value
+
+class CachedSupplierDatabase:
+    """Storage backend wrapper that shares query results across sessions until the data changes"""
+    
+    def __init__(self, db, cache=None):
+        self.db = db
+        self.cache = cache if cache is not None else QueryCache()
+    
+    def __getattr__(self, name):
+        return getattr(self.db, name)
+    
+    def data_version(self):
+        """The wrapped backend's data version; every cached result is dropped when it changes"""
+        return self.db.data_version()
+    
+    def close(self):
+        """Close the wrapped database"""
+        self.db.close()
+    
+    def _cached(self, method, key, compute):
+        with span(f"cache.{method}") as record:
+            result = _copy_result(self.cache.get_or_compute((method,) + key, self.data_version(), compute))
+            record.rows = row_count(result)
+            return result
+    
+    def get_suppliers(self):
+        return self._cached('get_suppliers', (), self.db.get_suppliers)
+    
+    def get_date_range(self):
+        return self._cached('get_date_range', (), self.db.get_date_range)
+    
+    def get_invoices(self, start_date=None, end_date=None, supplier_ids=None, typed=False):
+        key = normalize_filters(start_date, end_date, supplier_ids)
+        return self._cached('get_invoices', key + (typed,), lambda: self.db.get_invoices(*key, typed=typed))
+    
+    def get_outstanding(self, supplier_ids=None):
+        key = normalize_filters(supplier_ids=supplier_ids)
+        return self._cached('get_outstanding', key, lambda: self.db.get_outstanding(key[2]))
+    
+    def get_invoice_stats(self, start_date=None, end_date=None, supplier_ids=None, group_by=None):
+        key = normalize_filters(start_date, end_date, supplier_ids)
+        return self._cached('get_invoice_stats', key + (group_by,), lambda: self.db.get_invoice_stats(*key, group_by=group_by))
+    
+    def get_outstanding_stats(self, supplier_ids=None, group_by=None):
+        key = normalize_filters(supplier_ids=supplier_ids)
+        return self._cached('get_outstanding_stats', key + (group_by,), lambda: self.db.get_outstanding_stats(key[2], group_by=group_by))
+    
+    def get_overall_kpis(self, start_date=None, end_date=None, supplier_ids=None):
+        key = normalize_filters(start_date, end_date, supplier_ids)
+        return self._cached('get_overall_kpis', key, lambda: self.db.get_overall_kpis(*key))
+    
+    def get_supplier_kpis(self, start_date=None, end_date=None, supplier_ids=None, suppliers_df=None):
+        key = normalize_filters(start_date, end_date, supplier_ids)
+        suppliers_key = None
+        if suppliers_df is not None:
+            suppliers_key = frame_key(suppliers_df)
+        return self._cached('get_supplier_kpis', key + (suppliers_key,), lambda: self.db.get_supplier_kpis(*key, suppliers_df=suppliers_df))
+    
+    def get_monthly_trends(self, start_date=None, end_date=None, supplier_ids=None):
+        key = normalize_filters(start_date, end_date, supplier_ids)
+        return self._cached('get_monthly_trends', key, lambda: self.db.get_monthly_trends(*key))
+    
+    def get_payment_days_counts(self, start_date=None, end_date=None, supplier_ids=None):
+        key = normalize_filters(start_date, end_date, supplier_ids)
+        return self._cached('get_payment_days_counts', key, lambda: self.db.get_payment_days_counts(*key))
+    
+    def get_daily_stats(self, start_date=None, end_date=None, supplier_ids=None):
+        key = normalize_filters(start_date, end_date, supplier_ids)
+        return self._cached('get_daily_stats', key, lambda: self.db.get_daily_stats(*key))
+    
+    def get_day_counts(self, column, start_date=None, end_date=None, supplier_ids=None, by_supplier=False):
+        key = normalize_filters(start_date, end_date, supplier_ids)
+        return self._cached('get_day_counts', (column,) + key + (by_supplier,), lambda: self.db.get_day_counts(column, *key, by_supplier=by_supplier))
+    
+    def get_anomaly_state(self):
+        return self._cached('get_anomaly_state', (), self.db.get_anomaly_state)
@@ -0,0 +1,44 @@
+"""
+Maintenance of the daily_supplier_stats rollup table
+
+Every dashboard KPI is a ratio of additive supplier x day counts and sums, so
+queries over any date range or supplier filter can read the rollup instead of
+scanning invoices. Writers must keep it in step inside their own transaction:
+rebuild after a full reload, refresh the touched days (or supplier days) after an
+incremental load.
+"""
+from schema import DAILY_STATS_INSERT
+
+def rebuild_daily_stats(conn):
+    """Recompute the whole rollup from invoices"""
+    conn.execute("DELETE FROM daily_supplier_stats")
+    conn.execute(DAILY_STATS_INSERT + " GROUP BY supplier_id, invoice_date")
+
+def refresh_daily_stats(conn, days):
+    """Recompute the rollup rows of the given invoice dates only"""
+    days = sorted(set(days))
+    if not days:
+        return 0
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS affected_days (invoice_date TEXT PRIMARY KEY)")
+    conn.execute("DELETE FROM temp.affected_days")
+    conn.executemany("INSERT INTO temp.affected_days VALUES (?)", [(day,) for day in days])
+    conn.execute("DELETE FROM daily_supplier_stats WHERE invoice_date IN (SELECT invoice_date FROM temp.affected_days)")
+    conn.execute(
+        DAILY_STATS_INSERT
+        + " WHERE invoice_date IN (SELECT invoice_date FROM temp.affected_days)"
+        + " GROUP BY supplier_id, invoice_date"
+    )
+    return len(days)
+
+def refresh_supplier_days(conn, keys):
+    """Recompute only the given (supplier_id, invoice_date) rollup rows"""
+    keys = sorted(set(keys))
+    if not keys:
+        return 0
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS affected_supplier_days (supplier_id TEXT, invoice_date TEXT, PRIMARY KEY (supplier_id, invoice_date))")
+    conn.execute("DELETE FROM temp.affected_supplier_days")
+    conn.executemany("INSERT INTO temp.affected_supplier_days VALUES (?, ?)", keys)
+    affected = "(supplier_id, invoice_date) IN (SELECT supplier_id, invoice_date FROM temp.affected_supplier_days)"
+    conn.execute(f"DELETE FROM daily_supplier_stats WHERE {affected}")
+    conn.execute(DAILY_STATS_INSERT + f" WHERE {affected} GROUP BY supplier_id, invoice_date")
+    return len(keys)
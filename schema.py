@@ -0,0 +1,236 @@
+"""
+SQLite schema, migrations and connection settings for the supplier database
+"""
+import sqlite3
+import sys
+
+# Per-connection PRAGMAs: memory-map up to 256 MB of the file and keep a 64 MB page cache
+MMAP_SIZE = 256 * 1024 * 1024
+CACHE_SIZE_KB = 64 * 1024
+BUSY_TIMEOUT_SECONDS = 30
+
+# Dates are stored as ISO-8601 'YYYY-MM-DD' text so lexical order is chronological
+# order and range filters can use the indexes; the CHECK rejects anything else.
+TABLES = {
+    'suppliers': """
+        CREATE TABLE suppliers (
+            supplier_id TEXT PRIMARY KEY,
+            supplier_name TEXT NOT NULL,
+            country TEXT,
+            category TEXT
+        )
+    """,
+    'invoices': """
+        CREATE TABLE invoices (
+            invoice_id TEXT PRIMARY KEY,
+            supplier_id TEXT NOT NULL REFERENCES suppliers (supplier_id),
+            invoice_date TEXT NOT NULL CHECK (invoice_date IS date(invoice_date)),
+            due_date TEXT CHECK (due_date IS date(due_date)),
+            payment_date TEXT CHECK (payment_date IS date(payment_date)),
+            expected_delivery_date TEXT CHECK (expected_delivery_date IS date(expected_delivery_date)),
+            actual_delivery_date TEXT CHECK (actual_delivery_date IS date(actual_delivery_date)),
+            invoice_amount REAL NOT NULL,
+            is_accurate INTEGER NOT NULL CHECK (is_accurate IN (0, 1)),
+            is_rejected INTEGER NOT NULL CHECK (is_rejected IN (0, 1)),
+            payment_days INTEGER,
+            delivery_delay_days INTEGER
+        )
+    """,
+    'outstanding': """
+        CREATE TABLE outstanding (
+            outstanding_id INTEGER PRIMARY KEY,
+            supplier_id TEXT NOT NULL REFERENCES suppliers (supplier_id),
+            outstanding_amount REAL NOT NULL,
+            aging_days INTEGER
+        )
+    """
+}
+
+TABLE_COLUMNS = {
+    'suppliers': ['supplier_id', 'supplier_name', 'country', 'category'],
+    'invoices': [
+        'invoice_id', 'supplier_id', 'invoice_date', 'due_date', 'payment_date',
+        'expected_delivery_date', 'actual_delivery_date', 'invoice_amount',
+        'is_accurate', 'is_rejected', 'payment_days', 'delivery_delay_days'
+    ],
+    'outstanding': ['supplier_id', 'outstanding_amount', 'aging_days']
+}
+
+# Additive invoice counts and sums; every KPI is a ratio of two of these
+INVOICE_STATS_SELECT = """
+    COUNT(*) AS invoice_count,
+    COALESCE(SUM(CASE WHEN delivery_delay_days <= 0 THEN 1 ELSE 0 END), 0) AS on_time_count,
+    COALESCE(SUM(is_accurate), 0) AS accurate_count,
+    COALESCE(SUM(is_rejected), 0) AS rejected_count,
+    COALESCE(SUM(payment_days), 0.0) AS payment_days_sum,
+    COALESCE(SUM(invoice_amount), 0.0) AS amount_sum
+"""
+
+# Supplier x day rollup of INVOICE_STATS_SELECT; the day column keeps the invoices
+# name so the same invoice_date/supplier_id filters work against both tables.
+DAILY_STATS_TABLE = """
+    CREATE TABLE daily_supplier_stats (
+        supplier_id TEXT NOT NULL,
+        invoice_date TEXT NOT NULL,
+        invoice_count INTEGER NOT NULL,
+        on_time_count INTEGER NOT NULL,
+        accurate_count INTEGER NOT NULL,
+        rejected_count INTEGER NOT NULL,
+        payment_days_sum REAL NOT NULL,
+        amount_sum REAL NOT NULL,
+        PRIMARY KEY (supplier_id, invoice_date)
+    ) WITHOUT ROWID
+"""
+
+DAILY_STATS_INSERT = f"""
+    INSERT INTO daily_supplier_stats
+    SELECT supplier_id, invoice_date, {INVOICE_STATS_SELECT}
+    FROM invoices
+"""
+
+# Per-supplier EWMA sums of the rollup, maintained by anomaly.py; as_of is the last day folded in
+ANOMALY_STATE_TABLE = """
+    CREATE TABLE supplier_anomaly_state (
+        supplier_id TEXT PRIMARY KEY,
+        as_of TEXT NOT NULL,
+        fast_invoices REAL NOT NULL,
+        fast_on_time REAL NOT NULL,
+        fast_rejected REAL NOT NULL,
+        fast_weight_sq REAL NOT NULL,
+        slow_invoices REAL NOT NULL,
+        slow_on_time REAL NOT NULL,
+        slow_rejected REAL NOT NULL
+    ) WITHOUT ROWID
+"""
+
+INDEXES = [
+    "CREATE INDEX IF NOT EXISTS idx_invoices_supplier_date_id ON invoices (supplier_id, invoice_date, invoice_id)",
+    "CREATE INDEX IF NOT EXISTS idx_invoices_date ON invoices (invoice_date)",
+    "CREATE INDEX IF NOT EXISTS idx_outstanding_supplier ON outstanding (supplier_id)"
+]
+
+def configure_connection(conn):
+    """Apply per-connection performance PRAGMAs"""
+    conn.execute(f"PRAGMA mmap_size = {MMAP_SIZE}")
+    conn.execute(f"PRAGMA cache_size = -{CACHE_SIZE_KB}")
+    conn.execute("PRAGMA temp_store = MEMORY")
+    conn.execute("PRAGMA synchronous = NORMAL")
+    return conn
+
+def connect(db_path, **kwargs):
+    """Open a configured connection to the supplier database"""
+    kwargs.setdefault('timeout', BUSY_TIMEOUT_SECONDS)
+    return configure_connection(sqlite3.connect(db_path, **kwargs))
+
+def _table_exists(conn, table):
+    row = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone()
+    return row is not None
+
+def _create_tables(conn):
+    """Create typed tables with primary keys, rebuilding untyped tables written by DataFrame.to_sql"""
+    for table, ddl in TABLES.items():
+        if not _table_exists(conn, table):
+            conn.execute(ddl)
+            continue
+        legacy = f"legacy_{table}"
+        conn.execute(f"ALTER TABLE {table} RENAME TO {legacy}")
+        conn.execute(ddl)
+        legacy_columns = {row[1] for row in conn.execute(f"PRAGMA table_info({legacy})")}
+        columns = ', '.join(col for col in TABLE_COLUMNS[table] if col in legacy_columns)
+        conn.execute(f"INSERT INTO {table} ({columns}) SELECT {columns} FROM {legacy}")
+        conn.execute(f"DROP TABLE {legacy}")
+
+def create_indexes(conn):
+    """Index the invoice date and supplier filters used by every dashboard query"""
+    for ddl in INDEXES:
+        conn.execute(ddl)
+
+def drop_indexes(conn):
+    """Drop the secondary indexes so a bulk load can rebuild them once at the end"""
+    for ddl in INDEXES:
+        name = ddl.split(' ON ')[0].split()[-1]
+        conn.execute(f"DROP INDEX IF EXISTS {name}")
+
+def _create_daily_rollup(conn):
+    """Create and fill the supplier x day rollup table"""
+    conn.execute(DAILY_STATS_TABLE)
+    conn.execute("CREATE INDEX idx_daily_stats_date ON daily_supplier_stats (invoice_date)")
+    conn.execute(DAILY_STATS_INSERT + " GROUP BY supplier_id, invoice_date")
+
+def _extend_supplier_date_index(conn):
+    """Replace (supplier_id, invoice_date) with (supplier_id, invoice_date, invoice_id) for keyset paging"""
+    conn.execute("DROP INDEX IF EXISTS idx_invoices_supplier_date")
+    create_indexes(conn)
+
+def _create_data_generation(conn):
+    """Create the single-row generation counter, with a random id telling recreated databases apart"""
+    conn.execute("""
+        CREATE TABLE data_generation (
+            id INTEGER PRIMARY KEY CHECK (id = 0),
+            database_id TEXT NOT NULL,
+            generation INTEGER NOT NULL
+        )
+    """)
+    conn.execute("INSERT INTO data_generation VALUES (0, lower(hex(randomblob(8))), 0)")
+
+def _create_anomaly_state(conn):
+    """Create and fill the per-supplier anomaly state from the rollup"""
+    from anomaly import rebuild_anomaly_state
+    conn.execute(ANOMALY_STATE_TABLE)
+    rebuild_anomaly_state(conn)
+
+# Each migration runs once, in order; PRAGMA user_version records how many have been applied
+MIGRATIONS = [
+    _create_tables,
+    create_indexes,
+    _create_daily_rollup,
+    _extend_supplier_date_index,
+    _create_data_generation,
+    _create_anomaly_state
+]
+
+def migrate(conn):
+    """Bring a database up to the current schema version"""
+    conn.execute("PRAGMA journal_mode = WAL")
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            migration(conn)
+            conn.execute(f"PRAGMA user_version = {number}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    if version < len(MIGRATIONS):
+        conn.execute("PRAGMA optimize")
+    return len(MIGRATIONS)
+
+def bump_generation(conn):
+    """Record a data change; call inside the writing transaction"""
+    conn.execute("UPDATE data_generation SET generation = generation + 1")
+
+def read_generation(conn):
+    """Persistent '<database id>-<generation>' version of the data, or None before migration 5
+    
+    Unlike PRAGMA data_version it survives restarts and is the same in every process."""
+    try:
+        row = conn.execute("SELECT database_id, generation FROM data_generation").fetchone()
+    except sqlite3.OperationalError:
+        return None
+    return f"{row[0]}-{row[1]}"
+
+def insert_rows(conn, table, df, columns=None):
+    """Insert DataFrame rows into a table with executemany"""
+    columns = columns or [col for col in TABLE_COLUMNS[table] if col in df.columns]
+    placeholders = ', '.join('?' * len(columns))
+    conn.executemany(
+        f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders})",
+        zip(*(df[col].tolist() for col in columns))
+    )
+
+if __name__ == "__main__":
+    path = sys.argv[1] if len(sys.argv) > 1 else 'data/suppliers.db'
+    conn = connect(path)
+    print(f"✓ {path} migrated to schema version {migrate(conn)}")
+    conn.close()
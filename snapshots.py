@@ -0,0 +1,240 @@
+"""
+Materialized KPI snapshots for the dashboard's preset views
+
+After a data load, refresh_snapshots() computes the overall KPIs, per-supplier KPIs
+and monthly trends of every preset: all suppliers over the full range and the last
+30, 90 and 365 days, and each category over the full range. They are written to one
+gzip JSON file named after the backend's persistent data generation, next to the
+data (data/suppliers.snapshots/ for data/suppliers.db, snapshots/ inside a Parquet
+store). SnapshotDatabase answers matching filters from the file of the current
+generation and computes everything else live, so an outdated file is never served.
+
+Run with: python snapshots.py [--backend parquet --data data/parquet]
+"""
+import argparse
+import gzip
+import json
+import os
+import threading
+import time
+import pandas as pd
+from filters import PERIODS, period_start, resolve_supplier_filter
+from instrumentation import span
+from query_cache import normalize_filters
+from storage import open_backend
+
+SNAPSHOT_SUFFIX = '.json.gz'
+
+def snapshot_dir(location):
+    """Directory holding the snapshot files of a database file or store directory"""
+    if os.path.isdir(location):
+        return os.path.join(location, 'snapshots')
+    return os.path.splitext(location)[0] + '.snapshots'
+
+def snapshot_path(directory, generation):
+    return os.path.join(directory, f"{generation}{SNAPSHOT_SUFFIX}")
+
+def preset_filters(db, windows=tuple(PERIODS.values()), categories=True):
+    """The preset views as (name, start_date, end_date, supplier_ids, suppliers_df), without duplicate filters"""
+    min_date, max_date = db.get_date_range()
+    if min_date is None:
+        return []
+    suppliers_df = db.get_suppliers()
+    presets = [('all', min_date, max_date, None, suppliers_df)]
+    presets += [(f'last_{days}_days', period_start(min_date, max_date, days), max_date, None, suppliers_df) for days in windows]
+    if categories:
+        for category in sorted(suppliers_df['category'].dropna().unique()):
+            supplier_ids, category_df = resolve_supplier_filter(suppliers_df, category=category)
+            presets.append((f'category:{category}', min_date, max_date, supplier_ids, category_df))
+    
+    unique, seen = [], set()
+    for preset in presets:
+        key = normalize_filters(*preset[1:4])
+        if key not in seen:
+            seen.add(key)
+            unique.append(preset)
+    return unique
+
+def _frame_to_json(df):
+    """A DataFrame as JSON-ready lists; floats round-trip exactly and dtypes are restored on load"""
+    data = {}
+    for col in df.columns:
+        values = df[col]
+        if pd.api.types.is_datetime64_any_dtype(values):
+            values = values.dt.strftime('%Y-%m-%dT%H:%M:%S')
+        data[col] = values.tolist()
+    return {
+        'index': df.index.tolist(),
+        'columns': list(df.columns),
+        'dtypes': {col: str(dtype) for col, dtype in df.dtypes.items()},
+        'data': data
+    }
+
+def _frame_from_json(payload):
+    df = pd.DataFrame(payload['data'], index=payload['index'], columns=payload['columns'])
+    return df.astype(payload['dtypes'])
+
+def _json_default(value):
+    """numpy scalars in the overall KPI dict"""
+    return value.item()
+
+def build_snapshot(db, presets=None):
+    """Compute every preset's results through the backend's KPI methods; returns the file payload"""
+    presets = preset_filters(db) if presets is None else presets
+    entries = []
+    for name, start_date, end_date, supplier_ids, suppliers_df in presets:
+        with span('snapshot.build', name):
+            entries.append({
+                'name': name,
+                'start_date': start_date,
+                'end_date': end_date,
+                'supplier_ids': supplier_ids,
+                'suppliers': sorted(suppliers_df['supplier_id'].tolist()),
+                'overall_kpis': db.get_overall_kpis(start_date, end_date, supplier_ids),
+                'supplier_kpis': _frame_to_json(db.get_supplier_kpis(start_date, end_date, supplier_ids, suppliers_df)),
+                'monthly_trends': _frame_to_json(db.get_monthly_trends(start_date, end_date, supplier_ids))
+            })
+    return {'date_range': list(db.get_date_range()), 'created_at': time.time(), 'presets': entries}
+
+def refresh_snapshots(db, presets=None, directory=None):
+    """Write the current generation's snapshot file and remove older ones
+    
+    Returns the file path, or None when the backend has no persistent generation or
+    the data changed while computing (the load that changed it refreshes again)."""
+    directory = directory or snapshot_dir(db.location)
+    generation = db.data_generation()
+    if generation is None:
+        return None
+    payload = build_snapshot(db, presets)
+    if db.data_generation() != generation:
+        return None
+    payload['generation'] = generation
+    
+    os.makedirs(directory, exist_ok=True)
+    path = snapshot_path(directory, generation)
+    with gzip.open(path + '.tmp', 'wt', encoding='utf-8') as out:
+        json.dump(payload, out, default=_json_default)
+    os.replace(path + '.tmp', path)
+    for name in os.listdir(directory):
+        if name.endswith(SNAPSHOT_SUFFIX) and os.path.join(directory, name) != path:
+            os.remove(os.path.join(directory, name))
+    return path
+
+def refresh_store_snapshots(kind, location):
+    """Open a backend, refresh its snapshots and close it; called by the loaders after a data load"""
+    db = open_backend(kind, location)
+    try:
+        return refresh_snapshots(db)
+    finally:
+        db.close()
+
+def load_snapshot(path):
+    """Parse a snapshot file into {'date_range', 'presets': {filter key: entry}}, or None if missing"""
+    try:
+        with gzip.open(path, 'rt', encoding='utf-8') as source:
+            payload = json.load(source)
+    except FileNotFoundError:
+        return None
+    presets = {}
+    for entry in payload['presets']:
+        entry['supplier_kpis'] = _frame_from_json(entry['supplier_kpis'])
+        entry['monthly_trends'] = _frame_from_json(entry['monthly_trends'])
+        presets[normalize_filters(entry['start_date'], entry['end_date'], entry['supplier_ids'])] = entry
+    return {'date_range': tuple(payload['date_range']), 'presets': presets}
+
+class SnapshotDatabase:
+    """Storage backend wrapper that answers preset KPI views from the current snapshot file
+    
+    Other filters, and every other method, go to the wrapped backend."""
+    
+    def __init__(self, db, directory=None):
+        self.db = db
+        self.directory = directory or snapshot_dir(db.location)
+        self._state = None
+        self._snapshot = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+    
+    def __getattr__(self, name):
+        return getattr(self.db, name)
+    
+    def data_version(self):
+        return self.db.data_version()
+    
+    def close(self):
+        """Close the wrapped database"""
+        self.db.close()
+    
+    def _current(self):
+        """The snapshot of the current generation, reloaded when the generation or its file changes"""
+        generation = self.db.data_generation()
+        if generation is None:
+            return None
+        path = snapshot_path(self.directory, generation)
+        try:
+            state = (generation, os.stat(path).st_mtime_ns)
+        except OSError:
+            return None
+        with self._lock:
+            if state != self._state:
+                with span('snapshot.load', path):
+                    self._snapshot = load_snapshot(path)
+                self._state = state
+            return self._snapshot
+    
+    def lookup(self, start_date=None, end_date=None, supplier_ids=None):
+        """The snapshot entry for these filters, or None; missing dates mean the full range"""
+        snapshot = self._current()
+        entry = None
+        if snapshot is not None:
+            start, end, ids = normalize_filters(start_date, end_date, supplier_ids)
+            min_date, max_date = snapshot['date_range']
+            entry = snapshot['presets'].get((start or min_date, end or max_date, ids))
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return entry
+    
+    def get_overall_kpis(self, start_date=None, end_date=None, supplier_ids=None):
+        entry = self.lookup(start_date, end_date, supplier_ids)
+        if entry is None:
+            return self.db.get_overall_kpis(start_date, end_date, supplier_ids)
+        return dict(entry['overall_kpis'])
+    
+    def get_supplier_kpis(self, start_date=None, end_date=None, supplier_ids=None, suppliers_df=None):
+        entry = self.lookup(start_date, end_date, supplier_ids)
+        if entry is None or (suppliers_df is not None and sorted(suppliers_df['supplier_id'].tolist()) != entry['suppliers']):
+            return self.db.get_supplier_kpis(start_date, end_date, supplier_ids, suppliers_df)
+        return entry['supplier_kpis'].copy()
+    
+    def get_monthly_trends(self, start_date=None, end_date=None, supplier_ids=None):
+        entry = self.lookup(start_date, end_date, supplier_ids)
+        if entry is None:
+            return self.db.get_monthly_trends(start_date, end_date, supplier_ids)
+        return entry['monthly_trends'].copy()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Precompute KPI snapshots for the dashboard's preset views")
+    parser.add_argument('--backend', default=None, help="storage backend (sqlite or parquet; default from the environment)")
+    parser.add_argument('--data', default=None, help="database file or Parquet store directory")
+    parser.add_argument('--windows', type=int, nargs='*', default=list(PERIODS.values()), help="trailing windows in days")
+    parser.add_argument('--no-categories', action='store_true', help="skip the per-category presets")
+    args = parser.parse_args(argv)
+    
+    db = open_backend(args.backend, args.data)
+    started = time.perf_counter()
+    try:
+        presets = preset_filters(db, args.windows, not args.no_categories)
+        path = refresh_snapshots(db, presets)
+    finally:
+        db.close()
+    if path is None:
+        print("✗ No snapshots written: the store has no data generation or changed while computing")
+    else:
+        print(f"✓ {len(presets)} preset snapshots written to {path} in {time.perf_counter() - started:.1f}s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""
+Storage backend interface for the dashboard's read queries
+
+SupplierDatabase (SQLite) and ParquetDatabase (columnar Parquet files) implement
+it; open_backend() picks one from arguments or the environment:
+SUPPLIER_DASHBOARD_BACKEND=sqlite|parquet and SUPPLIER_DASHBOARD_DATA=<path>.
+"""
+import os
+from abc import ABC, abstractmethod
+from instrumentation import traced
+from kpi_calculator import (
+    calculate_supplier_kpis_from_stats,
+    calculate_overall_kpis_from_stats,
+    calculate_monthly_trends_from_stats
+)
+
+BACKEND_ENV_VAR = 'SUPPLIER_DASHBOARD_BACKEND'
+DATA_ENV_VAR = 'SUPPLIER_DASHBOARD_DATA'
+
+DEFAULT_PATHS = {
+    'sqlite': 'data/suppliers.db',
+    'parquet': 'data/parquet'
+}
+
+class StorageBackend(ABC):
+    """Read API used by the dashboard; KPIs are derived from the additive stats methods
+    
+    Date filters are inclusive 'YYYY-MM-DD' strings, supplier_ids a list, or None
+    for every supplier; an empty list matches no rows."""
+    
+    # open_backend(kind, location) reopens the same store, e.g. in a worker process
+    kind = None
+    
+    @property
+    @abstractmethod
+    def location(self):
+        """Path of the database file or store directory"""
+    
+    @abstractmethod
+    def get_suppliers(self):
+        """Get all suppliers"""
+    
+    @abstractmethod
+    def get_invoices(self, start_date=None, end_date=None, supplier_ids=None, typed=False):
+        """Get invoices with optional filters; typed=True applies coerce_invoice_dtypes"""
+    
+    @abstractmethod
+    def iter_invoices(self, start_date=None, end_date=None, supplier_ids=None, chunk_size=50_000, typed=False):
+        """Yield filtered invoices as DataFrames of at most chunk_size rows"""
+    
+    @abstractmethod
+    def get_supplier_invoice_page(self, supplier_id, start_date=None, end_date=None, after=None, page_size=20, descending=True, typed=False):
+        """Get one page of a supplier's invoices ordered by (invoice_date, invoice_id) and the key to continue after"""
+    
+    @abstractmethod
+    def get_outstanding(self, supplier_ids=None):
+        """Get outstanding amounts"""
+    
+    @abstractmethod
+    def get_date_range(self):
+        """Get min and max invoice dates"""
+    
+    @abstractmethod
+    def get_invoice_stats(self, start_date=None, end_date=None, supplier_ids=None, group_by=None):
+        """Get additive invoice counts and sums: a Series, or a DataFrame indexed by 'supplier_id' or 'month'"""
+    
+    @abstractmethod
+    def get_outstanding_stats(self, supplier_ids=None, group_by=None):
+        """Get outstanding counts and sums: a Series, or a DataFrame indexed by supplier_id"""
+    
+    @abstractmethod
+    def get_payment_days_counts(self, start_date=None, end_date=None, supplier_ids=None):
+        """Get the number of invoices for each payment_days value"""
+    
+    @abstractmethod
+    def get_daily_stats(self, start_date=None, end_date=None, supplier_ids=None):
+        """Get additive invoice stats per supplier and invoice_date ('YYYY-MM-DD')"""
+    
+    @abstractmethod
+    def get_day_counts(self, column, start_date=None, end_date=None, supplier_ids=None, by_supplier=False):
+        """Get the number of invoices for each non-missing value of a day column, optionally per supplier"""
+    
+    @abstractmethod
+    def data_version(self):
+        """A value that changes whenever the stored data changes"""
+    
+    def get_anomaly_state(self):
+        """Per-supplier EWMA state for the degradation alerts, folded from the full daily stats
+        
+        Backends that maintain the state as data arrives override this with a cheap read."""
+        from anomaly import build_anomaly_state
+        return build_anomaly_state(self.get_daily_stats())
+    
+    def data_generation(self):
+        """A version string that persists across processes and restarts, or None if the store has none"""
+        return None
+    
+    def close(self):
+        """Release connections or file handles"""
+    
+    @traced
+    def get_overall_kpis(self, start_date=None, end_date=None, supplier_ids=None):
+        """Calculate overall KPIs from the backend's invoice and outstanding totals"""
+        return calculate_overall_kpis_from_stats(
+            self.get_invoice_stats(start_date, end_date, supplier_ids),
+            self.get_outstanding_stats(supplier_ids)
+        )
+    
+    @traced
+    def get_supplier_kpis(self, start_date=None, end_date=None, supplier_ids=None, suppliers_df=None):
+        """Calculate per-supplier KPIs from the backend's per-supplier stats"""
+        if suppliers_df is None:
+            suppliers_df = self.get_suppliers()
+            if supplier_ids is not None:
+                suppliers_df = suppliers_df[suppliers_df['supplier_id'].isin(supplier_ids)]
+        return calculate_supplier_kpis_from_stats(
+            self.get_invoice_stats(start_date, end_date, supplier_ids, group_by='supplier_id'),
+            self.get_outstanding_stats(supplier_ids, group_by='supplier_id'),
+            suppliers_df
+        )
+    
+    @traced
+    def get_monthly_trends(self, start_date=None, end_date=None, supplier_ids=None):
+        """Calculate monthly KPI trends from the backend's per-month stats"""
+        return calculate_monthly_trends_from_stats(
+            self.get_invoice_stats(start_date, end_date, supplier_ids, group_by='month')
+        )
+
+def open_backend(kind=None, path=None, **kwargs):
+    """Open the configured storage backend ('sqlite' by default)"""
+    kind = kind or os.environ.get(BACKEND_ENV_VAR, 'sqlite')
+    path = path or os.environ.get(DATA_ENV_VAR) or DEFAULT_PATHS.get(kind)
+    if kind == 'sqlite':
+        from database import SupplierDatabase
+        return SupplierDatabase(path, **kwargs)
+    if kind == 'parquet':
+        from parquet_backend import ParquetDatabase
+        return ParquetDatabase(path, **kwargs)
+    raise ValueError(f"Unknown storage backend: {kind} (expected one of {', '.join(DEFAULT_PATHS)})")
@@ -0,0 +1,119 @@
+"""
+Tests for the streaming supplier degradation alerts
+Run with: pytest tests/test_anomaly.py -v
+"""
+import pytest
+import pandas as pd
+import numpy as np
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from anomaly import ANOMALY_STATE_COLUMNS, build_anomaly_state, detect_anomalies, fold_daily_stats, read_anomaly_state, rebuild_anomaly_state
+from data_generator import generate_suppliers, generate_invoices, generate_outstanding, save_to_sqlite
+from database import SupplierDatabase
+from ingest import ingest_invoices
+from schema import connect
+
+def daily_history(rates, days=200, invoices_per_day=20, start='2024-01-01'):
+    """Synthetic rollup rows: supplier -> (on-time rate, rejection rate) per day index"""
+    rows = []
+    dates = pd.date_range(start, periods=days).strftime('%Y-%m-%d')
+    for supplier_id, rate in rates.items():
+        for day, date in enumerate(dates):
+            on_time, rejected = rate(day)
+            rows.append({
+                'supplier_id': supplier_id,
+                'invoice_date': date,
+                'invoice_count': invoices_per_day,
+                'on_time_count': round(on_time * invoices_per_day),
+                'rejected_count': round(rejected * invoices_per_day)
+            })
+    return pd.DataFrame(rows)
+
+def assert_same_state(actual, expected):
+    actual = actual.sort_values('supplier_id').reset_index(drop=True)
+    expected = expected.sort_values('supplier_id').reset_index(drop=True)
+    assert actual['supplier_id'].tolist() == expected['supplier_id'].tolist()
+    assert actual['as_of'].tolist() == expected['as_of'].tolist()
+    for col in ANOMALY_STATE_COLUMNS[2:]:
+        np.testing.assert_allclose(actual[col].to_numpy('float64'), expected[col].to_numpy('float64'), rtol=1e-9, atol=1e-9)
+
+@pytest.fixture
+def loaded(tmp_path):
+    suppliers = generate_suppliers(8)
+    invoices = generate_invoices(suppliers, 600)
+    db_path = str(tmp_path / 'suppliers.db')
+    save_to_sqlite(suppliers, invoices.iloc[:400], generate_outstanding(suppliers, 10), db_path=db_path)
+    return db_path, invoices
+
+def test_incremental_folds_match_one_pass():
+    daily = daily_history({'SUP001': lambda day: (0.9, 0.05), 'SUP002': lambda day: (0.8, 0.1)}, days=120)
+    daily = daily[~((daily['supplier_id'] == 'SUP002') & (daily['invoice_date'] > '2024-03-15'))]
+    state = build_anomaly_state(daily[daily['invoice_date'] <= '2024-02-10'])
+    for end in ['2024-03-01', '2024-03-20', '2024-04-29']:
+        state = fold_daily_stats(state, daily[(daily['invoice_date'] > state['as_of'].iloc[0]) & (daily['invoice_date'] <= end)], end)
+    assert_same_state(state, build_anomaly_state(daily))
+
+def test_corrections_to_folded_days_are_exact():
+    daily = daily_history({'SUP001': lambda day: (0.9, 0.05)}, days=60)
+    state = build_anomaly_state(daily)
+    corrected = daily.copy()
+    corrected.loc[10, 'rejected_count'] += 7
+    delta = corrected.loc[[10]].assign(invoice_count=0, on_time_count=0, rejected_count=7)
+    assert_same_state(fold_daily_stats(state, delta, state['as_of'].iloc[0]), build_anomaly_state(corrected))
+
+def test_degraded_suppliers_are_flagged():
+    daily = daily_history({
+        'SUP001': lambda day: (0.9, 0.05),
+        'SUP002': lambda day: (0.9, 0.05) if day < 190 else (0.9, 0.4),
+        'SUP003': lambda day: (0.9, 0.05) if day < 190 else (0.5, 0.05),
+        'SUP004': lambda day: (0.9, 0.05) if day < 190 else (0.98, 0.0)
+    })
+    scores = detect_anomalies(build_anomaly_state(daily)).set_index('supplier_id')
+    assert scores['flagged'].to_dict() == {'SUP001': False, 'SUP002': True, 'SUP003': True, 'SUP004': False}
+    assert scores.loc['SUP002', 'reason'] == 'Rejection rate'
+    assert scores.loc['SUP003', 'reason'] == 'On-time delivery'
+    assert scores.loc['SUP002', 'rejection_recent'] > scores.loc['SUP002', 'rejection_baseline']
+    assert scores.index[0] in ('SUP002', 'SUP003')
+
+def test_too_few_recent_invoices_are_not_flagged():
+    # A quiet supplier's single bad invoice is not enough evidence
+    daily = daily_history({'SUP001': lambda day: (0.9, 0.05)}, days=150)
+    late = pd.DataFrame([{'supplier_id': 'SUP001', 'invoice_date': '2024-07-18', 'invoice_count': 1, 'on_time_count': 0, 'rejected_count': 1}])
+    scores = detect_anomalies(build_anomaly_state(pd.concat([daily, late])))
+    assert scores['recent_invoices'].iloc[0] < 10
+    assert not scores['flagged'].any()
+
+def test_ingest_keeps_the_state_in_step(loaded, tmp_path):
+    db_path, invoices = loaded
+    drop = invoices.iloc[300:].copy()
+    drop.loc[drop.index[:30], 'is_rejected'] = 1
+    drop.loc[drop.index[30:40], 'invoice_date'] = '2020-06-15'
+    path = str(tmp_path / 'drop.csv')
+    drop.to_csv(path, index=False)
+    ingest_invoices(path, db_path, chunk_size=64)
+    
+    conn = connect(db_path)
+    incremental = read_anomaly_state(conn)
+    conn.execute("BEGIN IMMEDIATE")
+    rebuild_anomaly_state(conn)
+    conn.commit()
+    rebuilt = read_anomaly_state(conn)
+    conn.close()
+    assert_same_state(incremental, rebuilt)
+    
+    db = SupplierDatabase(db_path)
+    assert_same_state(db.get_anomaly_state(), build_anomaly_state(db.get_daily_stats()))
+    db.close()
+
+def test_parquet_store_copies_the_state(loaded, tmp_path):
+    pytest.importorskip('pyarrow')
+    from parquet_backend import ParquetDatabase, build_parquet_store
+    db_path, _ = loaded
+    store = str(tmp_path / 'parquet')
+    build_parquet_store(db_path, store)
+    db = SupplierDatabase(db_path)
+    assert_same_state(ParquetDatabase(store).get_anomaly_state(), db.get_anomaly_state())
+    db.close()
@@ -0,0 +1,134 @@
+"""
+Tests for the headless JSON API
+Run with: pytest tests/test_api.py -v
+"""
+import pytest
+import sys
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+pytest.importorskip('httpx')
+from starlette.testclient import TestClient
+
+import api
+from api import create_app
+from data_generator import generate_suppliers, generate_invoices, generate_outstanding, save_to_sqlite
+from database import SupplierDatabase
+from ingest import ingest_invoices
+from query_cache import CachedSupplierDatabase
+
+@pytest.fixture
+def loaded(tmp_path):
+    suppliers = generate_suppliers(8)
+    invoices = generate_invoices(suppliers, 600)
+    db_path = str(tmp_path / 'suppliers.db')
+    save_to_sqlite(suppliers, invoices.iloc[:500], generate_outstanding(suppliers, 20), db_path=db_path)
+    db = CachedSupplierDatabase(SupplierDatabase(db_path))
+    yield db, suppliers, invoices
+    db.close()
+
+@pytest.fixture
+def client(loaded):
+    with TestClient(create_app(loaded[0])) as client:
+        yield client
+
+def test_kpis_use_sidebar_filters(client, loaded):
+    db, suppliers, _ = loaded
+    category = suppliers['category'].iloc[0]
+    in_category = suppliers[suppliers['category'] == category]['supplier_id'].tolist()
+    response = client.get('/api/kpis', params={'start_date': '2000-01-01', 'category': category})
+    assert response.status_code == 200
+    body = response.json()
+    assert body['filters'] == {'start_date': '2000-01-01', 'end_date': None, 'supplier_ids': in_category}
+    assert body['kpis'] == db.get_overall_kpis('2000-01-01', None, in_category)
+    
+    names = suppliers['supplier_name'].iloc[:2].tolist()
+    response = client.get('/api/suppliers/kpis', params={'supplier': names, 'supplier_id': 'SUP005'})
+    assert [row['supplier_id'] for row in response.json()['suppliers']] == ['SUP001', 'SUP002', 'SUP005']
+    
+    trends = client.get('/api/trends').json()['months']
+    expected = db.get_monthly_trends()
+    assert [row['month'] for row in trends] == expected['month'].dt.strftime('%Y-%m').tolist()
+    assert sum(row['invoice_count'] for row in trends) == 500
+
+def test_bad_filters_are_rejected(client):
+    assert client.get('/api/kpis', params={'start_date': '2025-02-30'}).status_code == 400
+    assert 'Unknown supplier' in client.get('/api/kpis', params={'supplier': 'Nobody Ltd'}).json()['error']
+    assert client.get('/api/kpis', params={'category': 'Nothing'}).status_code == 400
+    assert client.get('/api/suppliers/SUP999/invoices').status_code == 404
+    assert client.get('/api/suppliers/SUP001/invoices', params={'page_size': 0}).status_code == 400
+    assert client.get('/api/suppliers/SUP001/invoices', params={'after_id': 'INV1'}).status_code == 400
+
+def test_computation_errors_are_not_client_errors(loaded, monkeypatch):
+    db = loaded[0]
+    def broken(*args, **kwargs):
+        raise ValueError("corrupt stats")
+    monkeypatch.setattr(db, 'get_overall_kpis', broken)
+    with TestClient(create_app(db), raise_server_exceptions=False) as client:
+        assert client.get('/api/kpis').status_code == 500
+        assert client.get('/api/kpis', params={'category': 'Nothing'}).status_code == 400
+
+def test_disjoint_filters_select_no_rows(client, loaded):
+    _, suppliers, _ = loaded
+    category = suppliers['category'].iloc[0]
+    outside = suppliers[suppliers['category'] != category]['supplier_id'].iloc[0]
+    params = {'supplier_id': outside, 'category': category}
+    body = client.get('/api/kpis', params=params).json()
+    assert body['filters']['supplier_ids'] == []
+    assert body['kpis']['total_outstanding'] == 0
+    assert client.get('/api/suppliers/kpis', params=params).json()['suppliers'] == []
+    assert client.get('/api/trends', params=params).json()['months'] == []
+
+def test_invoice_pages_follow_next_links(client, loaded):
+    db, _, _ = loaded
+    seen = []
+    url = '/api/suppliers/SUP003/invoices?page_size=7&order=asc'
+    while url:
+        body = client.get(url).json()
+        seen += [row['invoice_id'] for row in body['invoices']]
+        url = body['next_url']
+    expected = db.get_invoices(supplier_ids=['SUP003']).sort_values(['invoice_date', 'invoice_id'])
+    assert seen == expected['invoice_id'].tolist()
+
+def test_etag_revalidation_follows_the_data_version(client, loaded, tmp_path):
+    db, _, invoices = loaded
+    first = client.get('/api/kpis')
+    etag = first.headers['etag']
+    assert client.get('/api/kpis', params={'category': 'x'}).headers.get('etag') != etag
+    
+    misses = db.cache.misses
+    cached = client.get('/api/kpis', headers={'If-None-Match': etag})
+    assert cached.status_code == 304 and cached.content == b''
+    assert db.cache.misses == misses
+    
+    path = str(tmp_path / 'drop.csv')
+    invoices.iloc[500:].to_csv(path, index=False)
+    ingest_invoices(path, db.db.db_path)
+    fresh = client.get('/api/kpis', headers={'If-None-Match': etag})
+    assert fresh.status_code == 200 and fresh.headers['etag'] != etag
+    assert fresh.json()['kpis'] != first.json()['kpis']
+
+def test_etags_survive_restarts_and_match_across_workers(loaded, monkeypatch):
+    db = loaded[0]
+    with TestClient(create_app(db)) as client:
+        etag = client.get('/api/kpis').headers['etag']
+    # Another worker process, or the same server after a restart, has a new epoch
+    monkeypatch.setattr(api, 'API_EPOCH', 'restarted')
+    with TestClient(create_app(db)) as client:
+        assert client.get('/api/kpis', headers={'If-None-Match': etag}).status_code == 304
+    
+    monkeypatch.setattr(db.db, 'data_generation', lambda: None)
+    with TestClient(create_app(db)) as client:
+        fallback = client.get('/api/kpis').headers['etag']
+        assert fallback != etag
+        assert client.get('/api/kpis', headers={'If-None-Match': fallback}).status_code == 304
+
+def test_concurrent_requests(client, loaded):
+    db, _, _ = loaded
+    urls = ['/api/kpis', '/api/suppliers/kpis', '/api/trends', '/api/suppliers/SUP001/invoices'] * 10
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        responses = list(pool.map(client.get, urls))
+    assert all(response.status_code == 200 for response in responses)
+    assert len({response.text for response in responses[::4]}) == 1
@@ -0,0 +1,48 @@
+"""
+Smoke tests for the benchmark runner (not performance tests themselves)
+Run with: pytest tests/test_benchmarks.py -v
+"""
+import json
+import pytest
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from benchmarks.run import compare, main
+
+def test_compare_flags_only_real_slowdowns():
+    baseline = {'results': [
+        {'case': 'a', 'size': 1000, 'wall_s': 0.100},
+        {'case': 'b', 'size': 1000, 'wall_s': 0.100},
+        {'case': 'tiny', 'size': 1000, 'wall_s': 0.0001}
+    ]}
+    current = [
+        {'case': 'a', 'size': 1000, 'wall_s': 0.110},
+        {'case': 'b', 'size': 1000, 'wall_s': 0.200},
+        {'case': 'tiny', 'size': 1000, 'wall_s': 0.0004},
+        {'case': 'new', 'size': 1000, 'wall_s': 1.0}
+    ]
+    regressions = compare(current, baseline, threshold=0.25)
+    assert [(case, size) for case, size, *_ in regressions] == [('b', 1000)]
+
+def test_runner_writes_comparable_json(tmp_path):
+    output = str(tmp_path / 'results.json')
+    args = ['--sizes', '300', '--suppliers', '5', '--repeat', '1', '--data-dir', str(tmp_path), '--output', output]
+    assert main(args) == 0
+    with open(output) as handle:
+        report = json.load(handle)
+    cases = {record['case'] for record in report['results']}
+    assert {'get_invoices[all]', 'get_outstanding[all]', 'calculate_supplier_kpis', 'monthly_trends[pandas]', 'export_csv[to_csv]'} <= cases
+    assert all(record['wall_s'] >= 0 and 'peak_rss_delta_mb' in record for record in report['results'])
+    assert main(args + ['--baseline', output, '--threshold', '100']) == 0
+
+def test_runner_times_each_backend(tmp_path):
+    pytest.importorskip('pyarrow')
+    output = str(tmp_path / 'results.json')
+    assert main(['--sizes', '300', '--suppliers', '5', '--repeat', '1', '--data-dir', str(tmp_path), '--output', output, '--backends', 'sqlite', 'parquet']) == 0
+    with open(output) as handle:
+        records = json.load(handle)['results']
+    backends = {record['backend'] for record in records if record['case'] == 'get_invoices[all]'}
+    assert backends == {'sqlite', 'parquet'}
+    assert sum(record['case'] == 'calculate_supplier_kpis' for record in records) == 1
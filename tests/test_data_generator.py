@@ -0,0 +1,78 @@
+"""
+Tests for the vectorized data generator
+Run with: pytest tests/test_data_generator.py -v
+"""
+import pytest
+import pandas as pd
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import data_generator
+from data_generator import generate_dataset, generate_suppliers, generate_invoices, generate_invoice_chunks, main
+from database import SupplierDatabase
+from schema import connect
+
+SUPPLIER_IDS = ['SUP001', 'SUP002', 'SUP003']
+
+def test_chunks_match_legacy_layout():
+    legacy = generate_invoices(generate_suppliers(3), 10)
+    chunk = next(generate_invoice_chunks(SUPPLIER_IDS, 10, seed=1, start_date='2024-01-01'))
+    assert list(chunk.columns) == list(legacy.columns)
+    assert (chunk['payment_days'] == (pd.to_datetime(chunk['payment_date']) - pd.to_datetime(chunk['invoice_date'])).dt.days).all()
+    assert (chunk['delivery_delay_days'] == (pd.to_datetime(chunk['actual_delivery_date']) - pd.to_datetime(chunk['expected_delivery_date'])).dt.days).all()
+
+def test_chunks_are_bounded_and_reproducible():
+    first = list(generate_invoice_chunks(SUPPLIER_IDS, 2500, chunk_size=1000, seed=7, start_date='2024-01-01'))
+    second = list(generate_invoice_chunks(SUPPLIER_IDS, 2500, chunk_size=1000, seed=7, start_date='2024-01-01'))
+    assert [len(chunk) for chunk in first] == [1000, 1000, 500]
+    pd.testing.assert_frame_equal(pd.concat(first), pd.concat(second))
+    assert pd.concat(first)['invoice_id'].is_unique
+
+def test_cli_streams_into_sqlite_and_parquet(tmp_path):
+    pytest.importorskip('pyarrow')
+    db_path = str(tmp_path / 'bench.db')
+    parquet_path = str(tmp_path / 'invoices.parquet')
+    main(['--suppliers', '5', '--invoices', '1200', '--outstanding', '10', '--chunk-size', '500',
+          '--db', db_path, '--parquet', parquet_path, '--no-csv', '--start-date', '2024-01-01'])
+    
+    db = SupplierDatabase(db_path)
+    assert len(db.get_invoices()) == 1200
+    assert db.get_invoice_stats()['invoice_count'] == 1200
+    assert len(pd.read_parquet(parquet_path)) == 1200
+    db.close()
+
+def test_progress_goes_to_the_callback(tmp_path, capsys):
+    reports = []
+    generate_dataset(3, 1200, 10, db_path=str(tmp_path / 'bench.db'), chunk_size=500, start_date='2024-01-01', progress=lambda report: reports.append(dict(report)))
+    assert [report['written'] for report in reports] == [500, 1000, 1200]
+    assert all(report['total'] == 1200 for report in reports)
+    assert capsys.readouterr().out == ''
+
+def test_failed_load_keeps_the_previous_data(tmp_path, monkeypatch):
+    db_path = str(tmp_path / 'bench.db')
+    generate_dataset(5, 1200, 10, db_path=db_path, chunk_size=500, start_date='2024-01-01')
+    
+    def failing_chunks(*args, **kwargs):
+        yield next(generate_invoice_chunks(SUPPLIER_IDS, 100, start_date='2024-01-01'))
+        raise RuntimeError("disk full")
+    monkeypatch.setattr(data_generator, 'generate_invoice_chunks', failing_chunks)
+    with pytest.raises(RuntimeError):
+        generate_dataset(3, 1000, 10, db_path=db_path, start_date='2024-01-01')
+    
+    conn = connect(db_path)
+    indexes = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    assert conn.execute("SELECT COUNT(*) FROM invoices").fetchone()[0] == 1200
+    assert conn.execute("SELECT SUM(invoice_count) FROM daily_supplier_stats").fetchone()[0] == 1200
+    conn.close()
+    assert {'idx_invoices_date', 'idx_invoices_supplier_date_id'} <= indexes
+
+def test_cli_refuses_to_overwrite_without_replace(tmp_path, capsys):
+    db_path = str(tmp_path / 'bench.db')
+    args = ['--suppliers', '3', '--invoices', '100', '--outstanding', '5', '--db', db_path, '--no-csv']
+    main(args)
+    with pytest.raises(SystemExit):
+        main(args)
+    assert '--replace' in capsys.readouterr().err
+    main(args + ['--replace'])
@@ -0,0 +1,277 @@
+"""
+Tests for the SQLite schema and SQL-side KPI aggregation in SupplierDatabase
+Run with: pytest tests/test_database.py -v
+"""
+import pytest
+import pandas as pd
+import sqlite3
+import sys
+from concurrent.futures import ThreadPoolExecutor
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from database import SupplierDatabase, INVOICE_STATS_SELECT, coerce_invoice_dtypes
+from data_generator import generate_suppliers, generate_invoices, generate_outstanding, save_to_sqlite
+from kpi_calculator import (
+    calculate_overall_kpis,
+    calculate_supplier_kpis,
+    calculate_monthly_trends,
+    calculate_supplier_kpis_from_stats,
+    aggregate_daily_stats,
+    aggregate_outstanding_stats
+)
+from rollup import rebuild_daily_stats, refresh_daily_stats
+from schema import insert_rows
+
+@pytest.fixture(scope='module')
+def generated_data():
+    suppliers = generate_suppliers(25)
+    invoices = generate_invoices(suppliers.head(20), 1500)
+    outstanding = generate_outstanding(suppliers.head(15), 80)
+    return suppliers, invoices, outstanding
+
+@pytest.fixture(scope='module')
+def db(generated_data, tmp_path_factory):
+    db_path = str(tmp_path_factory.mktemp('db') / 'suppliers.db')
+    save_to_sqlite(*generated_data, db_path=db_path)
+    return SupplierDatabase(db_path)
+
+def date_window(invoices):
+    dates = sorted(invoices['invoice_date'])
+    return dates[len(dates) // 4], dates[3 * len(dates) // 4]
+
+def test_overall_kpis_match_pandas(db, generated_data):
+    suppliers, invoices, outstanding = generated_data
+    start, end = date_window(invoices)
+    ids = suppliers['supplier_id'].tolist()[:8]
+    subset = invoices[(invoices['invoice_date'] >= start) & (invoices['invoice_date'] <= end) & invoices['supplier_id'].isin(ids)]
+    
+    result = db.get_overall_kpis(start, end, ids)
+    expected = calculate_overall_kpis(subset, outstanding[outstanding['supplier_id'].isin(ids)])
+    assert result == pytest.approx(expected)
+
+def test_supplier_kpis_match_pandas(db, generated_data):
+    suppliers, invoices, outstanding = generated_data
+    start, end = date_window(invoices)
+    subset = invoices[(invoices['invoice_date'] >= start) & (invoices['invoice_date'] <= end)]
+    
+    result = db.get_supplier_kpis(start, end, suppliers_df=suppliers)
+    expected = calculate_supplier_kpis(subset, outstanding, suppliers)
+    pd.testing.assert_frame_equal(result, expected, check_dtype=False)
+
+def test_day_counts_match_pandas(db, generated_data):
+    _, invoices, _ = generated_data
+    start, end = date_window(invoices)
+    subset = invoices[(invoices['invoice_date'] >= start) & (invoices['invoice_date'] <= end)]
+    result = db.get_day_counts('delivery_delay_days', start, end, by_supplier=True)
+    expected = subset.groupby(['supplier_id', 'delivery_delay_days']).size()
+    assert result.set_index(['supplier_id', 'delivery_delay_days'])['invoice_count'].to_dict() == expected.to_dict()
+    with pytest.raises(ValueError):
+        db.get_day_counts('invoice_amount')
+
+def test_monthly_trends_match_pandas(db, generated_data):
+    _, invoices, _ = generated_data
+    result = db.get_monthly_trends()
+    expected = calculate_monthly_trends(invoices)
+    pd.testing.assert_frame_equal(result, expected, check_dtype=False)
+
+def test_empty_filter_returns_zero_kpis(db):
+    result = db.get_overall_kpis('1900-01-01', '1900-12-31')
+    assert result['on_time_delivery'] == 0.0
+    assert result['avg_payment_days'] == 0.0
+    assert len(db.get_monthly_trends('1900-01-01', '1900-12-31')) == 0
+
+def query_plan(db, query, params=()):
+    conn = db.get_connection()
+    plan = [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + query, params)]
+    conn.close()
+    return plan
+
+def assert_uses_index(plan, table):
+    steps = [step for step in plan if f' {table} ' in f' {step} ']
+    assert steps, plan
+    assert all('USING' in step and ('INDEX' in step or 'PRIMARY KEY' in step) for step in steps), plan
+
+@pytest.mark.parametrize('start, end, ids', [
+    ('2024-01-01', '2024-06-30', None),
+    (None, '2024-06-30', None),
+    ('2024-01-01', None, ['SUP001']),
+    ('2024-01-01', '2024-06-30', ['SUP001', 'SUP002']),
+    (None, None, ['SUP003'])
+])
+def test_invoice_filters_use_indexes(db, start, end, ids):
+    where, params = db._invoice_filter(start, end, ids)
+    assert_uses_index(query_plan(db, "SELECT * FROM invoices" + where, params), 'invoices')
+    grouped = f"SELECT supplier_id, {INVOICE_STATS_SELECT} FROM invoices{where} GROUP BY supplier_id"
+    assert_uses_index(query_plan(db, grouped, params), 'invoices')
+
+def test_outstanding_and_date_range_use_indexes(db):
+    assert_uses_index(query_plan(db, "SELECT * FROM outstanding WHERE supplier_id IN (?, ?)", ['SUP001', 'SUP002']), 'outstanding')
+    assert_uses_index(query_plan(db, "SELECT MIN(invoice_date), MAX(invoice_date) FROM invoices"), 'invoices')
+
+def test_schema_settings(db):
+    conn = db.get_connection()
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == 'wal'
+    assert conn.execute("PRAGMA mmap_size").fetchone()[0] > 0
+    assert conn.execute("SELECT typeof(is_accurate), typeof(invoice_amount) FROM invoices LIMIT 1").fetchone() == ('integer', 'real')
+    with pytest.raises(sqlite3.IntegrityError):
+        conn.execute("INSERT INTO invoices (invoice_id, supplier_id, invoice_date, invoice_amount, is_accurate, is_rejected) VALUES ('X1', 'SUP001', '01/02/2024', 1.0, 1, 0)")
+    conn.close()
+
+def test_migrates_legacy_to_sql_database(generated_data, tmp_path):
+    suppliers, invoices, outstanding = generated_data
+    db_path = str(tmp_path / 'legacy.db')
+    conn = sqlite3.connect(db_path)
+    suppliers.to_sql('suppliers', conn, index=False)
+    invoices.to_sql('invoices', conn, index=False)
+    outstanding.to_sql('outstanding', conn, index=False)
+    conn.close()
+    
+    db = SupplierDatabase(db_path)
+    db.migrate()
+    assert len(db.get_invoices()) == len(invoices)
+    assert len(db.get_outstanding()) == len(outstanding)
+    assert_uses_index(query_plan(db, "SELECT * FROM invoices WHERE invoice_date >= ?", ['2024-01-01']), 'invoices')
+
+def test_pool_reuses_read_only_connections(db):
+    with db.read_connection() as first:
+        pass
+    with db.read_connection() as second:
+        assert second is first
+        with pytest.raises(sqlite3.OperationalError):
+            second.execute("DELETE FROM invoices")
+
+def test_pool_serves_concurrent_readers(generated_data, tmp_path):
+    suppliers, invoices, outstanding = generated_data
+    db_path = str(tmp_path / 'pool.db')
+    save_to_sqlite(suppliers, invoices, outstanding, db_path=db_path)
+    db = SupplierDatabase(db_path, pool_size=2)
+    ids = suppliers['supplier_id'].tolist()
+    
+    with ThreadPoolExecutor(max_workers=12) as executor:
+        counts = list(executor.map(lambda sid: len(db.get_invoices(supplier_ids=[sid])), ids * 4))
+    
+    expected = invoices['supplier_id'].value_counts().reindex(ids, fill_value=0).tolist() * 4
+    assert counts == expected
+    assert db.pool._idle.qsize() <= 2
+    db.close()
+
+def test_unpooled_database(generated_data, tmp_path):
+    db_path = str(tmp_path / 'unpooled.db')
+    save_to_sqlite(*generated_data, db_path=db_path)
+    db = SupplierDatabase(db_path, pool_size=0)
+    assert db.pool is None
+    assert len(db.get_suppliers()) == len(generated_data[0])
+
+def test_rollup_matches_invoice_scan(db, generated_data):
+    suppliers, invoices, _ = generated_data
+    start, end = date_window(invoices)
+    ids = suppliers['supplier_id'].tolist()[:5]
+    scan = SupplierDatabase(db.db_path, use_rollup=False)
+    assert db.has_rollup() and not scan.has_rollup()
+    
+    assert db.get_overall_kpis(start, end, ids) == pytest.approx(scan.get_overall_kpis(start, end, ids))
+    pd.testing.assert_frame_equal(db.get_supplier_kpis(start, end), scan.get_supplier_kpis(start, end))
+    pd.testing.assert_frame_equal(db.get_monthly_trends(start, end, ids), scan.get_monthly_trends(start, end, ids))
+    daily = ['supplier_id', 'invoice_date']
+    pd.testing.assert_frame_equal(scan.get_daily_stats(start, end, ids).sort_values(daily, ignore_index=True),
+                                  db.get_daily_stats(start, end, ids).sort_values(daily, ignore_index=True), check_dtype=False)
+
+def test_kpis_from_rollup_frame(db, generated_data):
+    suppliers, invoices, outstanding = generated_data
+    stats = aggregate_daily_stats(db.get_daily_stats(), 'supplier_id')
+    result = calculate_supplier_kpis_from_stats(stats, aggregate_outstanding_stats(outstanding), suppliers)
+    pd.testing.assert_frame_equal(result, calculate_supplier_kpis(invoices, outstanding, suppliers))
+
+def test_rollup_queries_use_indexes(db):
+    where, params = db._invoice_filter('2024-01-01', '2024-06-30', ['SUP001', 'SUP002'])
+    assert_uses_index(query_plan(db, "SELECT * FROM daily_supplier_stats" + where, params), 'daily_supplier_stats')
+    where, params = db._invoice_filter('2024-01-01', '2024-06-30')
+    assert_uses_index(query_plan(db, "SELECT * FROM daily_supplier_stats" + where, params), 'daily_supplier_stats')
+
+def test_incremental_refresh_matches_rebuild(generated_data, tmp_path):
+    suppliers, invoices, outstanding = generated_data
+    db_path = str(tmp_path / 'rollup.db')
+    save_to_sqlite(suppliers, invoices.iloc[:1000], outstanding, db_path=db_path)
+    
+    new_invoices = invoices.iloc[1000:]
+    conn = SupplierDatabase(db_path).get_connection()
+    insert_rows(conn, 'invoices', new_invoices)
+    conn.execute("DELETE FROM invoices WHERE invoice_id = ?", (invoices['invoice_id'].iloc[0],))
+    refreshed = refresh_daily_stats(conn, list(new_invoices['invoice_date']) + [invoices['invoice_date'].iloc[0]])
+    conn.commit()
+    incremental = pd.read_sql_query("SELECT * FROM daily_supplier_stats ORDER BY supplier_id, invoice_date", conn)
+    
+    rebuild_daily_stats(conn)
+    conn.commit()
+    rebuilt = pd.read_sql_query("SELECT * FROM daily_supplier_stats ORDER BY supplier_id, invoice_date", conn)
+    conn.close()
+    
+    assert refreshed < len(rebuilt)
+    pd.testing.assert_frame_equal(incremental, rebuilt)
+
+def test_typed_invoices_follow_schema_contract(db):
+    raw = db.get_invoices()
+    typed = db.get_invoices(typed=True)
+    assert typed['invoice_date'].dtype.kind == 'M'
+    assert typed['payment_date'].dtype.kind == 'M'
+    assert isinstance(typed['supplier_id'].dtype, pd.CategoricalDtype)
+    assert str(typed['is_accurate'].dtype) == 'uint8'
+    assert str(typed['delivery_delay_days'].dtype) == 'int16'
+    assert typed.memory_usage(deep=True).sum() * 2 < raw.memory_usage(deep=True).sum()
+    chunk = next(db.iter_invoices(chunk_size=100, typed=True))
+    assert chunk.dtypes.drop('supplier_id').equals(typed.dtypes.drop('supplier_id'))
+    assert isinstance(chunk['supplier_id'].dtype, pd.CategoricalDtype)
+
+def test_kpis_on_typed_frames_match(db, generated_data):
+    suppliers, invoices, outstanding = generated_data
+    typed = coerce_invoice_dtypes(invoices)
+    pd.testing.assert_frame_equal(
+        calculate_supplier_kpis(typed, outstanding, suppliers),
+        calculate_supplier_kpis(invoices, outstanding, suppliers)
+    )
+    assert calculate_overall_kpis(typed, outstanding) == calculate_overall_kpis(invoices, outstanding)
+    pd.testing.assert_frame_equal(calculate_monthly_trends(typed), calculate_monthly_trends(invoices))
+
+
+@pytest.mark.parametrize('descending', [True, False])
+def test_keyset_pages_walk_a_supplier_in_order(db, descending):
+    start, end = date_window(db.get_invoices())
+    expected = db.get_invoices(start, end, ['SUP002']).sort_values(['invoice_date', 'invoice_id'], ascending=not descending)
+    pages = []
+    key = None
+    while True:
+        page, key = db.get_supplier_invoice_page('SUP002', start, end, after=key, page_size=7, descending=descending)
+        pages.append(page)
+        assert len(page) <= 7
+        if key is None:
+            break
+    pd.testing.assert_frame_equal(pd.concat(pages, ignore_index=True), expected.reset_index(drop=True))
+    assert all(len(page) == 7 for page in pages[:-1])
+
+def test_keyset_page_query_is_served_by_index(db):
+    where, params = db._invoice_filter('2024-01-01', None, ['SUP002'])
+    query = f"SELECT * FROM invoices{where} AND (invoice_date, invoice_id) < (?, ?) ORDER BY invoice_date DESC, invoice_id DESC LIMIT 21"
+    plan = query_plan(db, query, params + ['2024-06-01', 'INV00100'])
+    assert_uses_index(plan, 'invoices')
+    assert any('idx_invoices_supplier_date_id' in step for step in plan), plan
+    assert not any('TEMP B-TREE' in step for step in plan), plan
+
+def test_migration_extends_the_supplier_date_index(generated_data, tmp_path):
+    db_path = str(tmp_path / 'v3.db')
+    save_to_sqlite(*generated_data, db_path=db_path)
+    conn = sqlite3.connect(db_path)
+    conn.execute("DROP INDEX idx_invoices_supplier_date_id")
+    conn.execute("CREATE INDEX idx_invoices_supplier_date ON invoices (supplier_id, invoice_date)")
+    conn.execute("DROP TABLE data_generation")
+    conn.execute("DROP TABLE supplier_anomaly_state")
+    conn.execute("PRAGMA user_version = 3")
+    conn.close()
+    
+    assert SupplierDatabase(db_path).migrate() == 6
+    conn = sqlite3.connect(db_path)
+    indexes = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    conn.close()
+    assert 'idx_invoices_supplier_date_id' in indexes
+    assert 'idx_invoices_supplier_date' not in indexes
@@ -0,0 +1,160 @@
+"""
+Tests for incremental invoice ingestion
+Run with: pytest tests/test_ingest.py -v
+"""
+import pytest
+import pandas as pd
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from anomaly import anomaly_watermark
+from data_generator import generate_suppliers, generate_invoices, generate_outstanding, save_to_sqlite
+from database import SupplierDatabase
+from ingest import ingest_invoices, validate_chunk, main
+from schema import connect, DAILY_STATS_INSERT
+
+@pytest.fixture
+def loaded(tmp_path):
+    suppliers = generate_suppliers(8)
+    invoices = generate_invoices(suppliers, 600)
+    db_path = str(tmp_path / 'suppliers.db')
+    save_to_sqlite(suppliers, invoices.iloc[:400], generate_outstanding(suppliers, 10), db_path=db_path)
+    return db_path, invoices
+
+def rollup_from_scratch(db_path):
+    conn = connect(db_path)
+    conn.execute("CREATE TEMP TABLE daily_supplier_stats AS SELECT * FROM main.daily_supplier_stats WHERE 0")
+    conn.execute(DAILY_STATS_INSERT.replace('INSERT INTO', 'INSERT INTO temp.') + " GROUP BY supplier_id, invoice_date")
+    df = pd.read_sql_query("SELECT * FROM temp.daily_supplier_stats ORDER BY supplier_id, invoice_date", conn)
+    conn.close()
+    return df
+
+def test_upsert_inserts_updates_and_refreshes_rollup(loaded, tmp_path):
+    db_path, invoices = loaded
+    drop = invoices.iloc[300:].copy()
+    moved = drop.index[:20]
+    drop.loc[moved, 'invoice_date'] = '2020-06-15'
+    drop.loc[moved, 'is_rejected'] = 1
+    path = str(tmp_path / 'drop.csv')
+    drop.to_csv(path, index=False)
+    
+    report = ingest_invoices(path, db_path, chunk_size=64)
+    assert report['rows_read'] == 300
+    assert report['inserted'] == 200
+    assert report['updated'] + report['unchanged'] == 100
+    assert report['updated'] >= 20
+    assert report['rejected'] == 0
+    assert report['chunks'] == 5
+    assert report['rows_per_second'] > 0
+    
+    expected = pd.concat([invoices.iloc[:300], drop]).sort_values('invoice_id').reset_index(drop=True)
+    stored = SupplierDatabase(db_path, pool_size=0).get_invoices().sort_values('invoice_id').reset_index(drop=True)
+    pd.testing.assert_frame_equal(stored, expected, check_dtype=False)
+    
+    rollup = SupplierDatabase(db_path, pool_size=0).get_daily_stats().sort_values(['supplier_id', 'invoice_date']).reset_index(drop=True)
+    pd.testing.assert_frame_equal(rollup, rollup_from_scratch(db_path))
+
+def test_reingesting_a_file_changes_nothing(loaded, tmp_path):
+    db_path, invoices = loaded
+    path = str(tmp_path / 'drop.csv')
+    invoices.iloc[:400].to_csv(path, index=False)
+    report = ingest_invoices(path, db_path)
+    assert (report['inserted'], report['updated'], report['unchanged'], report['supplier_days_refreshed']) == (0, 0, 400, 0)
+
+def test_invalid_rows_are_rejected_with_a_reason(loaded, tmp_path):
+    db_path, invoices = loaded
+    drop = invoices.iloc[400:410].astype({'invoice_amount': object, 'payment_days': object})
+    drop.loc[drop.index[0], 'supplier_id'] = 'SUP999'
+    drop.loc[drop.index[1], 'invoice_date'] = '2025-02-30'
+    drop.loc[drop.index[2], 'is_accurate'] = 2
+    drop.loc[drop.index[3], 'invoice_amount'] = 'n/a'
+    drop.loc[drop.index[4], 'payment_days'] = 1.5
+    path = str(tmp_path / 'drop.csv')
+    rejects = str(tmp_path / 'rejects.csv')
+    drop.to_csv(path, index=False)
+    
+    report = ingest_invoices(path, db_path, rejects_path=rejects)
+    assert (report['inserted'], report['rejected']) == (5, 5)
+    assert pd.read_csv(rejects)['reject_reason'].tolist() == [
+        'unknown supplier_id', 'invalid invoice_date', 'invalid is_accurate', 'invalid invoice_amount', 'invalid payment_days'
+    ]
+
+def test_future_invoice_dates_are_rejected(loaded, tmp_path):
+    db_path, invoices = loaded
+    conn = connect(db_path)
+    as_of = anomaly_watermark(conn)
+    conn.close()
+    drop = invoices.iloc[400:402].copy()
+    drop.loc[drop.index[0], 'invoice_date'] = '2099-01-01'
+    path = str(tmp_path / 'drop.csv')
+    rejects = str(tmp_path / 'rejects.csv')
+    drop.to_csv(path, index=False)
+    
+    report = ingest_invoices(path, db_path, rejects_path=rejects)
+    assert (report['inserted'], report['rejected']) == (1, 1)
+    assert pd.read_csv(rejects)['reject_reason'].tolist() == ['future invoice_date']
+    conn = connect(db_path)
+    assert anomaly_watermark(conn) == max(as_of, drop['invoice_date'].iloc[1])
+    conn.close()
+
+def test_validate_chunk_requires_the_core_columns():
+    with pytest.raises(ValueError, match='invoice_amount'):
+        validate_chunk(pd.DataFrame({'invoice_id': ['INV1'], 'supplier_id': ['SUP001'], 'invoice_date': ['2025-01-01']}))
+
+def test_duplicate_ids_keep_the_last_row():
+    chunk = pd.DataFrame({
+        'invoice_id': ['INV1', 'INV1'], 'supplier_id': ['SUP001', 'SUP001'], 'invoice_date': ['2025-01-01', '2025-01-02'],
+        'invoice_amount': [10.0, 20.0], 'is_accurate': [1, 0], 'is_rejected': [0, 0]
+    })
+    valid, rejected = validate_chunk(chunk)
+    assert valid['invoice_date'].tolist() == ['2025-01-02']
+    assert valid['payment_days'].tolist() == [None]
+    assert len(rejected) == 0
+
+def test_missing_ids_are_rejected_whatever_the_dtype():
+    chunk = pd.DataFrame({
+        'invoice_id': pd.Series(['INV1', None, float('nan'), ' '], dtype=object), 'supplier_id': ['SUP001', 'SUP001', 'SUP001', 'SUP001'],
+        'invoice_date': ['2025-01-01'] * 4, 'invoice_amount': [10.0] * 4, 'is_accurate': [1] * 4, 'is_rejected': [0] * 4
+    })
+    valid, rejected = validate_chunk(chunk)
+    assert valid['invoice_id'].tolist() == ['INV1']
+    assert rejected['reject_reason'].tolist() == ['missing invoice_id'] * 3
+
+def test_parquet_input(loaded, tmp_path):
+    pytest.importorskip('pyarrow')
+    db_path, invoices = loaded
+    path = str(tmp_path / 'drop.parquet')
+    drop = invoices.iloc[400:].copy()
+    drop['invoice_date'] = pd.to_datetime(drop['invoice_date'])
+    drop.to_parquet(path, index=False)
+    assert ingest_invoices(path, db_path, chunk_size=50)['inserted'] == 200
+    assert len(SupplierDatabase(db_path, pool_size=0).get_invoices()) == 600
+
+def test_readers_are_served_during_ingestion(loaded, tmp_path):
+    db_path, invoices = loaded
+    path = str(tmp_path / 'drop.csv')
+    invoices.iloc[400:].to_csv(path, index=False)
+    db = SupplierDatabase(db_path, pool_size=1)
+    seen = []
+    
+    # A read between every committed chunk, plus one holding a snapshot across the whole load
+    with db.read_connection() as conn:
+        conn.execute("BEGIN")
+        before = conn.execute("SELECT COUNT(*) FROM invoices").fetchone()[0]
+        ingest_invoices(path, db_path, chunk_size=50, progress=lambda report: seen.append(
+            SupplierDatabase(db_path, pool_size=0).get_invoice_stats()['invoice_count']
+        ))
+        assert conn.execute("SELECT COUNT(*) FROM invoices").fetchone()[0] == before == 400
+        conn.rollback()
+    assert seen == [450, 500, 550, 600]
+    assert db.get_invoice_stats()['invoice_count'] == 600
+    db.close()
+
+def test_cli(loaded, tmp_path, capsys):
+    db_path, invoices = loaded
+    path = str(tmp_path / 'drop.csv')
+    invoices.iloc[400:].to_csv(path, index=False)
+    main([path, '--db', db_path, '--quiet'])
+    assert '200 inserted' in capsys.readouterr().out
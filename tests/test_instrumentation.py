@@ -0,0 +1,68 @@
+"""
+Tests for opt-in spans and profiling
+Run with: pytest tests/test_instrumentation.py -v
+"""
+import json
+import logging
+import pytest
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import instrumentation
+from instrumentation import Trace, span, traced
+from data_generator import generate_suppliers, generate_invoices, generate_outstanding, save_to_sqlite
+from database import SupplierDatabase
+from kpi_calculator import calculate_overall_kpis
+
+@pytest.fixture
+def db(tmp_path):
+    suppliers = generate_suppliers(5)
+    db_path = str(tmp_path / 'suppliers.db')
+    save_to_sqlite(suppliers, generate_invoices(suppliers, 200), generate_outstanding(suppliers, 10), db_path=db_path)
+    db = SupplierDatabase(db_path)
+    yield db
+    db.close()
+
+def test_disabled_by_default_records_nothing(db):
+    assert not instrumentation.is_enabled()
+    with span('outside') as record:
+        record.rows = 5
+    db.get_supplier_kpis()
+    assert Trace().start().stop().spans == []
+
+def test_trace_nests_queries_and_kpi_math(db):
+    with Trace() as trace:
+        db.get_supplier_kpis('2000-01-01', None, ['SUP001', 'SUP002'])
+    spans = trace.to_frame()
+    
+    assert spans['span'].iloc[0] == 'StorageBackend.get_supplier_kpis'
+    assert "'2000-01-01', None, list[2]" in spans['detail'].iloc[0]
+    assert '  SupplierDatabase.get_invoice_stats' in spans['span'].tolist()
+    assert '    sqlite' in spans['span'].tolist()
+    assert '  calculate_supplier_kpis_from_stats' in spans['span'].tolist()
+    assert spans['rows'].iloc[0] == 2
+    assert (spans['ms'] >= 0).all()
+
+def test_profile_report(db):
+    with Trace(profile=True) as trace:
+        calculate_overall_kpis(db.get_invoices(), db.get_outstanding())
+    assert 'calculate_overall_kpis' in trace.profile_report()
+    assert Trace().profile_report() == ''
+
+def test_enabled_spans_log_json_lines(caplog):
+    @traced
+    def double(values):
+        return values * 2
+    
+    instrumentation.enable()
+    try:
+        with caplog.at_level(logging.INFO, logger='supplier_dashboard.trace'):
+            double([1, 2])
+    finally:
+        instrumentation.enable(False)
+    line = json.loads(caplog.records[-1].getMessage())
+    assert line['span'].endswith('double')
+    assert line['detail'] == 'list[2]'
+    assert line['depth'] == 0
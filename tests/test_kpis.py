@@ -3,6 +3,7 @@ Unit tests for KPI calculations
 Run with: pytest tests/test_kpis.py -v
 """
 import pytest
+import numpy as np
 import pandas as pd
 import sys
 import os
@@ -15,8 +16,14 @@ from kpi_calculator import (
     calculate_rejection_rate,
     calculate_avg_payment_days,
     calculate_avg_outstanding,
-    calculate_total_outstanding
+    calculate_total_outstanding,
+    calculate_supplier_kpis,
+    histogram_bins,
+    calculate_rolling_rates,
+    calculate_percentiles,
+    calculate_aging_buckets
 )
+from data_generator import generate_suppliers, generate_invoices, generate_outstanding
 
 @pytest.fixture
 def sample_invoices():
@@ -96,4 +103,127 @@ def test_total_outstanding_calculation(sample_outstanding):
 def test_total_outstanding_empty():
     empty_df = pd.DataFrame(columns=['outstanding_amount'])
     result = calculate_total_outstanding(empty_df)
-    assert result == 0.0
\ No newline at end of file
+    assert result == 0.0
+
+def reference_supplier_kpis(invoices_df, outstanding_df, suppliers_df):
+    """Original per-supplier loop, kept here as the correctness reference"""
+    supplier_kpis = []
+    for _, supplier in suppliers_df.iterrows():
+        supplier_id = supplier['supplier_id']
+        supplier_invoices = invoices_df[invoices_df['supplier_id'] == supplier_id]
+        supplier_outstanding = outstanding_df[outstanding_df['supplier_id'] == supplier_id]
+        supplier_kpis.append({
+            'supplier_id': supplier_id,
+            'supplier_name': supplier['supplier_name'],
+            'country': supplier['country'],
+            'category': supplier['category'],
+            'on_time_delivery': calculate_on_time_delivery(supplier_invoices),
+            'invoice_accuracy': calculate_invoice_accuracy(supplier_invoices),
+            'rejection_rate': calculate_rejection_rate(supplier_invoices),
+            'avg_payment_days': calculate_avg_payment_days(supplier_invoices),
+            'avg_outstanding': calculate_avg_outstanding(supplier_outstanding),
+            'total_invoices': len(supplier_invoices),
+            'total_amount': round(supplier_invoices['invoice_amount'].sum(), 2) if len(supplier_invoices) > 0 else 0
+        })
+    return pd.DataFrame(supplier_kpis)
+
+def test_supplier_kpis_match_reference_on_generated_data():
+    suppliers = generate_suppliers(40)
+    invoices = generate_invoices(suppliers.head(30), 3000)
+    outstanding = generate_outstanding(suppliers.head(25), 200)
+    
+    result = calculate_supplier_kpis(invoices, outstanding, suppliers)
+    expected = reference_supplier_kpis(invoices, outstanding, suppliers)
+    
+    pd.testing.assert_frame_equal(result, expected, check_exact=True)
+    idle = result[result['total_invoices'] == 0]
+    assert len(idle) == 10
+    assert (idle[['on_time_delivery', 'invoice_accuracy', 'rejection_rate', 'avg_payment_days', 'total_amount']] == 0.0).all().all()
+
+def test_supplier_kpis_empty_invoices(sample_outstanding):
+    suppliers = pd.DataFrame({
+        'supplier_id': ['SUP001', 'SUP002'],
+        'supplier_name': ['A', 'B'],
+        'country': ['USA', 'India'],
+        'category': ['Packaging', 'Logistics']
+    })
+    empty = pd.DataFrame(columns=['supplier_id', 'delivery_delay_days', 'is_accurate', 'is_rejected', 'payment_days', 'invoice_amount'])
+    result = calculate_supplier_kpis(empty, sample_outstanding, suppliers)
+    assert result['total_invoices'].tolist() == [0, 0]
+    assert result['avg_outstanding'].tolist() == [5000.0, 10000.0]
+
+def test_histogram_bins_match_raw_histogram():
+    raw = np.random.default_rng(3).integers(-5, 90, 5000)
+    values, counts = np.unique(raw, return_counts=True)
+    bins = histogram_bins(np.append(values, np.nan), np.append(counts, 7), nbins=30)
+    expected, _ = np.histogram(raw, bins=np.append(bins['bin_start'].to_numpy(), bins['bin_end'].iloc[-1]))
+    assert len(bins) <= 30
+    assert (bins['bin_end'] - bins['bin_start'] == 4).all()
+    assert bins['count'].tolist() == expected.tolist()
+    assert bins['count'].sum() == 5000
+
+def test_histogram_bins_empty():
+    assert len(histogram_bins([], [])) == 0
+
+def reference_rolling_rates(invoices, window, as_of):
+    recent = invoices[(invoices['invoice_date'] > as_of - pd.Timedelta(days=window)) & (invoices['invoice_date'] <= as_of)]
+    grouped = recent.groupby('supplier_id')
+    return grouped.size(), grouped['on_time'].sum(), grouped['is_accurate'].sum()
+
+def test_rolling_rates_match_window_filters():
+    suppliers = generate_suppliers(6)
+    invoices = generate_invoices(suppliers, 2000)
+    invoices['invoice_date'] = pd.to_datetime(invoices['invoice_date'])
+    invoices['on_time'] = (invoices['delivery_delay_days'] <= 0).astype(int)
+    daily = invoices.groupby(['supplier_id', 'invoice_date']).agg(
+        invoice_count=('invoice_id', 'size'), on_time_count=('on_time', 'sum'), accurate_count=('is_accurate', 'sum')
+    ).reset_index()
+    
+    series = calculate_rolling_rates(daily)
+    assert len(series) == len(daily)
+    for _, row in series.sample(25, random_state=1).iterrows():
+        counts, on_time, accurate = reference_rolling_rates(invoices, 90, row['invoice_date'])
+        assert row['invoices_90d'] == counts[row['supplier_id']]
+        assert row['on_time_90d'] == round(on_time[row['supplier_id']] / counts[row['supplier_id']] * 100, 2)
+        assert row['accuracy_90d'] == round(accurate[row['supplier_id']] / counts[row['supplier_id']] * 100, 2)
+    
+    as_of = invoices['invoice_date'].max() - pd.Timedelta(days=10)
+    snapshot = calculate_rolling_rates(daily, as_of=as_of.strftime('%Y-%m-%d')).set_index('supplier_id')
+    for window in (30, 90, 365):
+        counts, _, _ = reference_rolling_rates(invoices, window, as_of)
+        assert snapshot[f"invoices_{window}d"].to_dict() == counts.reindex(snapshot.index, fill_value=0).to_dict()
+
+def test_rolling_rates_outside_history_are_zero():
+    daily = pd.DataFrame({
+        'supplier_id': ['SUP001', 'SUP002'], 'invoice_date': ['2025-01-01', '2025-01-01'],
+        'invoice_count': [4, 2], 'on_time_count': [3, 2], 'accurate_count': [4, 1]
+    })
+    for as_of in ['2024-12-31', '2027-01-01']:
+        assert (calculate_rolling_rates(daily, as_of=as_of)[['invoices_30d', 'on_time_30d', 'invoices_365d']] == 0).all().all()
+    assert calculate_rolling_rates(daily, as_of='2025-01-30')['on_time_30d'].tolist() == [75.0, 100.0]
+    assert calculate_rolling_rates(daily.iloc[:0]).empty
+
+def test_percentiles_from_counts_match_numpy():
+    values = np.random.default_rng(7).integers(-10, 60, 5000).astype(float)
+    groups = np.where(values > 20, 'SUP001', 'SUP002')
+    distinct, counts = np.unique(values, return_counts=True)
+    assert calculate_percentiles(distinct, counts).tolist() == pytest.approx(np.percentile(values, [50, 90, 99]).tolist())
+    
+    frame = pd.DataFrame({'value': values, 'group': groups}).groupby(['group', 'value']).size().reset_index(name='count')
+    table = calculate_percentiles(frame['value'], frame['count'], frame['group'])
+    for group in ['SUP001', 'SUP002']:
+        assert table.loc[group].tolist() == pytest.approx(np.percentile(values[groups == group], [50, 90, 99]).tolist())
+    assert calculate_percentiles([5.0, np.nan], [1, 3]).tolist() == [5.0, 5.0, 5.0]
+    assert calculate_percentiles([], []).isna().all()
+
+def test_aging_buckets():
+    outstanding = pd.DataFrame({
+        'supplier_id': ['SUP001', 'SUP001', 'SUP002', 'SUP002', 'SUP002'],
+        'outstanding_amount': [100.0, 50.0, 25.0, 10.0, 5.0],
+        'aging_days': [0, 30, 31, 91, None]
+    })
+    buckets = calculate_aging_buckets(outstanding)
+    assert buckets['outstanding_count'].tolist() == [2, 1, 0, 1]
+    assert buckets['outstanding_amount'].tolist() == [150.0, 25.0, 0.0, 10.0]
+    by_supplier = calculate_aging_buckets(outstanding, by_supplier=True)
+    assert by_supplier.loc['SUP002'].tolist() == [0.0, 25.0, 0.0, 10.0]
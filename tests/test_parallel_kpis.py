@@ -0,0 +1,66 @@
+"""
+Tests for process-parallel per-supplier KPIs
+Run with: pytest tests/test_parallel_kpis.py -v
+"""
+import pytest
+import pandas as pd
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from data_generator import generate_suppliers, generate_invoices, generate_outstanding, save_to_sqlite
+from database import SupplierDatabase
+from kpi_calculator import aggregate_invoice_stats, calculate_supplier_kpis
+from parallel_kpis import calculate_supplier_kpis_parallel, shard_stats, shard_suppliers, main
+
+@pytest.fixture(scope='module')
+def db(tmp_path_factory):
+    suppliers = generate_suppliers(12)
+    db_path = str(tmp_path_factory.mktemp('parallel') / 'suppliers.db')
+    save_to_sqlite(suppliers, generate_invoices(suppliers, 3000), generate_outstanding(suppliers, 60), db_path=db_path)
+    db = SupplierDatabase(db_path)
+    yield db
+    db.close()
+
+def serial(db, start_date=None, end_date=None, supplier_ids=None):
+    suppliers = db.get_suppliers()
+    if supplier_ids:
+        suppliers = suppliers[suppliers['supplier_id'].isin(supplier_ids)]
+    return calculate_supplier_kpis(db.get_invoices(start_date, end_date, supplier_ids), db.get_outstanding(supplier_ids), suppliers)
+
+def test_shards_are_disjoint_and_balanced():
+    counts = pd.Series([900, 500, 400, 300, 200, 100, 0], index=[f"SUP{i:03d}" for i in range(7)])
+    shards = shard_suppliers(counts, 3)
+    assert sorted(sum(shards, [])) == counts.index.tolist()
+    totals = [int(counts[shard].sum()) for shard in shards]
+    assert totals == [900, 800, 700]
+    assert shard_suppliers(counts.iloc[:2], 8) == [['SUP000'], ['SUP001']]
+
+@pytest.mark.parametrize('workers, shards', [(1, 5), (2, 2), (3, 7)])
+def test_parallel_matches_serial_exactly(db, workers, shards):
+    pd.testing.assert_frame_equal(calculate_supplier_kpis_parallel(db, workers=workers, shards=shards), serial(db), check_exact=True)
+
+def test_shard_sums_match_the_full_read_bit_for_bit(db):
+    ids = ['SUP002', 'SUP004', 'SUP009']
+    invoices, _ = shard_stats(db.kind, db.location, ids)
+    full = aggregate_invoice_stats(db.get_invoices())
+    pd.testing.assert_frame_equal(invoices, full.loc[ids], check_exact=True)
+
+def test_filters_are_applied_in_every_worker(db):
+    start = (pd.Timestamp(db.get_date_range()[0]) + pd.Timedelta(days=100)).strftime('%Y-%m-%d')
+    ids = ['SUP002', 'SUP004', 'SUP009']
+    result = calculate_supplier_kpis_parallel(db, start, None, ids, workers=2, shards=3)
+    pd.testing.assert_frame_equal(result, serial(db, start, None, ids), check_exact=True)
+    assert result['supplier_id'].tolist() == ids
+
+def test_suppliers_without_invoices_get_zero_kpis(db):
+    result = calculate_supplier_kpis_parallel(db, '1990-01-01', '1990-12-31', workers=2)
+    assert (result['total_invoices'] == 0).all()
+    assert len(result) == 12
+
+def test_cli(db, tmp_path, capsys):
+    output = str(tmp_path / 'kpis.csv')
+    main(['--data', db.db_path, '--workers', '2', '--output', output])
+    assert len(pd.read_csv(output)) == 12
+    assert '12 suppliers' in capsys.readouterr().out
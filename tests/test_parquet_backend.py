@@ -0,0 +1,131 @@
+"""
+Tests for the Parquet storage backend against the SQLite one
+Run with: pytest tests/test_parquet_backend.py -v
+"""
+import pytest
+import pandas as pd
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+pytest.importorskip('pyarrow')
+
+from data_generator import generate_suppliers, generate_invoices, generate_outstanding, save_to_sqlite
+from database import SupplierDatabase
+from parquet_backend import ParquetDatabase, build_parquet_store
+from query_cache import CachedSupplierDatabase
+from storage import StorageBackend, open_backend
+
+# Day offsets into the generated date range, which ends today
+FILTERS = [
+    (None, None, None),
+    (60, 200, None),
+    (None, 150, ['SUP002', 'SUP005']),
+    (20, None, ['SUP001'])
+]
+
+@pytest.fixture(scope='module')
+def backends(tmp_path_factory):
+    suppliers = generate_suppliers(10)
+    root = tmp_path_factory.mktemp('backends')
+    db_path = str(root / 'suppliers.db')
+    save_to_sqlite(suppliers, generate_invoices(suppliers, 1200), generate_outstanding(suppliers, 40), db_path=db_path)
+    assert build_parquet_store(db_path, str(root / 'store'), chunk_size=100, row_group_size=50) == 1200
+    sqlite_db = SupplierDatabase(db_path)
+    yield sqlite_db, ParquetDatabase(str(root / 'store'))
+    sqlite_db.close()
+
+def window(db, start, end):
+    first = pd.Timestamp(db.get_date_range()[0])
+    return [None if offset is None else (first + pd.Timedelta(days=offset)).strftime('%Y-%m-%d') for offset in (start, end)]
+
+def by_id(df):
+    return df.sort_values('invoice_id').reset_index(drop=True)
+
+@pytest.mark.parametrize('start, end, ids', FILTERS)
+def test_parquet_matches_sqlite(backends, start, end, ids):
+    sqlite_db, parquet_db = backends
+    start, end = window(sqlite_db, start, end)
+    pd.testing.assert_frame_equal(by_id(parquet_db.get_invoices(start, end, ids)), by_id(sqlite_db.get_invoices(start, end, ids)), check_dtype=False)
+    assert parquet_db.get_overall_kpis(start, end, ids) == pytest.approx(sqlite_db.get_overall_kpis(start, end, ids))
+    pd.testing.assert_frame_equal(parquet_db.get_supplier_kpis(start, end, ids), sqlite_db.get_supplier_kpis(start, end, ids))
+    pd.testing.assert_frame_equal(parquet_db.get_monthly_trends(start, end, ids), sqlite_db.get_monthly_trends(start, end, ids))
+    pd.testing.assert_frame_equal(parquet_db.get_payment_days_counts(start, end, ids), sqlite_db.get_payment_days_counts(start, end, ids), check_dtype=False)
+    pd.testing.assert_frame_equal(parquet_db.get_invoice_stats(start, end, ids, group_by='month'), sqlite_db.get_invoice_stats(start, end, ids, group_by='month'))
+    pd.testing.assert_frame_equal(parquet_db.get_outstanding_stats(ids, group_by='supplier_id'), sqlite_db.get_outstanding_stats(ids, group_by='supplier_id'))
+    daily = ['supplier_id', 'invoice_date']
+    pd.testing.assert_frame_equal(parquet_db.get_daily_stats(start, end, ids), sqlite_db.get_daily_stats(start, end, ids).sort_values(daily, ignore_index=True), check_dtype=False)
+    for column in ['payment_days', 'delivery_delay_days']:
+        pd.testing.assert_frame_equal(parquet_db.get_day_counts(column, start, end, ids, by_supplier=True), sqlite_db.get_day_counts(column, start, end, ids, by_supplier=True), check_dtype=False)
+
+def test_empty_supplier_selection_matches_no_rows(backends):
+    for db in backends:
+        assert len(db.get_invoices(supplier_ids=[])) == 0
+        assert len(db.get_outstanding([])) == 0
+        assert len(db.get_supplier_kpis(supplier_ids=[])) == 0
+        assert len(db.get_monthly_trends(supplier_ids=[])) == 0
+        assert db.get_overall_kpis(supplier_ids=[])['total_outstanding'] == 0
+
+def test_metadata_pages_and_chunks_match_sqlite(backends):
+    sqlite_db, parquet_db = backends
+    assert parquet_db.get_date_range() == sqlite_db.get_date_range()
+    pd.testing.assert_frame_equal(parquet_db.get_suppliers(), sqlite_db.get_suppliers())
+    key = None
+    for _ in range(3):
+        parquet_page, parquet_key = parquet_db.get_supplier_invoice_page('SUP003', after=key, page_size=9, descending=False)
+        sqlite_page, key = sqlite_db.get_supplier_invoice_page('SUP003', after=key, page_size=9, descending=False)
+        pd.testing.assert_frame_equal(parquet_page, sqlite_page, check_dtype=False)
+        assert parquet_key == key
+    chunks = list(parquet_db.iter_invoices(window(parquet_db, 30, None)[0], None, ['SUP004'], chunk_size=40, typed=True))
+    assert all(len(chunk) <= 40 for chunk in chunks)
+    assert sum(len(chunk) for chunk in chunks) == len(sqlite_db.get_invoices(window(parquet_db, 30, None)[0], None, ['SUP004']))
+
+def test_filters_prune_partitions_and_row_groups(backends):
+    _, parquet_db = backends
+    dataset = parquet_db._dataset()
+    months = list(dataset.get_fragments(filter=parquet_db._invoice_filter(*window(parquet_db, 60, 80))))
+    assert 0 < len(months) <= 2
+    assert len(months) < len(list(dataset.get_fragments()))
+    
+    row_groups = lambda expression: sum(len(fragment.split_by_row_group(expression)) for fragment in dataset.get_fragments(filter=expression))
+    assert row_groups(parquet_db._invoice_filter(supplier_ids=['SUP001'])) < row_groups(parquet_db._invoice_filter())
+
+def test_rebuilding_the_store_invalidates_the_cache(backends, tmp_path):
+    sqlite_db, _ = backends
+    store = str(tmp_path / 'store')
+    build_parquet_store(sqlite_db.db_path, store)
+    cached = CachedSupplierDatabase(ParquetDatabase(store))
+    first = cached.get_overall_kpis()
+    build_parquet_store(sqlite_db.db_path, store)
+    assert cached.get_overall_kpis() == first
+    assert cached.cache.misses == 2
+
+def test_rebuilds_swap_versions_atomically(backends, tmp_path):
+    sqlite_db, _ = backends
+    store = str(tmp_path / 'store')
+    build_parquet_store(sqlite_db.db_path, store)
+    db = ParquetDatabase(store)
+    first = db.data_version()
+    expected = db.get_overall_kpis()
+    
+    build_parquet_store(sqlite_db.db_path, store)
+    second = db.data_version()
+    assert second != first
+    # The previous version stays readable for queries that resolved it before the swap
+    assert sorted(os.listdir(os.path.join(store, 'versions'))) == sorted([first, second])
+    assert db.get_overall_kpis() == expected
+    
+    build_parquet_store(sqlite_db.db_path, store)
+    assert first not in os.listdir(os.path.join(store, 'versions'))
+    assert sorted(os.listdir(store)) == ['CURRENT', 'versions']
+
+def test_open_backend_from_environment(backends, monkeypatch):
+    _, parquet_db = backends
+    monkeypatch.setenv('SUPPLIER_DASHBOARD_BACKEND', 'parquet')
+    monkeypatch.setenv('SUPPLIER_DASHBOARD_DATA', parquet_db.path)
+    backend = open_backend()
+    assert isinstance(backend, ParquetDatabase) and isinstance(backend, StorageBackend)
+    assert isinstance(open_backend('sqlite', 'unused.db'), SupplierDatabase)
+    with pytest.raises(ValueError):
+        open_backend('csv')
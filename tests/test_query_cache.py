@@ -0,0 +1,95 @@
+"""
+Tests for the shared query result cache
+Run with: pytest tests/test_query_cache.py -v
+"""
+import pytest
+import pandas as pd
+import sys
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from database import SupplierDatabase
+from data_generator import generate_suppliers, generate_invoices, generate_outstanding, save_to_sqlite
+from query_cache import QueryCache, CachedSupplierDatabase, frame_key, normalize_filters
+from schema import connect
+from rollup import rebuild_daily_stats
+
+@pytest.fixture
+def cached_db(tmp_path):
+    suppliers = generate_suppliers(10)
+    db_path = str(tmp_path / 'suppliers.db')
+    save_to_sqlite(suppliers, generate_invoices(suppliers, 300), generate_outstanding(suppliers, 20), db_path=db_path)
+    db = CachedSupplierDatabase(SupplierDatabase(db_path))
+    yield db
+    db.close()
+
+def test_normalize_filters_sorts_and_dedupes():
+    assert normalize_filters('2024-01-01', None, ['SUP003', 'SUP001', 'SUP003']) == ('2024-01-01', None, ('SUP001', 'SUP003'))
+    assert normalize_filters(None, None, None) == (None, None, None)
+    assert normalize_filters(None, None, []) == (None, None, ())
+
+def test_equivalent_filters_share_one_entry(cached_db):
+    first = cached_db.get_overall_kpis('2024-01-01', None, ['SUP002', 'SUP001'])
+    second = cached_db.get_overall_kpis('2024-01-01', None, ['SUP001', 'SUP002'])
+    assert first == second
+    assert cached_db.cache.misses == 1
+    assert cached_db.cache.hits == 1
+
+def test_supplier_frames_are_keyed_by_ordered_values(cached_db):
+    suppliers = cached_db.get_suppliers()
+    reordered = suppliers.iloc[::-1]
+    assert frame_key(reordered) != frame_key(suppliers)
+    assert frame_key(suppliers.iloc[:5]) != frame_key(suppliers.iloc[5:])
+    assert cached_db.get_supplier_kpis(suppliers_df=suppliers)['supplier_id'].tolist() == suppliers['supplier_id'].tolist()
+    assert cached_db.get_supplier_kpis(suppliers_df=reordered)['supplier_id'].tolist() == reordered['supplier_id'].tolist()
+
+def test_wrappers_share_a_given_cache(cached_db):
+    shared = QueryCache()
+    first, second = CachedSupplierDatabase(cached_db.db, shared), CachedSupplierDatabase(cached_db.db, shared)
+    assert first.cache is shared and second.cache is shared
+    first.get_overall_kpis()
+    second.get_overall_kpis()
+    assert shared.misses == 1 and shared.hits == 1
+
+def test_results_are_copies(cached_db):
+    kpis = cached_db.get_supplier_kpis()
+    kpis['on_time_delivery'] = -1
+    assert (cached_db.get_supplier_kpis()['on_time_delivery'] >= 0).all()
+
+def test_invalidated_when_data_changes(cached_db):
+    before = cached_db.get_invoice_stats()['invoice_count']
+    conn = connect(cached_db.db_path)
+    conn.execute("DELETE FROM invoices WHERE supplier_id = 'SUP001'")
+    rebuild_daily_stats(conn)
+    conn.commit()
+    conn.close()
+    after = cached_db.get_invoice_stats()['invoice_count']
+    assert after < before
+    assert cached_db.cache.hits == 0
+
+def test_lru_bound():
+    cache = QueryCache(max_entries=2)
+    for key in ['a', 'b', 'c']:
+        cache.get_or_compute(key, 1, lambda: key)
+    assert len(cache) == 2
+    calls = []
+    cache.get_or_compute('a', 1, lambda: calls.append('a'))
+    assert calls == ['a']
+
+def test_concurrent_misses_compute_once():
+    cache = QueryCache()
+    calls = []
+    
+    def slow():
+        calls.append(threading.get_ident())
+        time.sleep(0.05)
+        return pd.DataFrame({'x': [1]})
+    
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(lambda _: cache.get_or_compute('key', 1, slow), range(8)))
+    assert len(calls) == 1
+    assert all(result['x'].tolist() == [1] for result in results)
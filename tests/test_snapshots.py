@@ -0,0 +1,120 @@
+"""
+Tests for the preset KPI snapshots
+Run with: pytest tests/test_snapshots.py -v
+"""
+import pytest
+import pandas as pd
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from data_generator import generate_suppliers, generate_invoices, generate_outstanding, save_to_sqlite
+from database import SupplierDatabase
+from filters import period_start
+from ingest import ingest_invoices, main as ingest_main
+from snapshots import SnapshotDatabase, preset_filters, refresh_snapshots, snapshot_dir
+
+@pytest.fixture
+def loaded(tmp_path):
+    suppliers = generate_suppliers(8)
+    invoices = generate_invoices(suppliers, 600)
+    db_path = str(tmp_path / 'suppliers.db')
+    save_to_sqlite(suppliers, invoices.iloc[:500], generate_outstanding(suppliers, 20), db_path=db_path)
+    db = SupplierDatabase(db_path)
+    yield db, invoices
+    db.close()
+
+def assert_serves_presets(snapshots, live):
+    for _, start_date, end_date, supplier_ids, suppliers_df in preset_filters(live):
+        assert snapshots.get_overall_kpis(start_date, end_date, supplier_ids) == live.get_overall_kpis(start_date, end_date, supplier_ids)
+        pd.testing.assert_frame_equal(
+            snapshots.get_supplier_kpis(start_date, end_date, supplier_ids, suppliers_df),
+            live.get_supplier_kpis(start_date, end_date, supplier_ids, suppliers_df)
+        )
+        pd.testing.assert_frame_equal(
+            snapshots.get_monthly_trends(start_date, end_date, supplier_ids),
+            live.get_monthly_trends(start_date, end_date, supplier_ids)
+        )
+
+def test_period_start_is_clipped_to_the_data():
+    assert period_start('2024-01-01', '2024-12-31', 30) == '2024-12-02'
+    assert period_start('2024-12-20', '2024-12-31', 30) == '2024-12-20'
+
+def test_presets_cover_windows_and_categories(loaded):
+    db, _ = loaded
+    presets = preset_filters(db)
+    names = [name for name, *_ in presets]
+    min_date, max_date = db.get_date_range()
+    assert names[0] == 'all' and presets[0][1:4] == (min_date, max_date, None)
+    assert {f'category:{category}' for category in db.get_suppliers()['category']} <= set(names)
+    assert len({(start, end, tuple(ids or ())) for _, start, end, ids, _ in presets}) == len(presets)
+
+def test_generation_persists_and_follows_writes(loaded, tmp_path):
+    db, invoices = loaded
+    generation = db.data_generation()
+    reopened = SupplierDatabase(db.db_path)
+    assert reopened.data_generation() == generation
+    reopened.close()
+    
+    path = str(tmp_path / 'drop.csv')
+    invoices.iloc[500:].to_csv(path, index=False)
+    ingest_invoices(path, db.db_path)
+    changed = db.data_generation()
+    assert changed != generation
+    ingest_invoices(path, db.db_path)
+    assert db.data_generation() == changed
+
+def test_presets_are_served_from_the_snapshot(loaded):
+    db, _ = loaded
+    path = refresh_snapshots(db)
+    assert os.path.dirname(path) == snapshot_dir(db.db_path)
+    snapshots = SnapshotDatabase(db)
+    assert_serves_presets(snapshots, db)
+    assert snapshots.misses == 0 and snapshots.hits > 0
+    
+    # Missing dates mean the full range
+    assert snapshots.get_overall_kpis() == db.get_overall_kpis()
+    assert snapshots.misses == 0
+
+def test_other_filters_are_computed_live(loaded):
+    db, _ = loaded
+    refresh_snapshots(db)
+    snapshots = SnapshotDatabase(db)
+    min_date, max_date = db.get_date_range()
+    start_date = period_start(min_date, max_date, 45)
+    assert snapshots.get_overall_kpis(start_date, max_date, ['SUP001']) == db.get_overall_kpis(start_date, max_date, ['SUP001'])
+    pd.testing.assert_frame_equal(snapshots.get_monthly_trends(start_date, max_date), db.get_monthly_trends(start_date, max_date))
+    assert snapshots.hits == 0 and snapshots.misses == 2
+
+def test_snapshot_is_not_served_after_the_data_changes(loaded, tmp_path):
+    db, invoices = loaded
+    old_path = refresh_snapshots(db)
+    snapshots = SnapshotDatabase(db)
+    snapshots.get_overall_kpis()
+    
+    path = str(tmp_path / 'drop.csv')
+    invoices.iloc[500:].to_csv(path, index=False)
+    ingest_invoices(path, db.db_path)
+    assert snapshots.get_overall_kpis() == db.get_overall_kpis()
+    assert snapshots.misses == 1
+    
+    # The ingest CLI refreshes the snapshots after loading
+    invoices.iloc[:50].assign(invoice_amount=1.0).to_csv(path, index=False)
+    ingest_main([path, '--db', db.db_path, '--quiet'])
+    assert not os.path.exists(old_path)
+    assert_serves_presets(snapshots, db)
+    assert snapshots.misses == 1
+
+def test_parquet_store_snapshots(loaded, tmp_path):
+    pytest.importorskip('pyarrow')
+    from parquet_backend import ParquetDatabase, build_parquet_store
+    db, _ = loaded
+    store = str(tmp_path / 'parquet')
+    build_parquet_store(db.db_path, store)
+    parquet = ParquetDatabase(store)
+    path = refresh_snapshots(parquet)
+    assert os.path.dirname(path) == os.path.join(store, 'snapshots')
+    snapshots = SnapshotDatabase(parquet)
+    assert_serves_presets(snapshots, parquet)
+    assert snapshots.misses == 0